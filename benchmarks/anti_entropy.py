@@ -0,0 +1,114 @@
+""" Bytes anti-entropy sends to compare an owner with a replica, with and without Merkle trees
+
+Fills an owner's store and a replica's copy with `--num-keys` keys, then makes the
+replica miss the latest write of `--differing` of them. The data frames of the
+replica messages that compare them are encoded with `wire.pack_replica`, once for
+the Merkle tree comparison nodes run in `Node.compare_trees()` and once for a
+summary that lists the version of every copy the replica holds, which is what
+replicas sent before the trees. The time to write a key with and without a tree
+to keep up to date is reported as well.
+
+    python benchmarks/anti_entropy.py --num-keys 100000 --differing 0 1 10 100 1000
+"""
+import argparse
+import sys
+import time
+
+import wire
+from hash import hash_value
+from replication import TREE
+from store import Store
+
+
+def filled_stores(num_keys, num_differing, num_bits):
+    owner, replica = Store(), Store()
+    for store in owner, replica:
+        store.track(0, 0, num_bits)
+    for i in range(num_keys):
+        key = f'key_{i}'
+        digest = hash_value(key, num_bits)
+        for store in owner, replica:
+            store.put(key, digest, b'value', 1)
+        if i < num_differing:
+            owner.put(key, digest, b'newer', 2)
+    return owner, replica
+
+
+def tree_exchange(owner, replica):
+    """ :return: bytes sent, round trips and keys the owner finds it has to send """
+    sent = 0
+    round_trips = 0
+    push = []
+    nodes = owner.tree.root()
+    while nodes:
+        round_trips += 1
+        sent += len(wire.pack_replica(TREE, nodes=nodes))
+
+        differing = replica.tree.differing(nodes)
+        leaves = [index for index in differing if replica.tree.is_leaf(index)]
+        entries = [(key, replica.entries[key][0], None, replica.entries[key][2]) for key in replica.tree.keys(leaves)]
+        sent += len(wire.pack_replica(TREE, entries, [(index, replica.tree.hash(index)) for index in differing], True))
+
+        theirs = {key: version for key, _, _, version in entries}
+        push += [key for key in owner.tree.keys(leaves) if owner.version(key) > theirs.get(key, 0)]
+        nodes = owner.tree.expand(differing)
+    return sent, round_trips, push
+
+
+def summary_exchange(owner, replica):
+    """ :return: bytes sent, round trips and keys the owner finds it has to send """
+    entries = [(key, digest, None, version) for key, (digest, _, version) in replica.entries.items()]
+    sent = len(wire.pack_replica(TREE)) + len(wire.pack_replica(TREE, entries, acknowledged=True))
+    theirs = {key: version for key, _, _, version in entries}
+    push = [key for key, (_, _, version) in owner.entries.items() if version > theirs.get(key, 0)]
+    return sent, 1, push
+
+
+def write_seconds(num_keys, num_bits, tracked):
+    store = Store()
+    if tracked:
+        store.track(0, 0, num_bits)
+    keys = [(f'key_{i}', hash_value(f'key_{i}', num_bits)) for i in range(num_keys)]
+    start = time.perf_counter()
+    for key, digest in keys:
+        store.put(key, digest, b'value')
+    return (time.perf_counter() - start) / num_keys
+
+
+def benchmark(output, num_keys, differing_counts, num_bits):
+    print(f'{"keys":>8} {"differing":>9} {"summary KB":>10} {"tree KB":>8} {"round trips":>11} '
+          f'{"keys repaired":>13}', file=output)
+    for num_differing in differing_counts:
+        owner, replica = filled_stores(num_keys, num_differing, num_bits)
+        summary_bytes, _, summary_push = summary_exchange(owner, replica)
+        tree_bytes, round_trips, tree_push = tree_exchange(owner, replica)
+        assert sorted(tree_push) == sorted(summary_push)
+        print(f'{num_keys:>8} {num_differing:>9} {summary_bytes / 1000:>10.1f} {tree_bytes / 1000:>8.1f} '
+              f'{round_trips:>11} {len(tree_push):>13}', file=output)
+
+    print(f'\nmicroseconds per write: {write_seconds(num_keys, num_bits, False) * 1e6:.2f} without a tree, '
+          f'{write_seconds(num_keys, num_bits, True) * 1e6:.2f} with a tree', file=output)
+
+
+def config_parser():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--num-keys', '-k', type=int, default=100000,
+                        help='number of keys on the owner and the replica')
+    parser.add_argument('--differing', '-d', type=int, nargs='+', default=[0, 1, 10, 100, 1000],
+                        help='numbers of keys the replica has an older version of')
+    parser.add_argument('--num-bits', '-b', type=int, default=32,
+                        help='number of bits in the identifier space')
+
+    return parser
+
+
+def main(output, args):
+    parser = config_parser()
+    args = parser.parse_args(args)
+
+    benchmark(output, args.num_keys, args.differing, args.num_bits)
+
+
+if __name__ == '__main__':
+    main(sys.stdout, sys.argv[1:])
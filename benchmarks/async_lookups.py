@@ -0,0 +1,105 @@
+""" Lookup throughput of asyncio nodes
+
+Starts a ring of `AsyncChordNode`s on one event loop, connected over TCP on the
+loopback interface, and links their successors and fingers directly rather than
+waiting for stabilize and fix_fingers. It then times the same lookups with
+different numbers in flight at once. With one in flight each lookup waits for the
+previous round trip, as the threaded `Node` does for every stabilize and
+fix_fingers request.
+
+With `--virtual-nodes` each node also runs that many virtual nodes, so most
+hops of a lookup are to another virtual node of the same node.
+
+    python benchmarks/async_lookups.py --nodes 8 --num-keys 2000 --concurrency 1 16 128
+    python benchmarks/async_lookups.py --nodes 4 --virtual-nodes 16 --concurrency 1 16 128
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+from async_node import AsyncChordNode
+from hash import hash_value
+from util import finger_start
+
+
+def link_ring(nodes):
+    # Every node runs on this process, so the ideal ring can be computed locally
+    v_nodes = sorted((v_node for node in nodes for v_node in node.virtual_nodes.values()),
+                     key=lambda v_node: v_node.get_digest())
+    digests = [v_node.get_digest() for v_node in v_nodes]
+
+    def successor(digest):
+        return v_nodes[next((i for i, point in enumerate(digests) if point >= digest), 0)].routing_info
+
+    for i, v_node in enumerate(v_nodes):
+        v_node.successor_list = [v_nodes[(i + j) % len(v_nodes)].routing_info for j in range(1, 4)]
+        v_node.predecessor = v_nodes[i - 1].routing_info
+        v_node.fingers = [successor(finger_start(v_node.get_digest(), k, v_node.num_bits))
+                          for k in range(v_node.num_bits)]
+
+
+async def run_lookups(node, digests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def lookup(digest):
+        async with semaphore:
+            return await node.lookup(digest)
+
+    start = time.perf_counter()
+    found = await asyncio.gather(*(lookup(digest) for digest in digests))
+    elapsed = time.perf_counter() - start
+    return sum(1 for result in found if result is None), elapsed
+
+
+async def benchmark(output, num_nodes, num_keys, concurrency_levels, num_bits, num_virtual=0):
+    nodes = [AsyncChordNode(f'node_{i}', hash_value(f'node_{i}', num_bits), 'tcp://127.0.0.1',
+                            virtual={f'node_{i}_{j}': hash_value(f'node_{i}_{j}', num_bits) for j in range(num_virtual)},
+                            num_bits=num_bits)
+             for i in range(num_nodes)]
+    link_ring(nodes)
+    runs = [asyncio.ensure_future(node.run(None, None)) for node in nodes]
+
+    rng = random.Random(0)
+    digests = [rng.getrandbits(num_bits) for _ in range(num_keys)]
+
+    # Open every connection before timing
+    await run_lookups(nodes[0], digests[:num_nodes * 8], num_nodes * 8)
+
+    print(f'{"in flight":>9} {"lookups/s":>10} {"timeouts":>9}', file=output)
+    for concurrency in concurrency_levels:
+        timeouts, elapsed = await run_lookups(nodes[0], digests, concurrency)
+        print(f'{concurrency:>9} {num_keys / elapsed:>10.0f} {timeouts:>9}', file=output)
+
+    for node in nodes:
+        node.stop()
+    await asyncio.gather(*runs)
+
+
+def config_parser():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--nodes', '-n', type=int, default=8,
+                        help='number of nodes in the ring')
+    parser.add_argument('--num-keys', '-k', type=int, default=2000,
+                        help='number of keys to look up at each concurrency level')
+    parser.add_argument('--concurrency', '-c', type=int, nargs='+', default=[1, 16, 128],
+                        help='numbers of lookups in flight at once')
+    parser.add_argument('--num-bits', '-b', type=int, default=32,
+                        help='number of bits in the identifier space')
+    parser.add_argument('--virtual-nodes', '-v', type=int, default=0,
+                        help='number of virtual nodes on each node')
+
+    return parser
+
+
+def main(output, args):
+    parser = config_parser()
+    args = parser.parse_args(args)
+
+    asyncio.run(benchmark(output, args.nodes, args.num_keys, args.concurrency, args.num_bits, args.virtual_nodes))
+
+
+if __name__ == '__main__':
+    main(sys.stdout, sys.argv[1:])
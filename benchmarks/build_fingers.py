@@ -0,0 +1,61 @@
+""" Finger table construction time
+
+Builds chord rings of increasing size and times filling every finger table
+two ways:
+
+  - routed: `DirectNode.init_fingers`, which routes a lookup for each finger
+  - bulk: `directchord.bulk_init_fingers`, which bisects the sorted node digests
+
+Both must produce the same finger tables.
+
+    python benchmarks/build_fingers.py --num-bits 32 --nodes 1000 10000
+"""
+import argparse
+import sys
+import time
+
+from directchord import build_nodes, bulk_init_fingers, DirectChordNode
+
+
+def config_parser():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--nodes', '-n', type=int, nargs='+', default=[1000, 10000],
+                        help='ring sizes to evaluate')
+    parser.add_argument('--num-bits', '-b', type=int, default=32,
+                        help='number of bits in the identifier space')
+
+    return parser
+
+
+def main(output, args):
+    parser = config_parser()
+    args = parser.parse_args(args)
+
+    print(f'{"nodes":>8} {"routed (s)":>11} {"bulk (s)":>9} {"speedup":>8}', file=output)
+    for num_nodes in args.nodes:
+        nodes = build_nodes(num_nodes, DirectChordNode, num_bits=args.num_bits)
+
+        start = time.perf_counter()
+        bulk_init_fingers(nodes)
+        bulk_time = time.perf_counter() - start
+        bulk = [node.fingers for node in nodes.values()]
+
+        # Start from empty tables, as build_nodes did before the bulk build
+        for node in nodes.values():
+            node.fingers = [None] * args.num_bits
+
+        start = time.perf_counter()
+        for node in nodes.values():
+            node.init_fingers()
+        routed_time = time.perf_counter() - start
+
+        if [node.fingers for node in nodes.values()] != bulk:
+            print('Routed and bulk finger tables disagree', file=sys.stderr)
+            exit(1)
+
+        print(f'{num_nodes:>8} {routed_time:>11.2f} {bulk_time:>9.3f} {routed_time / bulk_time:>8.0f}', file=output)
+
+
+if __name__ == '__main__':
+    main(sys.stdout, sys.argv[1:])
@@ -0,0 +1,101 @@
+""" Compares the mod-N, consistent, jump and rendezvous load balancers
+
+For each strategy reports:
+
+  - keys/s: throughput of get_servers, including hashing the keys
+  - state KiB: memory allocated while building the servers
+  - stddev/mean: spread of the number of keys per server
+  - added/removed: fraction of keys that change servers when `--additional`
+    servers are added to, or removed from, the original servers. The ideal is
+    additional / servers
+
+    python benchmarks/compare_balancers.py --servers 100 --num-keys 100000 --additional 10
+"""
+import argparse
+import statistics
+import sys
+import time
+import tracemalloc
+
+import consistent_load_balancer
+import jump_load_balancer
+import modn_load_balancer
+import rendezvous_load_balancer
+from util import generate_keys
+
+
+STRATEGIES = {
+    'mod-n': lambda args: modn_load_balancer.ModNBalancer(num_bits=64),
+    'consistent': lambda args: consistent_load_balancer.ConsistentBalancer(
+        num_bits=64, vnodes_per_server=args.vnodes_per_server),
+    'jump': lambda args: jump_load_balancer.JumpBalancer(),
+    'rendezvous': lambda args: rendezvous_load_balancer.RendezvousBalancer(),
+}
+
+
+def moved(result_orig, result_changed):
+    return len([key for key in result_orig if result_orig[key] != result_changed[key]]) / len(result_orig)
+
+
+def load_stddev(result, num_servers):
+    counts = {}
+    for server in result.values():
+        counts[server] = counts.get(server, 0) + 1
+    loads = list(counts.values()) + [0] * (num_servers - len(counts))
+    return statistics.pstdev(loads) / statistics.mean(loads)
+
+
+def evaluate(balancer, keys, num_servers, additional):
+    tracemalloc.start()
+    balancer.build_server_list(num_servers)
+    state_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    result = balancer.get_servers(keys)
+    throughput = len(keys) / (time.perf_counter() - start)
+
+    balancer.build_server_list(additional)
+    added = moved(result, balancer.get_servers(keys))
+
+    # Drop the added servers and as many of the original servers again
+    balancer.remove_server_list(2 * additional)
+    removed = moved(result, balancer.get_servers(keys))
+
+    return throughput, state_size / 1024, load_stddev(result, num_servers), added, removed
+
+
+def config_parser():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--servers', '-s', type=int, default=100,
+                        help='number of servers')
+    parser.add_argument('--num-keys', '-k', type=int, default=100000,
+                        help='number of keys to assign')
+    parser.add_argument('--additional', '-a', type=int, default=10,
+                        help='number of servers to add and remove')
+    parser.add_argument('--vnodes-per-server', '-v', type=int, default=100,
+                        help='number of points per server on the consistent ring')
+
+    return parser
+
+
+def main(output, args):
+    parser = config_parser()
+    args = parser.parse_args(args)
+
+    keys = generate_keys(args.num_keys)
+
+    print(f'{args.servers} servers, {len(keys)} keys, {args.vnodes_per_server} points per consistent server. '
+          f'Ideal fraction moved: {args.additional / args.servers:.3f}', file=output)
+    print(f'{"strategy":>11} {"keys/s":>9} {"state KiB":>10} {"stddev/mean":>12} {"added":>7} {"removed":>8}',
+          file=output)
+    for name, create_balancer in STRATEGIES.items():
+        balancer = create_balancer(args)
+        throughput, state_size, stddev, added, removed = evaluate(balancer, keys, args.servers, args.additional)
+        print(f'{name:>11} {throughput:>9.0f} {state_size:>10.1f} {stddev:>12.3f} {added:>7.3f} '
+              f'{removed:>8.3f}', file=output)
+
+
+if __name__ == '__main__':
+    main(sys.stdout, sys.argv[1:])
@@ -0,0 +1,81 @@
+""" Successor lookup strategies for the consistent load balancer
+
+Compares three ways of finding the server hosting each key:
+
+  - linear: the original scan over the sorted server digests for every key
+  - bisect: `ConsistentBalancer.digest_responsible_server` for every key
+  - sweep: `ConsistentBalancer.sweep_servers`, which sorts the keys once and
+    merges them against the ring
+
+The linear scan is too slow to run over every key at this scale, so it runs over
+a sample of the keys and its total is extrapolated. Key digests are computed up
+front so only the lookups are timed.
+
+    python benchmarks/consistent_lookup.py --servers 10000 --num-keys 1000000
+"""
+import argparse
+import sys
+import time
+
+import consistent_load_balancer
+from hash import hash_values
+from util import generate_keys
+
+
+def linear_find_server(servers, key_digest):
+    for server_digest in servers.keys():
+        if server_digest >= key_digest:
+            return servers[server_digest]
+
+    return servers[servers.keys()[0]]
+
+
+def config_parser():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--servers', '-s', type=int, default=10000,
+                        help='number of servers on the ring')
+    parser.add_argument('--num-keys', '-k', type=int, default=1000000,
+                        help='number of keys to look up')
+    parser.add_argument('--linear-sample', '-l', type=int, default=200,
+                        help='number of keys to time the linear scan on')
+    parser.add_argument('--num-bits', '-b', type=int, default=32,
+                        help='number of bits in the identifier space')
+
+    return parser
+
+
+def main(output, args):
+    parser = config_parser()
+    args = parser.parse_args(args)
+
+    balancer = consistent_load_balancer.ConsistentBalancer(args.num_bits)
+    balancer.build_server_list(args.servers)
+    key_digests = hash_values(generate_keys(args.num_keys), args.num_bits)
+
+    sample = key_digests[:args.linear_sample]
+    start = time.perf_counter()
+    linear = [linear_find_server(balancer.servers, key_digest) for key_digest in sample]
+    linear_time = (time.perf_counter() - start) * len(key_digests) / len(sample)
+
+    start = time.perf_counter()
+    bisected = [balancer.digest_responsible_server(key_digest) for key_digest in key_digests]
+    bisect_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    swept = balancer.sweep_servers(key_digests)
+    sweep_time = time.perf_counter() - start
+
+    if linear != bisected[:len(sample)] or bisected != swept:
+        print('Lookup strategies disagree on hosting servers', file=sys.stderr)
+        exit(1)
+
+    print(f'{args.servers} servers, {len(key_digests)} keys', file=output)
+    print(f'{"strategy":>9} {"seconds":>10} {"keys/s":>12}', file=output)
+    for name, elapsed in [('linear*', linear_time), ('bisect', bisect_time), ('sweep', sweep_time)]:
+        print(f'{name:>9} {elapsed:>10.2f} {len(key_digests) / elapsed:>12.0f}', file=output)
+    print(f'* extrapolated from {len(sample)} keys', file=output)
+
+
+if __name__ == '__main__':
+    main(sys.stdout, sys.argv[1:])
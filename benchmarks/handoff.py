@@ -0,0 +1,123 @@
+""" Key handoff rate and its effect on foreground requests
+
+Starts one `AsyncChordNode` holding `--num-keys` keys, then joins a second node in
+front of it on the same event loop. Once the second node stabilizes, the first
+hands it the keys it no longer owns. A client process sends GETs to the first node
+the whole time, and the GET latencies while no keys move and while the handoff
+runs are compared, for each chunk size.
+
+    python benchmarks/handoff.py --num-keys 100000 --chunk-keys 16 256 1024
+"""
+import argparse
+import asyncio
+import math
+import multiprocessing
+import sys
+import time
+
+import transfer
+from async_node import AsyncChordNode
+from client import Client
+from hash import hash_value
+
+ADDRESS = 'tcp://127.0.0.1'
+
+
+def percentile(latencies, percent):
+    """ Nearest rank percentile of sorted latencies """
+    return latencies[max(math.ceil(percent / 100 * len(latencies)) - 1, 0)] if latencies else float('nan')
+
+
+def send_gets(endpoint, keys, stop, results):
+    latencies = []
+    with Client(endpoint) as client:
+        i = 0
+        while not stop.is_set():
+            begin = time.perf_counter()
+            client.get(keys[i % len(keys)])
+            latencies.append((begin, time.perf_counter() - begin))
+            i += 1
+    results.put(latencies)
+
+
+async def handoff(num_keys, value_size, chunk_keys, num_bits):
+    transfer.CHUNK_KEYS = chunk_keys
+
+    first = AsyncChordNode('node_0', hash_value('node_0', num_bits), ADDRESS, num_bits=num_bits)
+    first.create()
+    runs = [asyncio.ensure_future(first.run(None, None))]
+
+    # Keys are stored directly, since the handoff is measured rather than the PUTs
+    v_node = first.virtual_nodes[first.digest_id]
+    value = bytes(value_size)
+    keys = [f'key_{i}' for i in range(num_keys)]
+    for key in keys:
+        v_node.store.put(key, hash_value(key, num_bits), value)
+
+    second = AsyncChordNode('node_1', hash_value('node_1', num_bits), ADDRESS, num_bits=num_bits)
+    await second.join(first.digest_id, first.internal_endpoint)
+    runs.append(asyncio.ensure_future(second.run(None, None)))
+
+    # GETs for keys that stay on the first node
+    staying = [key for key in keys if v_node.owns(hash_value(key, num_bits)) and
+               not second.virtual_nodes[second.digest_id].owns(hash_value(key, num_bits))] or keys
+    stop = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    client = multiprocessing.Process(target=send_gets, args=(first.external_endpoint, staying, stop, results))
+    client.start()
+    await asyncio.sleep(1)
+
+    start = time.perf_counter()
+    await second._stabilize()
+    while v_node.outgoing or not first.transfer_stats.transfers_completed:
+        await asyncio.sleep(.001)
+    end = time.perf_counter()
+    await asyncio.sleep(.2)
+
+    # The nodes keep answering until the client sent its last GET
+    stop.set()
+    latencies = await asyncio.get_running_loop().run_in_executor(None, results.get)
+    client.join()
+    for node in (first, second):
+        node.stop()
+    await asyncio.gather(*runs)
+
+    idle = sorted(latency for begin, latency in latencies if begin < start)
+    during = sorted(latency for begin, latency in latencies if start <= begin < end)
+    return first.transfer_stats, idle, during
+
+
+def benchmark(output, num_keys, value_size, chunk_sizes, num_bits):
+    print(f'{"chunk keys":>10} {"keys moved":>10} {"MB moved":>8} {"seconds":>7} {"MB/s":>6} '
+          f'{"idle p50 ms":>11} {"idle p99 ms":>11} {"handoff p50 ms":>14} {"handoff p99 ms":>14}', file=output)
+    for chunk_keys in chunk_sizes:
+        stats, idle, during = asyncio.run(handoff(num_keys, value_size, chunk_keys, num_bits))
+        print(f'{chunk_keys:>10} {stats.keys_sent:>10} {stats.bytes_sent / 1e6:>8.1f} {stats.seconds_sending:>7.2f} '
+              f'{stats.rate() / 1e6:>6.1f} {percentile(idle, 50) * 1000:>11.2f} {percentile(idle, 99) * 1000:>11.2f} '
+              f'{percentile(during, 50) * 1000:>14.2f} {percentile(during, 99) * 1000:>14.2f}', file=output)
+
+
+def config_parser():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--num-keys', '-k', type=int, default=100000,
+                        help='number of keys on the first node')
+    parser.add_argument('--value-size', '-s', type=int, default=100,
+                        help='bytes in each value')
+    parser.add_argument('--chunk-keys', '-c', type=int, nargs='+', default=[16, 256, 1024],
+                        help='most keys in each chunk of the handoff')
+    parser.add_argument('--num-bits', '-b', type=int, default=32,
+                        help='number of bits in the identifier space')
+
+    return parser
+
+
+def main(output, args):
+    parser = config_parser()
+    args = parser.parse_args(args)
+
+    benchmark(output, args.num_keys, args.value_size, args.chunk_keys, args.num_bits)
+
+
+if __name__ == '__main__':
+    main(sys.stdout, sys.argv[1:])
@@ -0,0 +1,86 @@
+""" Throughput and distribution of the hash backends
+
+For each hash function in `hash.HASH_FUNCTIONS` reports how many keys per second
+`hash_values` digests and how evenly those digests fall on the ring:
+
+  - chi-square of key counts over equally sized arcs of the ring. With uniform
+    digests this is close to the number of arcs minus one
+  - max/mean key count over those arcs
+  - stddev/mean of keys per server when servers are placed on the ring with the
+    same hash, i.e. the load the consistent load balancer would see
+
+    python benchmarks/hash_backends.py --num-keys 100000 --num-bits 32
+"""
+import argparse
+import bisect
+import statistics
+import sys
+import time
+
+from hash import HASH_FUNCTIONS, hash_values, ring_size
+from util import generate_keys
+
+
+def arc_counts(digests, num_arcs, num_bits):
+    counts = [0] * num_arcs
+    size = ring_size(num_bits)
+    for digest in digests:
+        counts[digest * num_arcs // size] += 1
+    return counts
+
+
+def chi_square(counts):
+    expected = sum(counts) / len(counts)
+    return sum((count - expected) ** 2 / expected for count in counts)
+
+
+def server_counts(digests, server_digests):
+    # Keys belong to the first server with a digest greater than or equal to their own
+    server_digests = sorted(server_digests)
+    counts = [0] * len(server_digests)
+    for digest in digests:
+        counts[bisect.bisect_left(server_digests, digest) % len(server_digests)] += 1
+    return counts
+
+
+def config_parser():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--num-keys', '-k', type=int, default=100000,
+                        help='number of keys to hash with each backend')
+    parser.add_argument('--num-bits', '-b', type=int, default=32,
+                        help='number of bits in the identifier space')
+    parser.add_argument('--arcs', type=int, default=64,
+                        help='number of equally sized arcs to bucket digests into')
+    parser.add_argument('--servers', type=int, default=64,
+                        help='number of servers to place on the ring')
+    parser.add_argument('--hash', type=str, nargs='+', choices=HASH_FUNCTIONS.keys(),
+                        default=list(HASH_FUNCTIONS.keys()), help='hash functions to evaluate')
+
+    return parser
+
+
+def main(output, args):
+    parser = config_parser()
+    args = parser.parse_args(args)
+
+    keys = generate_keys(args.num_keys)
+    server_names = generate_keys(args.servers, key_prefix='server')
+
+    print(f'{"hash":>8} {"keys/s":>10} {"chi-square":>11} {"arc max/mean":>13} {"server stddev/mean":>19}',
+          file=output)
+    for hash_name in args.hash:
+        start = time.perf_counter()
+        digests = hash_values(keys, args.num_bits, hash_name)
+        elapsed = time.perf_counter() - start
+
+        counts = arc_counts(digests, args.arcs, args.num_bits)
+        loads = server_counts(digests, hash_values(server_names, args.num_bits, hash_name))
+
+        print(f'{hash_name:>8} {len(keys) / elapsed:>10.0f} {chi_square(counts):>11.1f} '
+              f'{max(counts) / statistics.mean(counts):>13.2f} '
+              f'{statistics.pstdev(loads) / statistics.mean(loads):>19.2f}', file=output)
+
+
+if __name__ == '__main__':
+    main(sys.stdout, sys.argv[1:])
@@ -0,0 +1,50 @@
+""" Lookup hops as the ring grows
+
+Builds chord rings of increasing size in a wide identifier space and reports
+the average number of hops to find a key. Chord routing should stay close to
+O(log n), so the ratio of average hops to log2(n) should stay roughly constant.
+
+    python benchmarks/hop_scaling.py --num-bits 32 --nodes 100 250 500 1000 5000
+"""
+import argparse
+import math
+import sys
+import time
+
+from directchord import build_nodes, run_experiment, DirectChordNode
+from util import generate_keys
+
+
+def config_parser():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--nodes', '-n', type=int, nargs='+', default=[100, 250, 500, 1000],
+                        help='ring sizes to evaluate')
+    parser.add_argument('--num-keys', '-k', type=int, default=1000,
+                        help='number of keys to look up for each ring size')
+    parser.add_argument('--num-bits', '-b', type=int, default=32,
+                        help='number of bits in the identifier space')
+
+    return parser
+
+
+def main(output, args):
+    parser = config_parser()
+    args = parser.parse_args(args)
+
+    keys = generate_keys(args.num_keys, key_prefix='data')
+
+    print(f'{"nodes":>8} {"log2(n)":>8} {"avg hops":>9} {"hops/log2(n)":>13} {"build (s)":>10}', file=output)
+    for num_nodes in args.nodes:
+        start = time.perf_counter()
+        nodes = build_nodes(num_nodes, DirectChordNode, num_bits=args.num_bits).values()
+        build_time = time.perf_counter() - start
+
+        avg_hops = run_experiment(nodes, keys, args.num_bits)
+        log_n = math.log2(num_nodes)
+        print(f'{num_nodes:>8} {log_n:>8.2f} {avg_hops:>9.2f} {avg_hops / log_n:>13.2f} {build_time:>10.2f}',
+              file=output)
+
+
+if __name__ == '__main__':
+    main(sys.stdout, sys.argv[1:])
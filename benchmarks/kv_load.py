@@ -0,0 +1,212 @@
+""" Throughput and latency of the key-value store
+
+Starts a ring of `AsyncChordNode`s with one process per node, on fixed ports on
+the loopback interface. Every node knows the names and ports of the others, so
+each process links its successors, predecessor and fingers to the ideal ring
+rather than waiting for stabilize and fix_fingers. Client processes then send a
+mix of GET and PUT operations through `client.Client`, each to its own node and
+with one operation in flight at a time, and the operations per second and the
+latency percentiles are reported for each number of clients.
+
+With `--replicas`, a new ring is started for each replication factor, with read
+and write quorums picked by `--quorum`.
+
+    python benchmarks/kv_load.py --nodes 4 --clients 1 8 32 --operations 2000
+    python benchmarks/kv_load.py --nodes 4 --virtual-nodes 8 --read-ratio 0.5
+    python benchmarks/kv_load.py --nodes 4 --clients 16 --replicas 1 2 3 --quorum majority
+    python benchmarks/kv_load.py --nodes 4 --clients 16 --replicas 1 2 3 --quorum one --nearest-reads
+"""
+import argparse
+import asyncio
+import math
+import multiprocessing
+import random
+import sys
+import time
+
+from async_node import AsyncChordNode
+from client import Client, UnavailableError
+from hash import hash_value
+from node import RoutingInfo, handle_shutdown, SUCCESSOR_LIST_LENGTH
+from replication import Consistency
+from util import finger_start
+
+ADDRESS = 'tcp://127.0.0.1'
+
+
+def node_ports(index, base_port):
+    """ :return: external and internal port of node `index` """
+    return base_port + 2 * index, base_port + 2 * index + 1
+
+
+def ring(num_nodes, num_virtual, num_bits, base_port):
+    """ :return: RoutingInfo of every virtual node in the ring, sorted by digest """
+    routing_infos = []
+    for i in range(num_nodes):
+        parent = hash_value(f'node_{i}', num_bits)
+        address = f'{ADDRESS}:{node_ports(i, base_port)[1]}'
+        names = [f'node_{i}'] + [f'node_{i}_{j}' for j in range(num_virtual)]
+        routing_infos += [RoutingInfo(hash_value(name, num_bits), parent, address) for name in names]
+
+    return sorted(routing_infos, key=lambda routing_info: routing_info.digest)
+
+
+def link_node(node, routing_infos):
+    digests = [routing_info.digest for routing_info in routing_infos]
+
+    def successor(digest):
+        return routing_infos[next((i for i, point in enumerate(digests) if point >= digest), 0)]
+
+    for v_node in node.virtual_nodes.values():
+        i = digests.index(v_node.get_digest())
+        v_node.successor_list = [routing_infos[(i + j) % len(routing_infos)] for j in range(1, node.num_successors + 1)]
+        v_node.predecessor = routing_infos[i - 1]
+        v_node.fingers = [successor(finger_start(v_node.get_digest(), k, v_node.num_bits))
+                          for k in range(v_node.num_bits)]
+
+
+def run_node(index, num_nodes, num_virtual, num_bits, base_port, consistency, ready):
+    external_port, internal_port = node_ports(index, base_port)
+    node = AsyncChordNode(f'node_{index}', hash_value(f'node_{index}', num_bits), ADDRESS, external_port,
+                          internal_port,
+                          {f'node_{index}_{j}': hash_value(f'node_{index}_{j}', num_bits) for j in range(num_virtual)},
+                          num_bits, max(SUCCESSOR_LIST_LENGTH, consistency.replicas - 1), consistency=consistency)
+    link_node(node, ring(num_nodes, num_virtual, num_bits, base_port))
+    ready.set()
+    asyncio.run(node.run(None, None))
+
+
+def run_client(endpoint, keys, num_operations, read_ratio, seed, start, results):
+    rng = random.Random(seed)
+    value = bytes(100)
+    latencies = []
+    timeouts = 0
+
+    with Client(endpoint) as client:
+        # Every key is stored before timing, so GETs find a value
+        for key in keys:
+            client.put(key, value)
+
+        start.wait()
+        for _ in range(num_operations):
+            key = rng.choice(keys)
+            begin = time.perf_counter()
+            try:
+                if rng.random() < read_ratio:
+                    client.get(key)
+                else:
+                    client.put(key, value)
+            except (TimeoutError, UnavailableError):
+                timeouts += 1
+                continue
+            latencies.append(time.perf_counter() - begin)
+
+    results.put((latencies, timeouts))
+
+
+def percentile(latencies, percent):
+    """ Nearest rank percentile of sorted latencies """
+    return latencies[max(math.ceil(percent / 100 * len(latencies)) - 1, 0)]
+
+
+def run_load(num_nodes, num_clients, num_operations, num_keys, read_ratio, base_port):
+    start = multiprocessing.Barrier(num_clients + 1)
+    results = multiprocessing.Queue()
+    clients = [multiprocessing.Process(target=run_client,
+                                       args=(f'{ADDRESS}:{node_ports(i % num_nodes, base_port)[0]}',
+                                             [f'key_{i}_{k}' for k in range(num_keys)],
+                                             num_operations, read_ratio, i, start, results))
+               for i in range(num_clients)]
+    for process in clients:
+        process.start()
+
+    start.wait()
+    begin = time.perf_counter()
+    outcomes = [results.get() for _ in clients]
+    elapsed = time.perf_counter() - begin
+    for process in clients:
+        process.join()
+
+    latencies = sorted(latency for client_latencies, _ in outcomes for latency in client_latencies)
+    return len(latencies) / elapsed, latencies, sum(timeouts for _, timeouts in outcomes)
+
+
+def quorum_size(quorum, replicas):
+    return {'one': 1, 'majority': replicas // 2 + 1, 'all': replicas}[quorum]
+
+
+def benchmark(output, num_nodes, client_levels, num_operations, num_keys, read_ratio, num_bits, num_virtual,
+              base_port, replica_levels=(1,), quorum='majority', nearest_reads=False):
+    print(f'{"replicas":>8} {"R":>2} {"W":>2} {"clients":>7} {"ops/s":>8} {"p50 ms":>7} {"p95 ms":>7} {"p99 ms":>7} '
+          f'{"failed":>7}', file=output)
+    for level, replicas in enumerate(replica_levels):
+        size = quorum_size(quorum, replicas)
+        consistency = Consistency(replicas, size, size, nearest_reads)
+        # Each ring gets its own ports, so sockets of the last one still closing do not get in the way
+        ring_port = base_port + 2 * num_nodes * level
+
+        nodes = []
+        for i in range(num_nodes):
+            ready = multiprocessing.Event()
+            process = multiprocessing.Process(target=run_node,
+                                              args=(i, num_nodes, num_virtual, num_bits, ring_port, consistency,
+                                                    ready))
+            process.start()
+            ready.wait()
+            nodes.append(process)
+
+        try:
+            for num_clients in client_levels:
+                ops, latencies, failed = run_load(num_nodes, num_clients, num_operations, num_keys, read_ratio,
+                                                  ring_port)
+                p50, p95, p99 = (percentile(latencies, percent) * 1000 for percent in [50, 95, 99])
+                print(f'{replicas:>8} {size:>2} {size:>2} {num_clients:>7} {ops:>8.0f} {p50:>7.2f} {p95:>7.2f} '
+                      f'{p99:>7.2f} {failed:>7}', file=output)
+        finally:
+            for i, process in enumerate(nodes):
+                handle_shutdown(f'node_{i}', ADDRESS, node_ports(i, ring_port)[1],
+                                lambda name: hash_value(name, num_bits))
+                process.join()
+
+
+def config_parser():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--nodes', '-n', type=int, default=4,
+                        help='number of nodes in the ring, each in its own process')
+    parser.add_argument('--clients', '-c', type=int, nargs='+', default=[1, 8, 32],
+                        help='numbers of client processes sending operations at once')
+    parser.add_argument('--operations', '-o', type=int, default=2000,
+                        help='number of operations each client sends')
+    parser.add_argument('--num-keys', '-k', type=int, default=100,
+                        help='number of keys each client stores and reads')
+    parser.add_argument('--read-ratio', '-r', type=float, default=0.9,
+                        help='fraction of operations that are GETs. The rest are PUTs')
+    parser.add_argument('--num-bits', '-b', type=int, default=32,
+                        help='number of bits in the identifier space')
+    parser.add_argument('--virtual-nodes', '-v', type=int, default=0,
+                        help='number of virtual nodes on each node')
+    parser.add_argument('--port', '-p', type=int, default=6500,
+                        help='first port of the ring. Each node takes two ports from here')
+    parser.add_argument('--replicas', type=int, nargs='+', default=[1],
+                        help='numbers of nodes keeping each key. A ring is started for each')
+    parser.add_argument('--quorum', choices=['one', 'majority', 'all'], default='majority',
+                        help='number of replicas reads and writes wait for')
+    parser.add_argument('--nearest-reads', action='store_true',
+                        help='answer reads from copies on the node a client is connected to. Requires --quorum one')
+
+    return parser
+
+
+def main(output, args):
+    parser = config_parser()
+    args = parser.parse_args(args)
+    if args.nearest_reads and args.quorum != 'one' and max(args.replicas) > 1:
+        parser.error('--nearest-reads requires --quorum one')
+
+    benchmark(output, args.nodes, args.clients, args.operations, args.num_keys, args.read_ratio, args.num_bits,
+              args.virtual_nodes, args.port, args.replicas, args.quorum, args.nearest_reads)
+
+
+if __name__ == '__main__':
+    main(sys.stdout, sys.argv[1:])
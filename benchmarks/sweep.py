@@ -0,0 +1,127 @@
+""" Parameter sweep over the direct chord simulator
+
+Runs every combination of node count, key count, node type and number of joining
+nodes, and writes one row per configuration with:
+
+  - mean, p50, p95, p99 and max hops to find a key
+  - build_s: time to build the ring, including finger tables
+  - join_s: time to join the new nodes and fix every finger table
+  - lookups_per_s: keys looked up per second after the joins
+  - peak_kib: peak memory allocated while building the ring, measured on a
+    separate build so tracing does not slow the timed one
+
+Configurations run in parallel across `--workers` processes. Rows are written as
+CSV or JSON so results can be compared across commits, e.g. with `--label`.
+
+    python benchmarks/sweep.py --nodes 100 1000 --num-keys 1000 --node-types DirectNode DirectChordNode \
+        --joining 0 10 --output sweep.csv
+"""
+import argparse
+import csv
+import itertools
+import json
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+from directchord import add_nodes, build_nodes, hop_histogram, hop_statistics, NODE_TYPES
+from hash import hash_values
+from util import generate_keys
+
+FIELDS = ['label', 'nodes', 'keys', 'node_type', 'joining', 'num_bits', 'mean', 'p50', 'p95', 'p99', 'max',
+          'build_s', 'join_s', 'lookups_per_s', 'peak_kib']
+
+
+def run_configuration(label, num_nodes, num_keys, node_type_name, num_joining, num_bits):
+    node_type = NODE_TYPES[node_type_name]
+
+    tracemalloc.start()
+    build_nodes(num_nodes, node_type, num_bits=num_bits)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    nodes_map = build_nodes(num_nodes, node_type, num_bits=num_bits)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if num_joining:
+        add_nodes(nodes_map, num_joining, node_type, num_bits)
+    join_time = time.perf_counter() - start
+
+    digests = hash_values(generate_keys(num_keys, key_prefix='data'), num_bits)
+    start = time.perf_counter()
+    histogram = hop_histogram(nodes_map.values(), digests)
+    lookup_time = time.perf_counter() - start
+
+    row = {'label': label, 'nodes': num_nodes, 'keys': num_keys, 'node_type': node_type_name,
+           'joining': num_joining, 'num_bits': num_bits}
+    row.update(hop_statistics(histogram))
+    row.update({'build_s': round(build_time, 4), 'join_s': round(join_time, 4),
+                'lookups_per_s': round(num_keys / lookup_time), 'peak_kib': round(peak / 1024, 1)})
+    return row
+
+
+def write_rows(output, rows, output_format):
+    if output_format == 'json':
+        json.dump(rows, output, indent=4)
+        print(file=output)
+    else:
+        writer = csv.DictWriter(output, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def config_parser():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--nodes', '-n', type=int, nargs='+', default=[100, 1000],
+                        help='ring sizes to evaluate')
+    parser.add_argument('--num-keys', '-k', type=int, nargs='+', default=[1000],
+                        help='numbers of keys to look up')
+    parser.add_argument('--node-types', '-t', choices=NODE_TYPES.keys(), nargs='+', default=['DirectChordNode'],
+                        help='node types to evaluate')
+    parser.add_argument('--joining', '-j', type=int, nargs='+', default=[0],
+                        help='numbers of nodes to join each ring before looking up keys')
+    parser.add_argument('--num-bits', '-b', type=int, default=32,
+                        help='number of bits in the identifier space')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                        help='number of configurations to run in parallel')
+    parser.add_argument('--format', '-f', choices=['csv', 'json'], default=None,
+                        help='output format. Defaults to the extension of --output, or csv')
+    parser.add_argument('--output', '-o', type=str, default=None,
+                        help='file to write results to. Defaults to standard output')
+    parser.add_argument('--label', '-l', type=str, default='',
+                        help='label added to every row, e.g. a commit id')
+
+    return parser
+
+
+def main(output, args):
+    parser = config_parser()
+    args = parser.parse_args(args)
+
+    output_format = args.format
+    if output_format is None:
+        output_format = 'json' if args.output and args.output.endswith('.json') else 'csv'
+
+    configurations = [(args.label, num_nodes, num_keys, node_type_name, num_joining, args.num_bits)
+                      for num_nodes, num_keys, node_type_name, num_joining
+                      in itertools.product(args.nodes, args.num_keys, args.node_types, args.joining)]
+
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            rows = list(executor.map(run_configuration, *zip(*configurations)))
+    else:
+        rows = [run_configuration(*configuration) for configuration in configurations]
+
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            write_rows(f, rows, output_format)
+    else:
+        write_rows(output, rows, output_format)
+
+
+if __name__ == '__main__':
+    main(sys.stdout, sys.argv[1:])
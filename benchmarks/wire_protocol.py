@@ -0,0 +1,96 @@
+""" Size and speed of the wire format compared to pickle
+
+Encodes and decodes the commands nodes exchange most often, a lookup, a
+stabilize reply with a successor list and a notify, both with the wire format
+of `chord.wire` and with pickle as nodes used to. Reports bytes per message and
+round trips per second, and the messages per second a pair of sockets carries
+over TCP on the loopback interface with each encoding.
+
+    python benchmarks/wire_protocol.py --messages 100000 --num-bits 160
+"""
+import argparse
+import pickle
+import sys
+import time
+
+import zmq
+
+from node import RoutingInfo, FindSuccessorCommand, PredecessorCommand, NotifyCommand, decode_command
+
+
+def sample_commands(num_bits):
+    def routing_info(i):
+        digest = (2 ** num_bits - 1) // (i + 2)
+        return RoutingInfo(digest, digest, f'tcp://10.0.0.{i}:5501')
+
+    lookup = FindSuccessorCommand(initiator=routing_info(0), recipient=routing_info(1), hops=3,
+                                  search_digest=routing_info(2).digest, return_data=7)
+    lookup.request_id = 12
+    stabilize = PredecessorCommand(initiator=routing_info(0), recipient=routing_info(1),
+                                   successors_predecessor=routing_info(0),
+                                   successor_list=[routing_info(i) for i in range(2, 5)])
+    notify = NotifyCommand(initiator=routing_info(0), recipient=routing_info(1))
+
+    return {'lookup': lookup, 'stabilize': stabilize, 'notify': notify}
+
+
+ENCODINGS = {'pickle': (pickle.dumps, pickle.loads), 'wire': (lambda command: command.encode(), decode_command)}
+
+
+def time_round_trips(command, encode, decode, num_messages):
+    start = time.perf_counter()
+    for _ in range(num_messages):
+        decode(encode(command))
+    return num_messages / (time.perf_counter() - start)
+
+
+def time_sockets(command, encode, decode, num_messages):
+    context = zmq.Context()
+    sender = context.socket(zmq.PUSH)
+    receiver = context.socket(zmq.PULL)
+    port = receiver.bind_to_random_port('tcp://127.0.0.1')
+    sender.connect(f'tcp://127.0.0.1:{port}')
+
+    try:
+        start = time.perf_counter()
+        for _ in range(num_messages):
+            sender.send(encode(command))
+            decode(receiver.recv())
+        return num_messages / (time.perf_counter() - start)
+    finally:
+        sender.close(linger=0)
+        receiver.close(linger=0)
+        context.term()
+
+
+def benchmark(output, num_messages, num_bits):
+    print(f'{"command":<10} {"encoding":<8} {"bytes":>6} {"round trips/s":>14} {"socket msgs/s":>14}', file=output)
+    for name, command in sample_commands(num_bits).items():
+        for encoding, (encode, decode) in ENCODINGS.items():
+            size = len(encode(command))
+            round_trips = time_round_trips(command, encode, decode, num_messages)
+            socket_rate = time_sockets(command, encode, decode, num_messages // 10)
+            print(f'{name:<10} {encoding:<8} {size:>6} {round_trips:>14.0f} {socket_rate:>14.0f}', file=output)
+
+
+def config_parser():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--messages', '-m', type=int, default=100000,
+                        help='number of messages to encode and decode for each command and encoding. '
+                             'A tenth as many are sent over sockets')
+    parser.add_argument('--num-bits', '-b', type=int, default=160,
+                        help='number of bits in the identifier space')
+
+    return parser
+
+
+def main(output, args):
+    parser = config_parser()
+    args = parser.parse_args(args)
+
+    benchmark(output, args.messages, args.num_bits)
+
+
+if __name__ == '__main__':
+    main(sys.stdout, sys.argv[1:])
@@ -0,0 +1,294 @@
+"""Array-backed chord ring for large simulations
+
+`directchord` models every node as an object with a list of finger references,
+which costs several hundred bytes per node plus a pointer per finger. This module
+keeps the same ring in contiguous NumPy arrays indexed by node slot, where slot i
+is the node with the i-th smallest digest:
+
+  - digests: uint64 digest of each node
+  - successor, predecessor: slot of the next and previous node
+  - fingers: slot of finger k of each node, one row per node
+
+Routing follows the same steps as `DirectNode` and `DirectChordNode`, so lookups
+return the same owners and hop counts. Digests are stored as uint64, so the
+identifier space is limited to 64 bits.
+"""
+import argparse
+import sys
+
+import numpy as np
+
+import ring_assignment
+from directchord import hop_statistics, format_hop_statistics
+from hash import NUM_BITS, HASH_FUNCTIONS
+from util import open_closed
+
+MAX_ARRAY_BITS = 64
+
+
+def node_digests(num_nodes, node_name_prefix="node", num_bits=NUM_BITS, hash_name=None):
+    """ Digests of the nodes `directchord.build_nodes` would create
+
+    Names are hashed in order until `num_nodes` distinct digests are found. When two
+    names hash to the same digest the later name owns it, as in `build_nodes`.
+
+    :return: sorted array of node digests, and the number in the name of the node at each digest
+    """
+    total = num_nodes
+    while True:
+        digests = ring_assignment.hash_keys(total, node_name_prefix, num_bits, hash_name)
+        unique, first = np.unique(digests, return_index=True)
+        if len(unique) >= num_nodes:
+            break
+        total += num_nodes - len(unique)
+
+    # Stop at the name that completes the ring, then keep the last name for each digest
+    digests = digests[:np.sort(first)[num_nodes - 1] + 1]
+    unique, last = np.unique(digests[::-1], return_index=True)
+    return unique, len(digests) - 1 - last
+
+
+class ArrayRing:
+    """ Chord ring stored as arrays of node slots
+
+    :param digests: sorted array of distinct node digests
+    :param num_bits: number of bits in the identifier space, at most 64
+    :param naive: route through successors only, like `DirectNode`, rather than through fingers
+    """
+
+    def __init__(self, digests, num_bits=NUM_BITS, naive=False):
+        if num_bits > MAX_ARRAY_BITS:
+            raise ValueError(f'Array rings support at most {MAX_ARRAY_BITS} bits, not {num_bits}')
+
+        num_nodes = len(digests)
+        slot_type = np.int32 if num_nodes < pow(2, 31) else np.int64
+
+        self.num_bits = num_bits
+        self.naive = naive
+        self.digests = np.asarray(digests, dtype=np.uint64)
+        self.successor = (np.arange(num_nodes, dtype=slot_type) + 1) % num_nodes
+        self.predecessor = (np.arange(num_nodes, dtype=slot_type) - 1) % num_nodes
+        self.fingers = np.empty((num_nodes, num_bits), dtype=slot_type)
+        self.name_ids = None
+        self.node_name_prefix = None
+
+        self.init_fingers()
+
+    @classmethod
+    def from_nodes(cls, nodes, num_bits=NUM_BITS, naive=False):
+        """ Array ring with the same nodes as a SortedDict of `directchord` nodes """
+        return cls(ring_assignment.digest_array(nodes.keys(), num_bits), num_bits, naive)
+
+    def init_fingers(self):
+        # Finger i of every node is the first node at or after (digest + 2^i) mod 2^m. Columns are
+        # filled one at a time so only one column of finger starts exists at once. uint64 addition
+        # wraps around, which is the modulo for 64 bit rings
+        mask = np.uint64(pow(2, self.num_bits) - 1)
+        for i in range(self.num_bits):
+            starts = (self.digests + np.uint64(pow(2, i))) & mask
+            self.fingers[:, i] = np.searchsorted(self.digests, starts, side='left') % len(self.digests)
+
+    def __len__(self):
+        return len(self.digests)
+
+    def nbytes(self):
+        """ Bytes used by the ring arrays """
+        return self.digests.nbytes + self.successor.nbytes + self.predecessor.nbytes + self.fingers.nbytes
+
+    def get_id(self, slot):
+        return int(self.digests[slot])
+
+    def get_name(self, slot):
+        if self.name_ids is None:
+            return None
+        return f"{self.node_name_prefix}_{self.name_ids[slot]}"
+
+    def find_successor(self, slot, digest, hops):
+        """ Routes from node `slot` to the node responsible for `digest`
+
+        :return: slot of the successor node and total hops
+        """
+        while digest != self.get_id(slot):
+            next_slot = self.successor[slot]
+
+            if open_closed(self.get_id(slot), self.get_id(next_slot), digest):
+                return int(next_slot), hops + 1
+
+            slot = self.find_next_node(slot, digest)
+            hops += 1
+
+        return slot, hops
+
+    def find_next_node(self, slot, digest):
+        if self.naive:
+            return int(self.successor[slot])
+        return self.closest_preceding_node(slot, digest)
+
+    def closest_preceding_node(self, slot, digest):
+        """ Highest finger of node `slot` in (node digest, digest), or the successor if there is none """
+        node_digest = self.digests[slot]
+        digest = np.uint64(digest)
+        finger_digests = self.digests[self.fingers[slot]]
+
+        if node_digest < digest:
+            preceding = (finger_digests > node_digest) & (finger_digests < digest)
+        else:
+            preceding = (finger_digests > node_digest) | (finger_digests < digest)
+
+        candidates = np.flatnonzero(preceding)
+        if len(candidates):
+            return int(self.fingers[slot, candidates[-1]])
+        return int(self.successor[slot])
+
+
+def open_closed_array(start, end, test):
+    """ Vectorized `util.open_closed` """
+    return np.where(start < end, (start < test) & (test <= end), (test > start) | (test <= end))
+
+
+def batch_find_successor(ring, digests, starts):
+    """ Routes every lookup at once, advancing all unfinished lookups one hop per step
+
+    Each step applies the same tests as `ArrayRing.find_successor` to arrays of lookups:
+    lookups at the node with their digest stop there, lookups whose digest falls between
+    the node and its successor stop at the successor, and the rest move to the closest
+    preceding finger (or the successor for naive rings). Lookups are routed in chunks of
+    `ring_assignment.CHUNK_SIZE` to bound the size of the finger arrays compared per step.
+
+    :param ring: ArrayRing
+    :param digests: uint64 array of key digests
+    :param starts: array of start slots, one per digest
+    :return: array of owner slots and array of hops, one per digest
+    """
+    owners = np.empty(len(digests), dtype=np.int64)
+    hops = np.empty(len(digests), dtype=np.int64)
+
+    for chunk_start in range(0, len(digests), ring_assignment.CHUNK_SIZE):
+        chunk = slice(chunk_start, chunk_start + ring_assignment.CHUNK_SIZE)
+        owners[chunk], hops[chunk] = _route_chunk(ring, np.asarray(digests[chunk], dtype=np.uint64),
+                                                  np.array(starts[chunk], dtype=np.int64))
+
+    return owners, hops
+
+
+def _route_chunk(ring, digests, slots):
+    owners = np.empty(len(digests), dtype=np.int64)
+    hops = np.zeros(len(digests), dtype=np.int64)
+
+    # Indices into the chunk of lookups that have not finished
+    active = np.arange(len(digests))
+    while len(active):
+        slot = slots[active]
+        digest = digests[active]
+        node_digest = ring.digests[slot]
+        successor = ring.successor[slot]
+
+        at_node = digest == node_digest
+        owners[active[at_node]] = slot[at_node]
+
+        at_successor = ~at_node & open_closed_array(node_digest, ring.digests[successor], digest)
+        owners[active[at_successor]] = successor[at_successor]
+        hops[active[at_successor]] += 1
+
+        moving = ~(at_node | at_successor)
+        active, slot, digest, node_digest, successor = \
+            active[moving], slot[moving], digest[moving], node_digest[moving], successor[moving]
+
+        if ring.naive:
+            next_slot = successor
+        else:
+            # A finger is in (node, digest) when its clockwise distance from the node is between
+            # zero and the digest's distance. Moving lookups never sit at their digest, so this is
+            # the same test as open_open with a single comparison per side. The highest such finger
+            # is the last true column of the mask
+            mask = np.uint64(pow(2, ring.num_bits) - 1)
+            fingers = ring.fingers[slot]
+            finger_distance = (ring.digests[fingers] - node_digest[:, None]) & mask
+            digest_distance = (digest - node_digest) & mask
+            preceding = (finger_distance > 0) & (finger_distance < digest_distance[:, None])
+            last = ring.num_bits - 1 - np.argmax(preceding[:, ::-1], axis=1)
+            next_slot = np.where(preceding.any(axis=1), fingers[np.arange(len(slot)), last], successor)
+
+        slots[active] = next_slot
+        hops[active] += 1
+
+    return owners, hops
+
+
+def build_ring(num_nodes, node_name_prefix="node", num_bits=NUM_BITS, hash_name=None, naive=False):
+    """ Array ring with the same nodes `directchord.build_nodes` would create """
+    digests, name_ids = node_digests(num_nodes, node_name_prefix, num_bits, hash_name)
+
+    ring = ArrayRing(digests, num_bits, naive)
+    ring.name_ids = name_ids
+    ring.node_name_prefix = node_name_prefix
+    return ring
+
+
+def hop_histogram(ring, digests, start_node='fixed', seed=0, per_key=False):
+    """ Number of lookups taking each number of hops, as `directchord.hop_histogram`
+
+    :param ring: ArrayRing
+    :param digests: key digests to look up
+    :param start_node: 'fixed' starts every lookup at slot 0, 'random' at a slot chosen per lookup
+    :param seed: seed for choosing random start nodes
+    :param per_key: route one key at a time with `ArrayRing.find_successor` rather than in batches
+    :return: dictionary of hops to number of lookups
+    """
+    rng = np.random.default_rng(seed)
+    starts = np.zeros(len(digests), dtype=np.int64) if start_node == 'fixed' \
+        else rng.integers(len(ring), size=len(digests))
+
+    if per_key:
+        hops = np.array([ring.find_successor(start, digest, 0)[1]
+                         for start, digest in zip(starts.tolist(), digests.tolist())], dtype=np.int64)
+    else:
+        hops = batch_find_successor(ring, digests, starts)[1]
+
+    values, counts = np.unique(hops, return_counts=True)
+    return dict(zip(values.tolist(), counts.tolist()))
+
+
+def config_parser():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('num_nodes', type=int, help='number of nodes in the ring')
+    parser.add_argument('num_keys', type=int, help='number of keys to look up')
+    parser.add_argument('--key-prefix', '-k', type=str, default='data',
+                        help='prefix of key name')
+    parser.add_argument('--node_prefix', '-n', type=str, default='node',
+                        help='prefix of node name')
+    parser.add_argument('--num-bits', '-b', type=int, default=NUM_BITS,
+                        help=f'number of bits in the identifier space, at most {MAX_ARRAY_BITS}')
+    parser.add_argument('--hash', type=str, choices=HASH_FUNCTIONS.keys(), default=None,
+                        help='hash function to use. Defaults to md5')
+    parser.add_argument('--naive-nodes', action='store_true',
+                        help='route through successors only rather than through finger tables')
+    parser.add_argument('--start-node', choices=['fixed', 'random'], default='fixed',
+                        help='start lookups at the first node or at a random node for each key')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed for choosing random start nodes')
+    parser.add_argument('--hop-statistics', '-s', action='store_true',
+                        help='print the mean, 50th, 95th and 99th percentiles and maximum of hops')
+    parser.add_argument('--per-key', action='store_true',
+                        help='route one key at a time instead of advancing all lookups together')
+
+    return parser
+
+
+def main(output, args):
+    parser = config_parser()
+    args = parser.parse_args(args)
+
+    ring = build_ring(args.num_nodes, args.node_prefix, args.num_bits, args.hash, args.naive_nodes)
+    digests = ring_assignment.hash_keys(args.num_keys, args.key_prefix, args.num_bits, args.hash)
+
+    stats = hop_statistics(hop_histogram(ring, digests, args.start_node, args.seed, args.per_key))
+    print(f"Average hops with {len(ring)} nodes is {stats['mean']}", file=output)
+    if args.hop_statistics:
+        print(format_hop_statistics(len(ring), stats), file=output)
+    print(f"Ring arrays use {ring.nbytes() / pow(2, 20):.1f} MiB", file=output)
+
+
+if __name__ == "__main__":
+    main(sys.stdout, sys.argv[1:])
@@ -0,0 +1,386 @@
+"""Asyncio runtime for networked chord nodes
+
+`AsyncNode` runs the sockets, virtual nodes and commands of a `node.Node` on one
+asyncio event loop with `zmq.asyncio` sockets. Request handling, stabilize and
+fix_fingers are coroutines on that loop, so a node runs in a single thread.
+This module is also the command line for starting and shutting down nodes.
+
+Commands a node starts itself carry a request id, and the coroutine that started
+one waits on a future that is resolved when its result comes back. Every virtual
+node stabilizes and fixes a finger concurrently, and any number of lookups started
+with `AsyncNode.lookup` can be in flight at once.
+"""
+import asyncio
+import functools
+import itertools
+import logging
+import pprint
+import random
+import sys
+
+import zmq
+import zmq.asyncio
+
+from connections import RETRY_INTERVAL
+from hash import hash_value
+from util import finger_start
+from wire import WireError
+from replication import QUORUM_WAIT
+from node import Node, ChordNode, ChordVirtualNode, RoutingInfo, FindSuccessorCommand, PredecessorCommand, \
+    NotifyCommand, EXIT_COMMAND, STABILIZE_WAIT, FIX_FINGERS_WAIT, CONNECT_WAIT, LEAVE_WAIT, \
+    LEAVE_POLL, config_parser, parse_consistency, handle_shutdown, to_int, decode_command, finger_table_links
+
+# Milliseconds to wait for the result of a lookup
+LOOKUP_WAIT = 5000
+
+# Seconds between printing the links of a node started from the command line
+PRINT_INTERVAL = 30
+
+
+class AsyncNode(Node):
+    """ Chord node running on an asyncio event loop
+
+    `join` and `run` are coroutines. The remaining methods are called from the event
+    loop and never block it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.request_ids = itertools.count()
+        self.pending = {}
+        self.lookups = {}
+        self.lookup_ids = set()
+        self.retry_handle = None
+        self.shutdown_event = None
+
+    @staticmethod
+    def create_context():
+        return zmq.asyncio.Context()
+
+    async def join(self, known_id, known_address):
+        logging.debug(f'Node {self.digest_id} at {self.internal_endpoint} joining '
+                      f'known node {known_id} at {known_address}')
+
+        for v_node in list(self.virtual_nodes.values()):
+            success = await self.join_vnode(known_id, known_address, v_node)
+            if not success:
+                self.virtual_nodes.pop(v_node.get_digest())
+
+        return len(self.virtual_nodes)
+
+    async def join_vnode(self, known_id, known_address, virtual_node):
+        recipient = RoutingInfo(known_id, known_id, known_address)
+        cmd = FindSuccessorCommand(search_digest=virtual_node.get_digest(),
+                                   initiator=virtual_node.routing_info,
+                                   recipient=recipient)
+        self.route_result(known_address, known_id, cmd)
+        await self.wait_connections(CONNECT_WAIT)
+
+        # The receive loop has not started, so the result can be read here
+        frames = await self.receiver.recv_multipart()
+        result = decode_command(frames[0], frames[1:])
+        virtual_node.successor = result.recipient
+
+        return virtual_node.successor.get_digest() != virtual_node.get_digest()
+
+    async def run(self, stabilize_interval=5, fix_fingers_interval=7):
+        logging.info(f'Starting event loop for node {self.digest_id}')
+        logging.info(f'Node {self.digest_id} managing virtual nodes: {self.virtual_nodes.keys()}')
+
+        self.shutdown_event = asyncio.Event()
+        tasks = [asyncio.ensure_future(self.receive()), asyncio.ensure_future(self.receive_clients()),
+                 asyncio.ensure_future(self.watch_connections())]
+        if stabilize_interval:
+            tasks.append(asyncio.ensure_future(self.run_periodic(self._stabilize, stabilize_interval)))
+        if fix_fingers_interval:
+            tasks.append(asyncio.ensure_future(self.run_periodic(self._fix_fingers, fix_fingers_interval)))
+
+        try:
+            await self.shutdown_event.wait()
+            await self.leave()
+            logging.info(f'Node {self.digest_id} shutting down...')
+            logging.info(f'Node state: {[vars(v_node) for v_node in self.virtual_nodes.values()]}')
+            logging.info(f'Node {self.digest_id} transfers: {self.transfer_stats.as_dict()}')
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self.retry_handle:
+                self.retry_handle.cancel()
+
+            self.connections.close()
+            self.receiver.close()
+            self.router.close()
+            self.context.term()
+            self.shutdown = True
+
+        logging.info(f'Node {self.digest_id} says Goodbye!')
+
+    def stop(self):
+        self.shutdown_event.set()
+
+    async def leave(self):
+        """ Hands every key to the successors, while the node keeps handling commands """
+        if not self.start_leave():
+            return
+
+        logging.info(f'Node {self.digest_id} leaving...')
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + LEAVE_WAIT / 1000
+        while not self.handoffs_done() and loop.time() < deadline:
+            await asyncio.sleep(LEAVE_POLL / 1000)
+            self.resume_stalled()
+
+        if not self.handoffs_done():
+            logging.warning(f'Node {self.digest_id} could not hand off every key in {LEAVE_WAIT} milliseconds')
+
+    async def run_periodic(self, task, interval):
+        while not self.shutdown_event.is_set():
+            await task()
+            try:
+                await asyncio.wait_for(self.shutdown_event.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def receive(self):
+        while True:
+            frames = await self.receiver.recv_multipart()
+            try:
+                command = decode_command(frames[0], frames[1:])
+            except WireError as e:
+                logging.warning(f'Node {self.digest_id} dropping message it cannot decode: {e}')
+                continue
+            logging.debug(f'Node {self.digest_id} received command {command}')
+
+            if command == EXIT_COMMAND:
+                # Commands are still handled while the node hands off its keys
+                logging.debug(f'Node {self.digest_id} received EXIT message. Node shutting down.')
+                self.shutdown_event.set()
+                continue
+
+            try:
+                self.process_command(command)
+            except Exception:
+                # One bad command must not stop the node from handling the rest
+                logging.exception(f'Node {self.digest_id} unable to process {command}')
+
+    async def receive_clients(self):
+        while True:
+            command = self.client_command(await self.router.recv_multipart())
+            if not command:
+                continue
+
+            try:
+                self.process_command(command)
+            except Exception:
+                logging.exception(f'Node {self.digest_id} unable to process {command}')
+
+    def process_command(self, command):
+        if getattr(command, 'found', False) and command.request_id in self.lookup_ids:
+            # A lookup result is not applied to the node. Results that arrive after the
+            # lookup timed out are dropped
+            self.lookup_ids.discard(command.request_id)
+            lookup = self.lookups.pop(command.request_id, None)
+            if lookup and not lookup.done():
+                lookup.set_result(command.recipient)
+            elif not lookup:
+                logging.debug(f'Node {self.digest_id} dropping late result of lookup {command.request_id}')
+            return
+
+        result = command.execute(self)
+        if not result:
+            return
+
+        address = result.get_address()
+        identity = result.get_parent()
+        if address in (self.stabilize_address, self.fix_fingers_address) and not identity:
+            # A request started by this node is complete
+            future = self.pending.get(command.request_id)
+            if future and not future.done():
+                future.set_result(True)
+        else:
+            self.route_result(address, identity, command)
+
+    async def request(self, command, timeout):
+        """ Starts `command` and waits for it to complete
+
+        :param timeout: milliseconds to wait
+        :return: True if the command completed, False if it timed out
+        """
+        command.request_id = next(self.request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[command.request_id] = future
+
+        try:
+            self.process_command(command)
+            return await asyncio.wait_for(future, timeout / 1000)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.pending.pop(command.request_id, None)
+
+    async def lookup(self, digest, timeout=LOOKUP_WAIT):
+        """ Finds the node responsible for `digest`, starting from the host virtual node
+
+        :param timeout: milliseconds to wait
+        :return: RoutingInfo of the responsible node, or None if the lookup timed out
+        """
+        host = self.virtual_nodes[self.digest_id].routing_info
+        command = FindSuccessorCommand(initiator=host, recipient=host, search_digest=digest)
+        command.request_id = next(self.request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.lookups[command.request_id] = future
+        self.lookup_ids.add(command.request_id)
+
+        try:
+            self.process_command(command)
+            return await asyncio.wait_for(future, timeout / 1000)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.lookups.pop(command.request_id, None)
+
+    async def _stabilize(self):
+        logging.debug(f'Node {self.digest_id} running stabilize')
+        await asyncio.gather(*(self.stabilize_vnode(v_node) for v_node in self.virtual_nodes.values()))
+
+        if self.sync_due():
+            for v_node in self.virtual_nodes.values():
+                self.start_sync(v_node)
+
+    async def stabilize_vnode(self, v_node):
+        successor = v_node.successor
+        updated = await self.request(PredecessorCommand(initiator=v_node.routing_info), STABILIZE_WAIT)
+        if not updated and successor.get_digest() != v_node.get_digest():
+            logging.debug(f'Node {v_node.get_parent()}, Virtual Node {v_node.get_digest()} stabilize did not receive '
+                          f'response from successor {successor.get_digest()} in {STABILIZE_WAIT} milliseconds')
+            v_node.successor_missed(successor)
+
+        self.process_command(NotifyCommand(initiator=v_node.routing_info))
+
+    async def _fix_fingers(self):
+        await asyncio.gather(*(self.fix_finger(v_node) for v_node in self.virtual_nodes.values()))
+
+    async def fix_finger(self, v_node, index=None):
+        """ Looks up finger `index` of `v_node`, or a random finger if no index is given """
+        if index is None:
+            index = random.randint(0, v_node.num_bits - 1)
+        cmd = FindSuccessorCommand(initiator=v_node.routing_info, recipient=v_node.routing_info,
+                                   search_digest=finger_start(v_node.get_digest(), index, v_node.num_bits),
+                                   return_data=index)
+
+        if not await self.request(cmd, FIX_FINGERS_WAIT):
+            logging.debug(f'Node {v_node.get_parent()}, Virtual Node {v_node.get_digest()}: fix fingers did '
+                          f'not receive response in {FIX_FINGERS_WAIT} milliseconds. Continuing.')
+
+    def route_result(self, address, identity, command):
+        super().route_result(address, identity, command)
+        self.schedule_retry()
+
+    def wait_quorum(self, request_id, quorum):
+        super().wait_quorum(request_id, quorum)
+        asyncio.get_running_loop().call_later(QUORUM_WAIT / 1000, self.expire_quorums)
+
+    def schedule_retry(self):
+        # Messages can stay queued after a handshake event, e.g. when the peer's queue is
+        # full, so retry them until they are sent
+        if self.connections.queued and self.retry_handle is None:
+            self.retry_handle = asyncio.get_running_loop().call_later(RETRY_INTERVAL / 1000, self.retry_connections)
+
+    def retry_connections(self):
+        self.retry_handle = None
+        self.connections.retry()
+        self.reroute_expired()
+        self.schedule_retry()
+
+    async def watch_connections(self):
+        # Releases messages queued for peers as their connections complete
+        while True:
+            self.connections.handle_event(await self.connections.monitor.recv_multipart())
+
+    async def wait_connections(self, timeout):
+        """ Waits until every queued message is sent, before the connection watcher runs
+
+        :param timeout: milliseconds to wait
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout / 1000
+        while self.connections.queued and loop.time() < deadline:
+            try:
+                self.connections.handle_event(
+                    await asyncio.wait_for(self.connections.monitor.recv_multipart(), RETRY_INTERVAL / 1000))
+            except asyncio.TimeoutError:
+                self.connections.retry()
+
+        if self.connections.queued:
+            logging.error(f'Node {self.digest_id} could not connect to {list(self.connections.queued)}')
+
+
+class AsyncChordNode(AsyncNode):
+
+    @staticmethod
+    def get_virtual_node_type():
+        return ChordVirtualNode
+
+
+# -----------------------------------------------------------------------------
+# CLI Helpers
+# -----------------------------------------------------------------------------
+
+ASYNC_NODE_TYPES = {Node: AsyncNode, ChordNode: AsyncChordNode}
+
+
+async def print_links(node):
+    pp = pprint.PrettyPrinter()
+    while True:
+        pp.pprint(finger_table_links(node))
+        await asyncio.sleep(PRINT_INTERVAL)
+
+
+async def run_new_node(name, address, external_port, internal_port, action, known_endpoint, known_name,
+                       stabilize_interval, fix_fingers_interval, node_type, hash_func, virtual_nodes, num_bits,
+                       num_successors, hash_name=None, consistency=None, quiet=True):
+    node = node_type(name, hash_func(name), address, external_port, internal_port, dict(virtual_nodes),
+                     num_bits, num_successors, hash_name, consistency)
+
+    if action == 'create':
+        node.create()
+    elif action == 'join':
+        if not known_endpoint or not known_name:
+            raise ValueError('join action requires known name and known address')
+
+        await node.join(hash_func(known_name), known_endpoint)
+
+    print(f'Node {node.name} joined network with {len(node.virtual_nodes)} virtual node(s)')
+    printer = None if quiet else asyncio.ensure_future(print_links(node))
+    try:
+        await node.run(stabilize_interval, fix_fingers_interval)
+    finally:
+        if printer:
+            printer.cancel()
+
+
+def main(args):
+    parser = config_parser()
+    args = parser.parse_args(args)
+
+    hash_func = to_int
+    if args.real_hashes:
+        hash_func = functools.partial(hash_value, num_bits=args.num_bits, hash_name=args.hash)
+
+    node_type = ASYNC_NODE_TYPES[args.naive_nodes or args.chord_nodes or ChordNode]
+    consistency = parse_consistency(parser, args)
+
+    if args.action == 'shutdown':
+        print('Shutting down...')
+        handle_shutdown(args.name, args.address, args.internal_port, hash_func)
+        print(f'Shutdown node {args.name}')
+    else:
+        asyncio.run(run_new_node(args.name, args.address, args.external_port, args.internal_port, args.action,
+                                 args.known_endpoint, args.known_name, args.stabilize_interval,
+                                 args.fix_fingers_interval, node_type, hash_func, args.virtual_nodes,
+                                 args.num_bits, args.successors, args.hash, consistency, args.quiet))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
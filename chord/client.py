@@ -0,0 +1,126 @@
+"""Client for the key-value store on a chord ring
+
+Sends GET, PUT and DELETE operations to the external endpoint of any node in the
+ring. The node routes each operation to the virtual node owning the key and
+replies with the result.
+
+    python chord/client.py tcp://127.0.0.1:5502 put greeting hello
+    python chord/client.py tcp://127.0.0.1:5502 get greeting
+    python chord/client.py tcp://127.0.0.1:5502 delete greeting
+"""
+import argparse
+import itertools
+import sys
+
+import zmq
+
+from node import StoreCommand, decode_command
+from store import GET, PUT, DELETE, OK, UNAVAILABLE, INVALID, OPERATIONS
+
+# Milliseconds to wait for the reply to an operation
+REQUEST_WAIT = 5000
+
+
+class UnavailableError(RuntimeError):
+    """ Raised when too few replicas of a key answered for an operation to succeed """
+
+
+class Client:
+    """ Connection to one node of the ring
+
+    Operations are sent one at a time. Each call blocks until its reply arrives or
+    `timeout` milliseconds pass, in which case it raises TimeoutError. Operations
+    that did not reach their quorum of replicas raise UnavailableError, and keys the
+    node rejected, e.g. for being too long, raise ValueError.
+    """
+
+    def __init__(self, endpoint, timeout=REQUEST_WAIT):
+        self.timeout = timeout
+        self.request_ids = itertools.count()
+
+        self.context = zmq.Context()
+        self.socket = self.context.socket(zmq.DEALER)
+        self.socket.setsockopt(zmq.LINGER, 0)
+        self.socket.connect(endpoint)
+
+    def get(self, key):
+        """ :return: value stored for `key` as bytes, or None if there is none """
+        return self.request(GET, key).value
+
+    def put(self, key, value):
+        if isinstance(value, str):
+            value = value.encode()
+        self.request(PUT, key, value)
+
+    def delete(self, key):
+        """ :return: True if the key was stored """
+        return self.request(DELETE, key).status == OK
+
+    def request(self, operation, key, value=None):
+        """ Sends an operation and waits for its reply
+
+        :return: StoreCommand with the status, and the value for GET
+        """
+        command = StoreCommand(operation, key, value, next(self.request_ids))
+        self.socket.send_multipart([command.encode()] + command.data_frames())
+
+        while self.socket.poll(self.timeout):
+            frames = self.socket.recv_multipart()
+            reply = decode_command(frames[0], frames[1:])
+
+            # Replies to operations that timed out earlier are skipped
+            if reply.client_request_id == command.client_request_id:
+                if reply.status == UNAVAILABLE:
+                    raise UnavailableError(f'Too few replicas answered {command}')
+                if reply.status == INVALID:
+                    raise ValueError(f'Node rejected the key of {command}')
+                return reply
+
+        raise TimeoutError(f'No reply to {command} in {self.timeout} milliseconds')
+
+    def close(self):
+        self.socket.close()
+        self.context.term()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def config_parser():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('endpoint', type=str, help='external endpoint of a node in the ring')
+    parser.add_argument('operation', choices=OPERATIONS.keys(), help='operation to run')
+    parser.add_argument('key', type=str, help='key to run the operation on')
+    parser.add_argument('value', type=str, nargs='?', help='value to store. Required for put')
+    parser.add_argument('--timeout', '-t', type=int, default=REQUEST_WAIT,
+                        help='milliseconds to wait for the reply')
+
+    return parser
+
+
+def main(output, args):
+    parser = config_parser()
+    args = parser.parse_args(args)
+
+    if args.operation == 'put' and args.value is None:
+        parser.error('put requires a value')
+
+    with Client(args.endpoint, args.timeout) as client:
+        if args.operation == 'get':
+            value = client.get(args.key)
+            print(value.decode(errors='replace') if value is not None else f'{args.key} not found', file=output)
+        elif args.operation == 'put':
+            client.put(args.key, args.value)
+            print(f'Stored {args.key}', file=output)
+        elif client.delete(args.key):
+            print(f'Deleted {args.key}', file=output)
+        else:
+            print(f'{args.key} not found', file=output)
+
+
+if __name__ == '__main__':
+    main(sys.stdout, sys.argv[1:])
@@ -0,0 +1,151 @@
+"""Connections from a ROUTER socket to chord peers
+
+A ROUTER socket can only send to a peer once the connection handshake has told it
+the peer's identity. Messages sent before then are silently dropped, so nodes used
+to sleep after connecting to a new address. `ConnectionManager` sets
+ROUTER_MANDATORY so that sending to a peer that is not ready fails instead, and
+queues the message. The manager watches the socket monitor for HANDSHAKE_SUCCEEDED
+events and sends the queued messages for that address as soon as it is ready.
+Messages for a peer that stays unreachable can be taken back with `expire`.
+"""
+import collections
+import logging
+import time
+
+import zmq
+import zmq.asyncio
+from zmq.utils.monitor import parse_monitor_message
+
+# Messages kept for a peer that is not ready. Older messages are dropped beyond this
+QUEUE_LIMIT = 1000
+
+# Milliseconds between attempts to send messages that are still queued after a handshake
+RETRY_INTERVAL = 50
+
+
+class ConnectionManager:
+    """ Connects a ROUTER socket to peers and queues messages until each peer is ready
+
+    Messages are lists of frames, starting with the identity of the peer. Messages to
+    the same address are sent in the order they were given.
+
+    :param router: ROUTER socket, sync or asyncio. Sends never block
+    :param queue_limit: messages kept per address while its peer is not ready
+    """
+
+    def __init__(self, router, queue_limit=QUEUE_LIMIT):
+        router.setsockopt(zmq.ROUTER_MANDATORY, 1)
+        # Drop the route to a peer as soon as it disconnects, so sends to it fail and are
+        # queued rather than kept for a reconnect that may never happen
+        router.setsockopt(zmq.IMMEDIATE, 1)
+        self.router = router
+        self.monitor = router.get_monitor_socket(zmq.EVENT_HANDSHAKE_SUCCEEDED)
+        self.is_async = isinstance(router, zmq.asyncio.Socket)
+
+        self.queue_limit = queue_limit
+        self.connected = set()
+        self.queued = {}
+        self.queued_since = {}
+
+    def connect(self, address):
+        """ Starts connecting to `address` ahead of the first message to it """
+        if address not in self.connected:
+            logging.debug(f'Connecting to {address}')
+            self.connected.add(address)
+            self.router.connect(address)
+
+    def send(self, address, frames):
+        """ Sends `frames` to the peer at `address`, or queues them until the peer is ready
+
+        :return: True if the message was sent, False if it was queued
+        """
+        self.connect(address)
+
+        queue = self.queued.get(address)
+        if queue is None and self.try_send(frames):
+            return True
+
+        if queue is None:
+            queue = self.queued[address] = collections.deque(maxlen=self.queue_limit)
+            self.queued_since[address] = time.monotonic()
+        queue.append(frames)
+        return False
+
+    def send_now(self, frames):
+        """ Sends `frames` without queueing them
+
+        :raises zmq.ZMQError: if the message cannot be sent right away
+        """
+        sent = self.router.send_multipart(frames, zmq.NOBLOCK)
+        if self.is_async:
+            # Asyncio sockets resolve the future of a send that does not wait right away.
+            # Sending through the asyncio socket rather than a sync view of it also wakes
+            # any coroutine waiting to receive on it, since sends can take its read event
+            sent.result()
+
+    def try_send(self, frames):
+        try:
+            self.send_now(frames)
+            return True
+        except zmq.ZMQError as e:
+            # The peer has not finished its handshake, or its queue is full
+            if e.errno in (zmq.EHOSTUNREACH, zmq.EAGAIN):
+                return False
+            raise
+
+    def flush(self, address):
+        """ Sends the messages queued for `address` until one cannot be sent """
+        queue = self.queued.get(address)
+        while queue:
+            if not self.try_send(queue[0]):
+                return
+            queue.popleft()
+            self.queued_since[address] = time.monotonic()
+
+        self.queued.pop(address, None)
+        self.queued_since.pop(address, None)
+
+    def retry(self):
+        for address in list(self.queued):
+            self.flush(address)
+
+    def expire(self, timeout):
+        """ Gives up on the addresses that could not be sent to for `timeout` milliseconds
+
+        :return: list of (address, messages) with the messages that were queued for each address
+        """
+        now = time.monotonic()
+        expired = [address for address, since in self.queued_since.items() if now - since >= timeout / 1000]
+        for address in expired:
+            self.queued_since.pop(address)
+        return [(address, list(self.queued.pop(address))) for address in expired]
+
+    def handle_event(self, frames):
+        """ Handles a message from the monitor socket """
+        event = parse_monitor_message(frames)
+        if event['event'] == zmq.EVENT_HANDSHAKE_SUCCEEDED:
+            address = event['endpoint'].decode()
+            logging.debug(f'Connected to {address}')
+            self.flush(address)
+
+    def wait(self, timeout):
+        """ Blocks until every queued message is sent, for sync sockets
+
+        :param timeout: milliseconds to wait
+        :return: True if every queued message was sent
+        """
+        deadline = time.monotonic() + timeout / 1000
+        while self.queued:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+
+            if self.monitor.poll(min(remaining * 1000, RETRY_INTERVAL)):
+                self.handle_event(self.monitor.recv_multipart())
+            self.retry()
+
+        return True
+
+    def close(self):
+        self.router.disable_monitor()
+        self.monitor.close()
@@ -1,65 +1,275 @@
 import argparse
+import itertools
 import json
+import statistics
 import sys
 
+import numpy as np
 from sortedcontainers import SortedDict
+
+import migration
+import ring_assignment
 from util import generate_keys
 from server import Server
-from hash import hash_value
+from hash import hash_value, hash_values, ring_size, NUM_BITS, HASH_FUNCTIONS
 
 
 server_name_fmt = "server_{id}"
-servers = SortedDict()
-max_server_id = 0
 
 
-def consistent_responsible_server(key):
-    key_digest = hash_value(key)
+class ConsistentBalancer:
+    """ Consistent hashing ring of servers
+
+    Each balancer keeps its own ring, so any number of rings can be used side by side.
+    Servers are placed at the digest of their name. With more than one virtual node per
+    server, a server is also placed at the digests of "<name>#<j>" for j from 1 to
+    vnodes_per_server - 1. Every point maps back to the same `Server`, so lookups return
+    the physical server regardless of which of its points they land on.
+
+    Adding and removing servers returns the ranges of digests that changed owner as
+    (start, end, old_owner, new_owner) tuples. Digests in (start, end] move from
+    old_owner to new_owner. When start == end the range is the whole ring. An owner
+    is None when the ring had no servers.
+    """
+
+    def __init__(self, num_bits=NUM_BITS, hash_name=None, vnodes_per_server=1):
+        self.num_bits = num_bits
+        self.hash_name = hash_name
+        self.vnodes_per_server = vnodes_per_server
+
+        self.servers = SortedDict()
+        self.points = {}
+        self.max_server_id = 0
+
+    def responsible_server(self, key):
+        return self.digest_responsible_server(hash_value(key, self.num_bits, self.hash_name))
+
+    def digest_responsible_server(self, key_digest):
+        if key_digest in self.servers:
+            return self.servers[key_digest]
+        else:
+            return self.find_server(key_digest)
+
+    def find_server(self, key_digest):
+        # Servers are sorted by digest, so binary search for the first server with a larger
+        # digest. If there is no such server, then the key digest is larger than the largest
+        # server digest. In this case the index wraps around and the key is hosted by the
+        # server with the smallest digest
+        index = self.servers.bisect_right(key_digest) % len(self.servers)
+        return self.servers.peekitem(index)[1]
+
+    def predecessor(self, digest):
+        # Index -1 wraps around to the largest digest
+        return self.servers.peekitem(self.servers.index(digest) - 1)[0]
+
+    def add_server(self, name):
+        """ Places a server on the ring in O(vnodes_per_server * log n)
+
+        The server's first point is placed at the digest of its name, replacing any
+        server already there. Additional points that land on an existing digest are
+        skipped rather than displacing another server.
+
+        :param name: name of the server
+        :return: list of ranges that changed owner
+        """
+        server = Server(name)
+
+        digest = hash_value(name, self.num_bits, self.hash_name)
+        new_points = [digest]
+        for j in range(1, self.vnodes_per_server):
+            point = hash_value(f'{name}#{j}', self.num_bits, self.hash_name)
+            if point not in self.servers and point not in new_points:
+                new_points.append(point)
+
+        old_owners = [self.digest_responsible_server(point) if self.servers else None
+                      for point in new_points]
+
+        displaced = self.servers.get(digest)
+        if displaced is not None:
+            self.points[displaced.get_name()].remove(digest)
+            if not self.points[displaced.get_name()]:
+                del self.points[displaced.get_name()]
+
+        for point in new_points:
+            self.servers[point] = server
+        self.points[name] = new_points
+
+        return [(self.predecessor(point), point, old_owner, server)
+                for point, old_owner in zip(new_points, old_owners)]
+
+    def remove_server(self, name):
+        """ Removes a server and all of its points from the ring in O(vnodes_per_server * log n)
+
+        :param name: name of the server
+        :return: list of ranges that changed owner
+        """
+        removed_points = self.points.pop(name)
+        server = self.servers[removed_points[0]]
+
+        starts = [self.predecessor(point) for point in removed_points]
+        for point in removed_points:
+            del self.servers[point]
+
+        return [(start, point, server, self.digest_responsible_server(point) if self.servers else None)
+                for start, point in zip(starts, removed_points)]
+
+    def build_server_list(self, num_servers):
+        """ Adds servers named from `server_name_fmt` to the ring
+
+        A later server can take over part of a range an earlier one just took, so the
+        ranges are planned from the rings before and after all of the additions rather
+        than collected from each `add_server` call.
+
+        :param num_servers: number of physical servers to add
+        :return: list of ranges that changed owner, sorted by end
+        """
+        i = self.max_server_id
+        new_total = self.count_servers() + num_servers
+        if len(self.servers) + num_servers * self.vnodes_per_server > ring_size(self.num_bits):
+            raise ValueError(f'Cannot place {new_total} servers with {self.vnodes_per_server} virtual nodes each '
+                             f'in {self.num_bits}-bit address space')
+
+        before = self.servers.copy()
+        points = []
+        while self.count_servers() < new_total:
+            points += [end for _, end, _, _ in self.add_server(server_name_fmt.format(id=str(i)))]
+            i += 1
+
+        self.max_server_id = i
+        return migration.plan_migration(before, self.servers, points)
+
+    def remove_server_list(self, num_servers):
+        """ Removes the most recently added servers
+
+        :param num_servers: number of physical servers to remove
+        :return: list of ranges that changed owner, sorted by end
+        """
+        before = self.servers.copy()
+        points = []
+        i = self.max_server_id - 1
+        while num_servers and i >= 0:
+            name = server_name_fmt.format(id=str(i))
+            if name in self.points:
+                points += [end for _, end, _, _ in self.remove_server(name)]
+                num_servers -= 1
+            i -= 1
+
+        return migration.plan_migration(before, self.servers, points)
+
+    def count_servers(self):
+        """ Number of physical servers on the ring """
+        return len(self.points)
+
+    def get_servers(self, keys):
+        key_digests = hash_values(keys, self.num_bits, self.hash_name)
+        hosts = self.sweep_servers(key_digests)
+
+        return dict(zip(keys, hosts))
+
+    def sweep_servers(self, key_digests):
+        """ Finds the server hosting each key digest in a single pass over the ring
+
+        Rather than searching the ring for each key, the key digests are sorted once and
+        merged against the sorted server digests, so the whole batch costs one sort plus
+        a linear sweep.
+
+        :param key_digests: list of key digests
+        :return: list of servers hosting each key digest, in the same order as the digests
+        """
+        server_digests = list(self.servers.keys())
+        server_values = list(self.servers.values())
+        num_servers = len(server_digests)
+
+        hosts = [None] * len(key_digests)
+        server_idx = 0
+        for key_idx in sorted(range(len(key_digests)), key=key_digests.__getitem__):
+            key_digest = key_digests[key_idx]
+
+            # Advance to the first server whose digest is at least the key digest
+            while server_idx < num_servers and server_digests[server_idx] < key_digest:
+                server_idx += 1
+
+            # Keys past the last server wrap around to the first server
+            hosts[key_idx] = server_values[server_idx % num_servers]
+
+        return hosts
+
+    def key_counts(self, hosts):
+        """ Number of keys hosted by each physical server on the ring, including servers without keys
+
+        :param hosts: servers hosting each key, e.g. the values returned by get_servers
+        :return: dictionary of server to key count
+        """
+        counts = {server: 0 for server in self.servers.values()}
+        for server in hosts:
+            counts[server] += 1
+        return counts
+
+    def assignment_arrays(self):
+        """ Server digests and owners for `ring_assignment.consistent_assign`
+
+        :return: array of server digests, and a list of the server owning each digest
+        """
+        return ring_assignment.digest_array(self.servers.keys(), self.num_bits), list(self.servers.values())
 
-    if key_digest in servers:
-        return servers[key_digest]
-    else:
-        return find_server(key_digest)
 
+def calculate_change(servers_orig, servers_appended):
+    return [changed for changed in servers_orig if servers_orig[changed] != servers_appended[changed]]
 
-def find_server(key_digest):
-    for server_digest in servers.keys():
-        if server_digest > key_digest:
-            return servers[server_digest]
 
-    # If we have gone through the list of servers and not found the hosting server,
-    # then the key digest is larger than the largest node digest. In this case the
-    # key is hosted by the server with the smallest digest
-    first_server_digest = servers.keys()[0]
-    return servers[first_server_digest]
+def load_statistics(counts):
+    """ Summarizes per-server key counts
 
+    :param counts: number of keys hosted by each server
+    :return: mean, standard deviation, and max over mean of the counts, which is 0 without keys
+    """
+    counts = list(counts)
+    mean = statistics.mean(counts)
+    return mean, statistics.pstdev(counts), max(counts) / mean if mean else 0
 
-def build_server_list(num_servers):
-    global max_server_id
 
-    i = max_server_id
-    new_total = len(servers) + num_servers
-    while len(servers) < new_total:
-        name = server_name_fmt.format(id=str(i))
-        digest = hash_value(name)
-        servers[digest] = Server(name)
-        i += 1
+def format_load(num_servers, counts):
+    mean, stddev, max_over_mean = load_statistics(counts)
+    return f"Load with {num_servers} servers: mean {mean:.2f} keys, stddev {stddev:.2f}, max/mean {max_over_mean:.2f}"
 
-    max_server_id = i
 
+def format_ranges(ranges):
+    return [{"start": start, "end": end, "from": old_owner, "to": new_owner}
+            for start, end, old_owner, new_owner in ranges]
 
-def get_servers(keys):
-    result = {}
 
-    for key in keys:
-        server = consistent_responsible_server(key)
-        result[key] = server
+def summarize_change(output, balancer, num_keys, additional, show_load=False):
+    orig_length = balancer.count_servers()
+    key_digests = ring_assignment.hash_keys(num_keys, num_bits=balancer.num_bits, hash_name=balancer.hash_name)
 
-    return result
+    digests1, servers1 = balancer.assignment_arrays()
 
+    balancer.build_server_list(additional)
 
-def calculate_change(servers_orig, servers_appended):
-    return [changed for changed in servers_orig if servers_orig[changed] != servers_appended[changed]]
+    digests2, servers2 = balancer.assignment_arrays()
+
+    # Owner ids must be stable across both rings, so number the servers on both. An added
+    # server can take the point of a server on the first ring, which is then missing from
+    # the second. Servers with several virtual nodes appear once for each point
+    owner_ids = {}
+    for server in itertools.chain(servers1, servers2):
+        owner_ids.setdefault(server, len(owner_ids))
+    owners1 = np.array([owner_ids[server] for server in servers1])
+    owners2 = np.array([owner_ids[server] for server in servers2])
+
+    result1 = ring_assignment.consistent_assign(key_digests, digests1, owners1)
+    result2 = ring_assignment.consistent_assign(key_digests, digests2, owners2)
+    changes = ring_assignment.calculate_change(result1, result2)
+
+    print(f"\n A total of {changes} out of {num_keys} keys have changed hosts going from "
+          f"{orig_length} to {balancer.count_servers()} servers", file=output)
+
+    if show_load:
+        # Only count the servers on each ring
+        load1 = np.bincount(result1, minlength=len(owner_ids))[np.unique(owners1)]
+        load2 = np.bincount(result2, minlength=len(owner_ids))[np.unique(owners2)]
+        print(format_load(orig_length, load1.tolist()), file=output)
+        print(format_load(balancer.count_servers(), load2.tolist()), file=output)
 
 
 def config_parser():
@@ -69,8 +279,21 @@ def config_parser():
     parser.add_argument('num_keys', type=int, help='number of keys to build')
     parser.add_argument('--additional', '-a', type=int, default=1,
                         help='number of servers to add')
+    parser.add_argument('--num-bits', '-b', type=int, default=NUM_BITS,
+                        help='number of bits in the identifier space')
+    parser.add_argument('--hash', type=str, choices=HASH_FUNCTIONS.keys(), default=None,
+                        help='hash function to use. Defaults to md5, or sha1 for more than 128 bits')
     parser.add_argument('--no-formatting', action='store_true',
                         help='print raw data without formatting')
+    parser.add_argument('--vnodes-per-server', '-v', type=int, default=1,
+                        help='number of points (virtual nodes) to place on the ring for each server')
+    parser.add_argument('--load-statistics', '-l', action='store_true',
+                        help='print mean, standard deviation and max/mean of the number of keys per server')
+    parser.add_argument('--ranges', '-r', action='store_true',
+                        help='print the ranges of digests that changed hosts')
+    parser.add_argument('--summary', action='store_true',
+                        help='only print the number of keys that changed hosts. Keys are assigned '
+                             'with NumPy arrays rather than one at a time, so this scales to millions of keys')
 
     return parser
 
@@ -82,18 +305,27 @@ def main(output, args):
     num_servers = args.num_servers
     num_keys = args.num_keys
     additional = args.additional
+    show_load = args.load_statistics
+    show_ranges = args.ranges
     indent = None if args.no_formatting else 4
 
-    build_server_list(num_servers)
-    orig_length = len(servers)
+    balancer = ConsistentBalancer(args.num_bits, args.hash, args.vnodes_per_server)
+    balancer.build_server_list(num_servers)
+    orig_length = balancer.count_servers()
+
+    if args.summary:
+        summarize_change(output, balancer, num_keys, additional, show_load)
+        return
+
     keys = generate_keys(num_keys)
 
-    result1 = get_servers(keys)
+    result1 = balancer.get_servers(keys)
+    load1 = balancer.key_counts(result1.values())
 
     # Add a server
-    build_server_list(additional)
+    ranges = balancer.build_server_list(additional)
 
-    result2 = get_servers(keys)
+    result2 = balancer.get_servers(keys)
 
     # Calculate the number of changes
     changes = calculate_change(result1, result2)
@@ -102,12 +334,20 @@ def main(output, args):
     print(f"\nMapping of keys to server hosting key with {orig_length} servers:", file=output)
     print(json.dumps(result1, indent=indent, default=vars), file=output)
 
-    print(f"\nMapping of keys to server hosting key with {len(servers)} servers:", file=output)
+    print(f"\nMapping of keys to server hosting key with {balancer.count_servers()} servers:", file=output)
     print(json.dumps(result2, indent=indent, default=vars), file=output)
 
     print(f"\n A total of {len(changes)} out of {len(keys)} keys have changed hosts:", file=output)
     print(json.dumps(changes, indent=indent), file=output)
 
+    if show_ranges:
+        print(f"\nRanges of digests that changed hosts:", file=output)
+        print(json.dumps(format_ranges(ranges), indent=indent, default=vars), file=output)
+
+    if show_load:
+        print(f"\n{format_load(orig_length, load1.values())}", file=output)
+        print(format_load(balancer.count_servers(), balancer.key_counts(result2.values()).values()), file=output)
+
 
 if __name__ == "__main__":
     main(sys.stdout, sys.argv[1:])
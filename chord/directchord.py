@@ -5,23 +5,28 @@ This file contains the code for chord nodes before adding ZMQ.
 '''
 import argparse
 import json
+import math
+import random
 import statistics
 import logging
 import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 
 from sortedcontainers import SortedDict
-from hash import hash_value, NUM_BITS
-from util import generate_keys, open_closed, open_open
+from hash import hash_value, hash_values, NUM_BITS, HASH_FUNCTIONS
+from util import generate_keys, open_closed, open_open, finger_start
 
 
 class DirectNode:
 
-    def __init__(self, node_name, node_id):
+    def __init__(self, node_name, node_id, num_bits=NUM_BITS):
         self.name = node_name
         self.digest_id = node_id
+        self.num_bits = num_bits
         self.successor = self
         self.predecessor = None
-        self.fingers = [None] * NUM_BITS
+        self.fingers = [None] * num_bits
 
     def get_name(self):
         return self.name
@@ -38,32 +43,43 @@ class DirectNode:
     def init_fingers(self):
         logging.info(f"Building finger table for {self.name} (Digest: {self.digest_id})")
 
-        i = 0
-        next_key = (self.digest_id + pow(2, i)) % (pow(2, NUM_BITS) - 1)
-        while i < NUM_BITS:
+        for i in range(self.num_bits):
+            next_key = finger_start(self.digest_id, i, self.num_bits)
             self.fingers[i] = self.find_successor(next_key, 0)[0]
             logging.info(f"  Found finger {i} is successor({next_key}) = {self.fingers[i].get_id()}")
 
-            i += 1
-            next_key = (self.digest_id + pow(2, i)) % (pow(2, NUM_BITS) - 1)
-
     def find_successor(self, digest, hops):
-        if digest == self.digest_id:
-            return self, hops
+        """ Routes to the node responsible for `digest`, counting one hop per node visited
 
-        next_id = self.successor.get_id()
+        Routing follows find_next_node from node to node in a loop rather than recursing
+        once per hop, so long routes on large rings cannot exceed the recursion limit.
 
-        logging.debug(f"    Is id {digest} contained in ({self.digest_id}, {next_id}]?")
+        :param digest: digest to find the successor of
+        :param hops: hops taken before reaching this node
+        :return: successor node and total hops
+        """
+        debug = logging.getLogger().isEnabledFor(logging.DEBUG)
 
-        if open_closed(self.digest_id, next_id, digest):
+        node = self
+        while digest != node.digest_id:
+            next_id = node.successor.get_id()
 
-            logging.debug(f"      Yes, returning successor {next_id} hops: {hops}")
-            return self.successor, hops + 1
-        else:
+            if debug:
+                logging.debug(f"    Is id {digest} contained in ({node.digest_id}, {next_id}]?")
+
+            if open_closed(node.digest_id, next_id, digest):
+
+                if debug:
+                    logging.debug(f"      Yes, returning successor {next_id} hops: {hops}")
+                return node.successor, hops + 1
+            else:
+
+                if debug:
+                    logging.debug(f"      No, finding closest preceding node")
+                node = node.find_next_node(digest)
+                hops += 1
 
-            logging.debug(f"      No, finding closest preceding node")
-            next_node = self.find_next_node(digest)
-            return next_node.find_successor(digest, hops + 1)
+        return node, hops
 
     def find_next_node(self, digest):
         return self.successor
@@ -89,28 +105,35 @@ class DirectNode:
 
 class DirectChordNode(DirectNode):
 
-    def __init__(self, node_name, node_id):
-        super().__init__(node_name, node_id)
+    def __init__(self, node_name, node_id, num_bits=NUM_BITS):
+        super().__init__(node_name, node_id, num_bits)
 
     def find_next_node(self, digest):
         return self.closest_preceding_node(digest)
 
     def closest_preceding_node(self, digest):
+        debug = logging.getLogger().isEnabledFor(logging.DEBUG)
 
         for finger in reversed(self.fingers):
             if not finger:
                 continue
 
-            logging.debug(f"      Is {finger.get_id()} in ({self.digest_id, digest})?")
+            if debug:
+                logging.debug(f"      Is {finger.get_id()} in ({self.digest_id, digest})?")
             if open_open(self.digest_id, digest, finger.get_id()):
-                logging.debug(f"        Yes, returning finger {finger.get_id()}")
+                if debug:
+                    logging.debug(f"        Yes, returning finger {finger.get_id()}")
                 return finger
 
-        logging.debug(f"      Finger not found. Returning successor {self.successor.get_id()}")
+        if debug:
+            logging.debug(f"      Finger not found. Returning successor {self.successor.get_id()}")
         return self.successor
 
 
-def build_nodes(num_nodes, node_type, node_name_prefix="node"):
+NODE_TYPES = {node_type.__name__: node_type for node_type in [DirectNode, DirectChordNode]}
+
+
+def build_nodes(num_nodes, node_type, node_name_prefix="node", num_bits=NUM_BITS, hash_name=None):
     node_name_fmt = "{prefix}_{id}"
     nodes = SortedDict()
 
@@ -119,8 +142,8 @@ def build_nodes(num_nodes, node_type, node_name_prefix="node"):
     i = 0
     while len(nodes) < num_nodes:
         name = node_name_fmt.format(prefix=node_name_prefix, id=str(i))
-        digest = hash_value(name)
-        node = node_type(name, digest)
+        digest = hash_value(name, num_bits, hash_name)
+        node = node_type(name, digest, num_bits)
         nodes[digest] = node
         i += 1
 
@@ -141,14 +164,34 @@ def build_nodes(num_nodes, node_type, node_name_prefix="node"):
         # Set new prev node for next iteration
         prev_node = next_node
 
+    bulk_init_fingers(nodes)
     for node in nodes.values():
-        node.init_fingers()
         node.stabilize()
 
     return nodes
 
 
-def add_nodes(nodes_map, num_new, node_type):
+def bulk_init_fingers(nodes):
+    """ Fills every finger table directly from the sorted ring
+
+    Finger i of a node is the successor of (digest + 2^i) mod 2^m, which is the first node
+    at or after that identifier, wrapping around to the first node. Bisecting the sorted
+    digests finds it in O(log n) without routing, so the whole ring costs O(n m log n)
+    rather than O(n m hops). The result is the same as calling `init_fingers` on each node.
+
+    :param nodes: SortedDict of digest to node
+    """
+    ring = nodes.values()
+    num_nodes = len(nodes)
+
+    for node in ring:
+        node.fingers = [ring[nodes.bisect_left(finger_start(node.digest_id, i, node.num_bits)) % num_nodes]
+                        for i in range(node.num_bits)]
+
+    logging.info(f"Built finger tables for {num_nodes} nodes")
+
+
+def add_nodes(nodes_map, num_new, node_type, num_bits=NUM_BITS, hash_name=None):
     name_format = 'node_added_{id}'
     hashes = nodes_map.keys()
     nodes = nodes_map.values()
@@ -159,19 +202,27 @@ def add_nodes(nodes_map, num_new, node_type):
     while len(new_nodes) < num_new:
         # Create the node
         new_name = name_format.format(id=str(i))
-        new_digest = hash_value(new_name)
-        new_node = node_type(new_name, new_digest)
+        new_digest = hash_value(new_name, num_bits, hash_name)
+        i += 1
+
+        # Names may hash to the digest of a node already in the ring
+        if new_digest in nodes_map:
+            continue
+
+        # Join the network through a node already in it. The new node sorts first in
+        # `nodes` once inserted if its digest is the lowest
+        bootstrap = nodes[0]
+        new_node = node_type(new_name, new_digest, num_bits)
         new_nodes.append(new_node)
         nodes_map[new_digest] = new_node
 
-        # Join the network
-        new_node.join(nodes[0])
+        new_node.join(bootstrap)
         new_node.stabilize()
 
-        # Find previous node to stabilize
-        prev_digest = next(prev_digest
-                           for prev_digest in reversed(hashes)
-                           if prev_digest < new_digest)
+        # Find previous node to stabilize, wrapping around to the last node
+        prev_digest = next((prev_digest
+                            for prev_digest in reversed(hashes)
+                            if prev_digest < new_digest), hashes[-1])
         prev_node = nodes_map[prev_digest]
         prev_node.stabilize()
         prev_nodes.append(prev_node)
@@ -182,18 +233,104 @@ def add_nodes(nodes_map, num_new, node_type):
     return new_nodes, prev_nodes
 
 
-def run_experiment(nodes, keys):
+def run_experiment(nodes, keys, num_bits=NUM_BITS, hash_name=None):
     hops_tracker = []
     starting_node = nodes[0]
-    for key in keys:
-        logging.debug(f"Testing key {key}")
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+    for key, digest in zip(keys, hash_values(keys, num_bits, hash_name)):
+        if debug:
+            logging.debug(f"Testing key {key}")
 
-        node, hops = starting_node.find_successor(hash_value(key), 0)
+        node, hops = starting_node.find_successor(digest, 0)
         hops_tracker.append(hops)
 
     return statistics.mean(hops_tracker)
 
 
+def hop_histogram(nodes, digests, start_node='fixed', seed=0):
+    """ Number of lookups taking each number of hops
+
+    :param nodes: nodes in the ring, sorted by digest
+    :param digests: key digests to look up
+    :param start_node: 'fixed' starts every lookup at the first node, 'random' at a node chosen per lookup
+    :param seed: seed for choosing random start nodes
+    :return: Counter of hops to number of lookups
+    """
+    rng = random.Random(seed)
+    histogram = Counter()
+    for digest in digests:
+        node = nodes[0] if start_node == 'fixed' else nodes[rng.randrange(len(nodes))]
+        histogram[node.find_successor(digest, 0)[1]] += 1
+
+    return histogram
+
+
+def hop_histogram_worker(num_nodes, node_type_name, node_name_prefix, num_bits, hash_name, digests, start_node, seed):
+    # Rings are built deterministically from the node names, so each worker rebuilds
+    # the same ring rather than receiving it from the parent process
+    nodes = build_nodes(num_nodes, NODE_TYPES[node_type_name], node_name_prefix, num_bits, hash_name).values()
+    return hop_histogram(nodes, digests, start_node, seed)
+
+
+def run_parallel_experiment(num_nodes, keys, node_type, workers, node_name_prefix="node", num_bits=NUM_BITS,
+                            hash_name=None, start_node='fixed', seed=0):
+    """ Looks up keys in a ring of `num_nodes` nodes split across worker processes
+
+    Keys are split into one contiguous shard per worker. Shard i chooses random start
+    nodes with seed + i, so random starts depend on the number of workers.
+
+    :return: Counter of hops to number of lookups, merged over all workers
+    """
+    digests = hash_values(keys, num_bits, hash_name)
+    shard_size = max(1, math.ceil(len(digests) / workers))
+    shards = [digests[i:i + shard_size] for i in range(0, len(digests), shard_size)]
+
+    histogram = Counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(hop_histogram_worker, num_nodes, node_type.__name__, node_name_prefix, num_bits,
+                                   hash_name, shard, start_node, seed + i)
+                   for i, shard in enumerate(shards)]
+        for future in futures:
+            histogram.update(future.result())
+
+    return histogram
+
+
+def hop_statistics(histogram):
+    """ Mean, percentiles and maximum of a hop histogram
+
+    Percentiles use the nearest rank, so they are always a number of hops that occurred.
+
+    :param histogram: Counter of hops to number of lookups
+    :return: dictionary with mean, p50, p95, p99 and max, all None for an empty histogram
+    """
+    total = sum(histogram.values())
+    if not total:
+        return dict.fromkeys(["mean", "p50", "p95", "p99", "max"])
+
+    result = {"mean": sum(hops * count for hops, count in histogram.items()) / total}
+
+    hops_sorted = sorted(histogram)
+    for percentile in [50, 95, 99]:
+        rank = math.ceil(percentile / 100 * total)
+        seen = 0
+        for hops in hops_sorted:
+            seen += histogram[hops]
+            if seen >= rank:
+                result[f"p{percentile}"] = hops
+                break
+
+    result["max"] = hops_sorted[-1]
+    return result
+
+
+def format_hop_statistics(num_nodes, stats):
+    if stats['mean'] is None:
+        return f"Hops with {num_nodes} nodes: no lookups"
+    return f"Hops with {num_nodes} nodes: mean {stats['mean']}, p50 {stats['p50']}, p95 {stats['p95']}, " \
+           f"p99 {stats['p99']}, max {stats['max']}"
+
+
 def node_table(nodes):
     table = [{"id": node.get_id(), "name": node.get_name()} for node in nodes]
     return {"network": table}
@@ -232,8 +369,21 @@ def config_parser():
                         help='determines which finger tables to print if \'fingers\' is an action')
     parser.add_argument('--joining', '-j', type=int, default=1, metavar='NUM_JOINING',
                         help='number of servers to join original network if \'join\' is an action')
+    parser.add_argument('--num-bits', '-b', type=int, default=NUM_BITS,
+                        help='number of bits in the identifier space')
+    parser.add_argument('--hash', type=str, choices=HASH_FUNCTIONS.keys(), default=None,
+                        help='hash function to use. Defaults to md5, or sha1 for more than 128 bits')
     parser.add_argument('--no-formatting', action='store_true',
                         help='print raw data without formatting')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                        help='number of processes to split \'hops\' lookups across. Each process rebuilds the ring')
+    parser.add_argument('--start-node', choices=['fixed', 'random'], default='fixed',
+                        help='start \'hops\' lookups at the first node or at a random node for each key')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed for choosing random start nodes')
+    parser.add_argument('--hop-statistics', '-s', action='store_true',
+                        help='print the mean, 50th, 95th and 99th percentiles and maximum of hops if \'hops\' is '
+                             'an action')
 
     node_type_group = parser.add_mutually_exclusive_group()
     node_type_group.add_argument('--naive-nodes', action='store_const', const=DirectNode,
@@ -256,6 +406,8 @@ def main(output, args):
     action = args.action
     finger_tables = args.finger_tables
     num_joining = args.joining
+    num_bits = args.num_bits
+    hash_name = args.hash
     indent = None if args.no_formatting else 4
 
     # Retrieve first non None value
@@ -264,15 +416,24 @@ def main(output, args):
                      if node_type is not None)
 
     # Create data
-    nodes_map = build_nodes(num_nodes, node_type, node_name_prefix=node_prefix)
+    nodes_map = build_nodes(num_nodes, node_type, node_name_prefix=node_prefix, num_bits=num_bits,
+                            hash_name=hash_name)
     hashes = list(nodes_map.keys())
     nodes = nodes_map.values()
     keys = generate_keys(num_keys, key_prefix=key_prefix)
 
     # Perform actions
     if 'hops' in action:
-        avg_hops = run_experiment(nodes, keys)
-        print(f"Average hops with {len(nodes)} nodes is {avg_hops}", file=output)
+        if args.workers > 1:
+            histogram = run_parallel_experiment(num_nodes, keys, node_type, args.workers, node_prefix, num_bits,
+                                                hash_name, args.start_node, args.seed)
+        else:
+            histogram = hop_histogram(nodes, hash_values(keys, num_bits, hash_name), args.start_node, args.seed)
+
+        stats = hop_statistics(histogram)
+        print(f"Average hops with {len(nodes)} nodes is {stats['mean']}", file=output)
+        if args.hop_statistics:
+            print(format_hop_statistics(len(nodes), stats), file=output)
 
     if 'network' in action:
         print("Nodes in the network: ", file=output)
@@ -287,7 +448,7 @@ def main(output, args):
 
     if 'join' in action:
         print(f'Original node ids: {hashes}', file=output)
-        new, updated = add_nodes(nodes_map, num_joining, node_type)
+        new, updated = add_nodes(nodes_map, num_joining, node_type, num_bits, hash_name)
 
         print(f"\nFinger table(s) for new nodes:", file=output)
         for new_node in new:
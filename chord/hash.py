@@ -1,29 +1,246 @@
 """Hash function to use in chord algorithm
 
-Implemented using md5. All values are 1 byte, i.e., 0-255
+Implemented using md5 (sha1 for identifier spaces wider than 128 bits). By
+default all values are 1 byte, i.e., 0-255. Wider identifier spaces can be
+selected at runtime with the `num_bits` argument.
+
+Other hash functions can be selected by name from `HASH_FUNCTIONS`. Each entry
+maps the name to a function returning an integer digest of the encoded value and
+the number of bits that digest provides.
 """
+import argparse
 import hashlib
 import sys
 
 NUM_BITS = 8
+MAX_BITS = 160
+
+MASK_64 = pow(2, 64) - 1
+
+# Fixed key so SipHash digests are stable across processes
+SIPHASH_KEY = bytes(range(16))
+
+
+def md5(data):
+    return int.from_bytes(hashlib.md5(data).digest(), 'little')
+
+
+def sha1(data):
+    return int.from_bytes(hashlib.sha1(data).digest(), 'little')
+
+
+def blake2b(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=20).digest(), 'little')
+
+
+def fnv1a(data):
+    """ 64 bit FNV-1a (http://www.isthe.com/chongo/tech/comp/fnv/) """
+    digest = 0xcbf29ce484222325
+    for byte in data:
+        digest = ((digest ^ byte) * 0x100000001b3) & MASK_64
+    return digest
+
+
+def _rotl(value, bits):
+    return ((value << bits) | (value >> (64 - bits))) & MASK_64
+
+
+def siphash(data, key=SIPHASH_KEY):
+    """ SipHash-2-4 (https://www.aumasson.jp/siphash/siphash.pdf) """
+    k0 = int.from_bytes(key[:8], 'little')
+    k1 = int.from_bytes(key[8:], 'little')
+    v0 = k0 ^ 0x736f6d6570736575
+    v1 = k1 ^ 0x646f72616e646f6d
+    v2 = k0 ^ 0x6c7967656e657261
+    v3 = k1 ^ 0x7465646279746573
+
+    def sip_round():
+        nonlocal v0, v1, v2, v3
+        v0 = (v0 + v1) & MASK_64
+        v1 = _rotl(v1, 13) ^ v0
+        v0 = _rotl(v0, 32)
+        v2 = (v2 + v3) & MASK_64
+        v3 = _rotl(v3, 16) ^ v2
+        v0 = (v0 + v3) & MASK_64
+        v3 = _rotl(v3, 21) ^ v0
+        v2 = (v2 + v1) & MASK_64
+        v1 = _rotl(v1, 17) ^ v2
+        v2 = _rotl(v2, 32)
+
+    length = len(data)
+    end = length - length % 8
+    for i in range(0, end, 8):
+        m = int.from_bytes(data[i:i + 8], 'little')
+        v3 ^= m
+        sip_round()
+        sip_round()
+        v0 ^= m
+
+    m = ((length & 0xff) << 56) | int.from_bytes(data[end:], 'little')
+    v3 ^= m
+    sip_round()
+    sip_round()
+    v0 ^= m
+
+    v2 ^= 0xff
+    for _ in range(4):
+        sip_round()
+
+    return v0 ^ v1 ^ v2 ^ v3
+
+
+XXH_PRIME64_1 = 0x9E3779B185EBCA87
+XXH_PRIME64_2 = 0xC2B2AE3D27D4EB4F
+XXH_PRIME64_3 = 0x165667B19E3779F9
+XXH_PRIME64_4 = 0x85EBCA77C2B2AE63
+XXH_PRIME64_5 = 0x27D4EB2F165667C5
+
+
+def _xxh_round(acc, lane):
+    acc = (acc + lane * XXH_PRIME64_2) & MASK_64
+    return (_rotl(acc, 31) * XXH_PRIME64_1) & MASK_64
+
+
+def xxhash(data, seed=0):
+    """ XXH64 (https://github.com/Cyan4973/xxHash/blob/dev/doc/xxhash_spec.md) """
+    length = len(data)
+    i = 0
+
+    if length >= 32:
+        v1 = (seed + XXH_PRIME64_1 + XXH_PRIME64_2) & MASK_64
+        v2 = (seed + XXH_PRIME64_2) & MASK_64
+        v3 = seed
+        v4 = (seed - XXH_PRIME64_1) & MASK_64
+        while i <= length - 32:
+            v1 = _xxh_round(v1, int.from_bytes(data[i:i + 8], 'little'))
+            v2 = _xxh_round(v2, int.from_bytes(data[i + 8:i + 16], 'little'))
+            v3 = _xxh_round(v3, int.from_bytes(data[i + 16:i + 24], 'little'))
+            v4 = _xxh_round(v4, int.from_bytes(data[i + 24:i + 32], 'little'))
+            i += 32
+
+        digest = (_rotl(v1, 1) + _rotl(v2, 7) + _rotl(v3, 12) + _rotl(v4, 18)) & MASK_64
+        for v in (v1, v2, v3, v4):
+            digest ^= _xxh_round(0, v)
+            digest = (digest * XXH_PRIME64_1 + XXH_PRIME64_4) & MASK_64
+    else:
+        digest = (seed + XXH_PRIME64_5) & MASK_64
 
+    digest = (digest + length) & MASK_64
 
-def hash_value(value):
-    """ Computes the least significant byte of the md5 for the given input
+    while i <= length - 8:
+        digest ^= _xxh_round(0, int.from_bytes(data[i:i + 8], 'little'))
+        digest = (_rotl(digest, 27) * XXH_PRIME64_1 + XXH_PRIME64_4) & MASK_64
+        i += 8
+
+    if i <= length - 4:
+        digest ^= (int.from_bytes(data[i:i + 4], 'little') * XXH_PRIME64_1) & MASK_64
+        digest = (_rotl(digest, 23) * XXH_PRIME64_2 + XXH_PRIME64_3) & MASK_64
+        i += 4
+
+    while i < length:
+        digest ^= (data[i] * XXH_PRIME64_5) & MASK_64
+        digest = (_rotl(digest, 11) * XXH_PRIME64_1) & MASK_64
+        i += 1
+
+    digest ^= digest >> 33
+    digest = (digest * XXH_PRIME64_2) & MASK_64
+    digest ^= digest >> 29
+    digest = (digest * XXH_PRIME64_3) & MASK_64
+    digest ^= digest >> 32
+
+    return digest
+
+
+HASH_FUNCTIONS = {
+    'md5': (md5, 128),
+    'sha1': (sha1, 160),
+    'blake2b': (blake2b, 160),
+    'fnv1a': (fnv1a, 64),
+    'siphash': (siphash, 64),
+    'xxhash': (xxhash, 64),
+}
+
+
+def get_hash_function(num_bits=NUM_BITS, hash_name=None):
+    """ Looks up the hash function to use for a `num_bits` identifier space
+
+    :param num_bits: number of bits in the identifier space
+    :param hash_name: name of a hash function in `HASH_FUNCTIONS`. When not given, md5
+                      is used unless the identifier space is wider than 128 bits, in which
+                      case sha1 is used, as in the Chord paper.
+    :return: function taking bytes and returning an integer digest
+    """
+    if not 0 < num_bits <= MAX_BITS:
+        raise ValueError(f'Identifier space must be between 1 and {MAX_BITS} bits, got {num_bits}')
+
+    if hash_name is None:
+        hash_name = 'md5' if num_bits <= 128 else 'sha1'
+
+    if hash_name not in HASH_FUNCTIONS:
+        raise ValueError(f'Unknown hash function {hash_name}. Choose from {", ".join(HASH_FUNCTIONS)}')
+
+    hash_func, hash_bits = HASH_FUNCTIONS[hash_name]
+    if num_bits > hash_bits:
+        raise ValueError(f'{hash_name} provides {hash_bits} bits, cannot fill a {num_bits}-bit identifier space')
+
+    return hash_func
+
+
+def hash_value(value, num_bits=NUM_BITS, hash_name=None):
+    """ Computes the least significant `num_bits` bits of the md5 for the given input
 
     MD5 RFC specifies that the bytes are in little endian order
-    (https://datatracker.ietf.org/doc/html/rfc1321#section-2)
+    (https://datatracker.ietf.org/doc/html/rfc1321#section-2). With the default
+    of 8 bits this is the least significant byte of the md5 hash. Identifier
+    spaces wider than the 128 bits md5 provides use sha1, as in the Chord paper.
 
     :param value: value to hash
-    :return: the least significant byte of of the m5 hash of the input value
+    :param num_bits: number of bits in the identifier space
+    :param hash_name: name of the hash function in `HASH_FUNCTIONS` to use instead of md5
+    :return: the least significant `num_bits` bits of the hash of the input value
+    """
+    hash_func = get_hash_function(num_bits, hash_name)
+    return hash_func(value.encode('utf-8')) % ring_size(num_bits)
+
+
+def hash_values(values, num_bits=NUM_BITS, hash_name=None):
+    """ Computes `hash_value` for each value in a list
+
+    The hash function and ring size are resolved once for the whole list.
+
+    :param values: values to hash
+    :param num_bits: number of bits in the identifier space
+    :param hash_name: name of the hash function in `HASH_FUNCTIONS` to use instead of md5
+    :return: list of digests in the same order as the values
     """
-    md5_hash = hashlib.md5(value.encode('utf-8'))
-    return md5_hash.digest()[0]
+    hash_func = get_hash_function(num_bits, hash_name)
+    size = ring_size(num_bits)
+    return [hash_func(value.encode('utf-8')) % size for value in values]
+
+
+def ring_size(num_bits=NUM_BITS):
+    """ Number of identifiers in a `num_bits` bit identifier space """
+    return pow(2, num_bits)
+
+
+def config_parser():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('value', type=str, nargs='+', help='value to hash')
+    parser.add_argument('--num-bits', '-b', type=int, default=NUM_BITS,
+                        help='number of bits in the identifier space')
+    parser.add_argument('--hash', type=str, choices=HASH_FUNCTIONS.keys(), default=None,
+                        help='hash function to use. Defaults to md5, or sha1 for more than 128 bits')
+
+    return parser
 
 
 def main(output, args):
-    value = ' '.join(args)
-    print(f"Value \"{value}\" has digest \"{hash_value(value)}\"", file=output)
+    parser = config_parser()
+    args = parser.parse_args(args)
+
+    value = ' '.join(args.value)
+    print(f"Value \"{value}\" has digest \"{hash_value(value, args.num_bits, args.hash)}\"", file=output)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,135 @@
+"""Jump consistent hash load balancer
+
+Implements jump consistent hash (Lamping and Veach, https://arxiv.org/abs/1406.2294).
+Servers are numbered 0 to N - 1 and only need to be stored as a list, so the
+balancer uses O(1) memory beyond the servers themselves, and each lookup takes
+O(log N) steps. Servers can only be added or removed at the end of the list.
+"""
+import argparse
+import json
+import sys
+
+from util import generate_keys
+from hash import hash_value, hash_values, HASH_FUNCTIONS
+from server import Server
+
+# Jump hash operates on 64 bit keys
+JUMP_BITS = 64
+MASK_64 = pow(2, JUMP_BITS) - 1
+
+server_name_fmt = "server_{id}"
+
+
+def jump_hash(key_digest, num_buckets):
+    """ Maps a 64 bit key digest to a bucket in [0, num_buckets)
+
+    When the number of buckets grows from N to N + 1, only 1 / (N + 1) of the keys
+    move, and they all move to the new bucket.
+    """
+    bucket = -1
+    next_bucket = 0
+    while next_bucket < num_buckets:
+        bucket = next_bucket
+        key_digest = (key_digest * 2862933555777941757 + 1) & MASK_64
+        next_bucket = int((bucket + 1) * (float(1 << 31) / float((key_digest >> 33) + 1)))
+
+    return bucket
+
+
+class JumpBalancer:
+    """ Assigns each key to a server with jump consistent hash
+
+    Each balancer keeps its own list of servers, so several balancers can be used side by side.
+    """
+
+    def __init__(self, hash_name=None):
+        self.hash_name = hash_name
+
+        self.server_list = []
+
+    def responsible_server(self, key):
+        return self.digest_responsible_server(hash_value(key, JUMP_BITS, self.hash_name))
+
+    def digest_responsible_server(self, key_digest):
+        return self.server_list[jump_hash(key_digest, len(self.server_list))]
+
+    def build_server_list(self, num_servers):
+
+        curr_max = len(self.server_list)
+        for i in range(curr_max, curr_max + num_servers):
+            name = server_name_fmt.format(id=str(i))
+            self.server_list.append(Server(name))
+
+    def remove_server_list(self, num_servers):
+        # Jump hash buckets are numbered consecutively, so only the last servers can be removed
+        del self.server_list[len(self.server_list) - num_servers:]
+
+    def count_servers(self):
+        return len(self.server_list)
+
+    def get_servers(self, keys):
+        result = {}
+
+        for key, key_digest in zip(keys, hash_values(keys, JUMP_BITS, self.hash_name)):
+            server = self.digest_responsible_server(key_digest)
+            result[key] = server
+
+        return result
+
+
+def calculate_change(servers_orig, servers_appended):
+    return [changed for changed in servers_orig if servers_orig[changed] != servers_appended[changed]]
+
+
+def config_parser():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('num_servers', type=int, help='number of servers to build')
+    parser.add_argument('num_keys', type=int, help='number of keys to build')
+    parser.add_argument('--additional', '-a', type=int, default=1,
+                        help='number of servers to add')
+    parser.add_argument('--hash', type=str, choices=HASH_FUNCTIONS.keys(), default=None,
+                        help='hash function to use. Defaults to md5')
+    parser.add_argument('--no-formatting', action='store_true',
+                        help='print raw data without formatting')
+
+    return parser
+
+
+def main(output, args):
+    parser = config_parser()
+    args = parser.parse_args(args)
+
+    num_servers = args.num_servers
+    num_keys = args.num_keys
+    additional = args.additional
+    indent = None if args.no_formatting else 4
+
+    balancer = JumpBalancer(args.hash)
+    balancer.build_server_list(num_servers)
+    orig_length = balancer.count_servers()
+    keys = generate_keys(num_keys)
+
+    result1 = balancer.get_servers(keys)
+
+    # Add a server
+    balancer.build_server_list(additional)
+
+    result2 = balancer.get_servers(keys)
+
+    # Calculate the number of changes
+    changes = calculate_change(result1, result2)
+
+    # Print results
+    print(f"\nMapping of keys to server hosting key with {orig_length} servers:", file=output)
+    print(json.dumps(result1, indent=indent, default=vars), file=output)
+
+    print(f"\nMapping of keys to server hosting key with {balancer.count_servers()} servers:", file=output)
+    print(json.dumps(result2, indent=indent, default=vars), file=output)
+
+    print(f"\n A total of {len(changes)} out of {len(keys)} keys have changed hosts:", file=output)
+    print(json.dumps(changes, indent=indent), file=output)
+
+
+if __name__ == "__main__":
+    main(sys.stdout, sys.argv[1:])
@@ -0,0 +1,126 @@
+"""Merkle trees over the keys of one arc of the ring
+
+An owner and each of its replicas keep a `MerkleTree` over the copies of the
+owner's keys, so they can find out which keys they disagree on without sending
+every key (see `replication`). The arc `(start, end]` is split into
+`2 ** TREE_DEPTH` buckets of equal width, which are the leaves of the tree. The
+hash of a leaf is the XOR of a hash of the key and version of every key in its
+bucket, so a write changes it in constant time. Each inner node hashes its two
+children, and is only hashed again when it is read after a write below it.
+
+Nodes are numbered like a binary heap: the root is 1 and the children of node
+`i` are `2 * i` and `2 * i + 1`, so the leaves are `2 ** TREE_DEPTH` up to
+`2 ** (TREE_DEPTH + 1) - 1`. Two trees over the same arc are compared from the
+root down. Subtrees with the same hash hold the same versions of the same keys
+and are skipped, and each round trip descends `TREE_STEP` levels below the nodes
+that differ.
+"""
+import hashlib
+
+# Levels below the root. An arc is split into 2 ** TREE_DEPTH buckets
+TREE_DEPTH = 12
+
+# Levels a comparison descends below the nodes that differ in one round trip
+TREE_STEP = 6
+
+# Bytes in the hash of a node
+HASH_SIZE = 8
+
+
+def entry_hash(key, version):
+    return int.from_bytes(hashlib.blake2b(key.encode() + version.to_bytes(8, 'big'), digest_size=HASH_SIZE).digest(),
+                          'big')
+
+
+def node_hash(left, right):
+    if not left and not right:
+        # Empty subtrees hash to 0, so they stay cheap to compare and update
+        return 0
+    data = left.to_bytes(HASH_SIZE, 'big') + right.to_bytes(HASH_SIZE, 'big')
+    return int.from_bytes(hashlib.blake2b(data, digest_size=HASH_SIZE).digest(), 'big')
+
+
+class MerkleTree:
+    """ Hashes of the versions of the keys with digests in `(start, end]`
+
+    The whole ring is covered if `start` equals `end`.
+    """
+
+    def __init__(self, start, end, num_bits):
+        self.start = start
+        self.end = end
+        self.num_bits = num_bits
+        self.length = (end - start) % 2 ** num_bits or 2 ** num_bits
+        self.depth = TREE_DEPTH
+        self.leaves = 2 ** self.depth
+        self.hashes = [0] * (2 * self.leaves)
+
+        # Keys in each leaf that holds any, and leaves written since the inner nodes were last hashed
+        self.buckets = {}
+        self.changed = set()
+
+    def covers(self, digest):
+        return (digest - self.start - 1) % 2 ** self.num_bits < self.length
+
+    def leaf(self, digest):
+        """ :return: index of the leaf of a digest the tree covers """
+        return self.leaves + (digest - self.start - 1) % 2 ** self.num_bits * self.leaves // self.length
+
+    def update(self, key, digest, old_version, new_version):
+        """ Replaces the version of a key, where a version of 0 means the key is not stored """
+        if not self.covers(digest) or old_version == new_version:
+            return
+
+        leaf = self.leaf(digest)
+        bucket = self.buckets.setdefault(leaf, set())
+        if old_version:
+            self.hashes[leaf] ^= entry_hash(key, old_version)
+            bucket.discard(key)
+        if new_version:
+            self.hashes[leaf] ^= entry_hash(key, new_version)
+            bucket.add(key)
+        if not bucket:
+            del self.buckets[leaf]
+        self.changed.add(leaf)
+
+    def refresh(self):
+        """ Hashes the inner nodes above the leaves written since the last refresh, one level at a time """
+        level = {leaf // 2 for leaf in self.changed}
+        self.changed.clear()
+        while level:
+            for index in level:
+                self.hashes[index] = node_hash(self.hashes[2 * index], self.hashes[2 * index + 1])
+            level = {index // 2 for index in level if index > 1}
+
+    def hash(self, index):
+        if self.changed:
+            self.refresh()
+        return self.hashes[index]
+
+    def root(self):
+        return [(1, self.hash(1))]
+
+    def is_leaf(self, index):
+        return index >= self.leaves
+
+    def differing(self, nodes):
+        """ :param nodes: (index, hash) of nodes of another tree over the same arc
+            :return: indices of the nodes whose hash differs in this tree. Indices outside
+                     the tree are skipped
+        """
+        return [index for index, node in nodes if 0 < index < len(self.hashes) and self.hash(index) != node]
+
+    def expand(self, indices):
+        """ :return: (index, hash) of the nodes `TREE_STEP` levels below each inner node in
+                     `indices`, or of the leaves below it if they are closer
+        """
+        nodes = []
+        for index in indices:
+            if not self.is_leaf(index):
+                levels = min(TREE_STEP, self.depth - (index.bit_length() - 1))
+                nodes += [(child, self.hash(child)) for child in range(index << levels, (index + 1) << levels)]
+        return nodes
+
+    def keys(self, leaves):
+        """ :return: keys in the buckets of `leaves` """
+        return [key for leaf in leaves for key in self.buckets.get(leaf, ())]
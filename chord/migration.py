@@ -0,0 +1,217 @@
+"""Migration planner for consistent hashing membership changes
+
+Given a ring of server points before and after servers join or leave, finds the
+arcs of the ring whose owner changed without looking at any keys. An arc is a
+(start, end, old_owner, new_owner) tuple: digests in (start, end] move from
+old_owner to new_owner. When start == end the arc is the whole ring. An owner is
+None when its ring has no servers.
+
+Only the arcs ending at points that were added, removed or reassigned can change
+owner, so planning costs O(changed points * log n). The keys to move can then be
+streamed from any iterable of keys, one at a time.
+"""
+import argparse
+import bisect
+import json
+import sys
+
+from sortedcontainers import SortedList
+
+import consistent_load_balancer
+from hash import hash_value, ring_size, NUM_BITS, HASH_FUNCTIONS
+from util import generate_keys, open_closed
+
+
+def changed_points(before, after):
+    """ Points that were added, removed or given a different owner
+
+    Compares every point, so this is O(n). Callers that know which servers changed
+    should pass those servers' points to `plan_migration` instead.
+
+    :param before: ring of digest to server before the change
+    :param after: ring of digest to server after the change
+    :return: list of changed digests
+    """
+    points = [point for point in before if after.get(point) != before[point]]
+    points += [point for point in after if point not in before]
+    return points
+
+
+def server_points(before, after):
+    """ Points of the servers that joined or left
+
+    Points taken from a server that stays on the ring belong to a server that
+    joined, so these are all of the points that can change owner.
+
+    :param before: dictionary of server name to points before the change
+    :param after: dictionary of server name to points after the change
+    :return: list of digests
+    """
+    points = [point for name in before.keys() - after.keys() for point in before[name]]
+    points += [point for name in after.keys() - before.keys() for point in after[name]]
+    return points
+
+
+def owner(ring, digest):
+    """ Server hosting `digest` on a sorted ring, or None if the ring is empty """
+    if not ring:
+        return None
+
+    index = ring.bisect_left(digest) % len(ring)
+    return ring.peekitem(index)[1]
+
+
+def predecessor(ring, digest):
+    """ Largest point on the ring less than `digest`, wrapping around, or None if the ring is empty """
+    if not ring:
+        return None
+
+    return ring.peekitem(ring.bisect_left(digest) - 1)[0]
+
+
+def plan_migration(before, after, points=None):
+    """ Arcs of the ring that change owner going from `before` to `after`
+
+    Every point that is the same on both rings owns the same keys on both rings, so
+    only the arcs ending at changed points can move. Each changed point is looked up
+    on both rings, and neighbouring arcs with the same owners are merged.
+
+    :param before: SortedDict of digest to server before the change
+    :param after: SortedDict of digest to server after the change
+    :param points: digests that changed between the rings. Found with `changed_points` if not given
+    :return: list of (start, end, old_owner, new_owner) arcs sorted by end
+    """
+    if points is None:
+        points = changed_points(before, after)
+
+    arcs = []
+    for point in SortedList(points):
+        old_owner = owner(before, point)
+        new_owner = owner(after, point)
+        if old_owner == new_owner:
+            continue
+
+        # The arc starts at the closest point before this one on either ring
+        start = closest_predecessor(point, [predecessor(before, point), predecessor(after, point)])
+
+        if arcs and arcs[-1][1] == start and arcs[-1][2:] == (old_owner, new_owner):
+            arcs[-1] = (arcs[-1][0], point, old_owner, new_owner)
+        else:
+            arcs.append((start, point, old_owner, new_owner))
+
+    # The last arc may continue into the first one across zero. Keep the merged arc
+    # first so the arcs stay sorted by end
+    if len(arcs) > 1 and arcs[0][0] == arcs[-1][1] and arcs[0][2:] == arcs[-1][2:]:
+        last = arcs.pop()
+        arcs[0] = (last[0], arcs[0][1], last[2], last[3])
+
+    return arcs
+
+
+def closest_predecessor(point, candidates):
+    """ The candidate closest to `point` going counterclockwise
+
+    Candidates less than `point` are closer than any that wrap around zero. A candidate
+    equal to `point` is a full turn away.
+    """
+    candidates = [candidate for candidate in candidates if candidate is not None]
+    below = [candidate for candidate in candidates if candidate < point]
+    return max(below) if below else max(candidates)
+
+
+def find_arc(arcs, ends, digest):
+    """ The arc containing `digest`, or None
+
+    :param arcs: disjoint arcs sorted by end, e.g. from `plan_migration`
+    :param ends: end of each arc
+    :param digest: key digest
+    """
+    if not arcs:
+        return None
+
+    # Digests past the last end can only be in the arc wrapping around zero
+    arc = arcs[bisect.bisect_left(ends, digest) % len(arcs)]
+    return arc if open_closed(arc[0], arc[1], digest) else None
+
+
+def affected_keys(arcs, keys, num_bits=NUM_BITS, hash_name=None):
+    """ Lazily yields the keys that have to move
+
+    Keys are hashed one at a time as they are read, so `keys` can be any iterable,
+    including a generator reading keys from storage.
+
+    :param arcs: arcs from `plan_migration`
+    :param keys: iterable of keys
+    :return: generator of (key, old_owner, new_owner)
+    """
+    ends = [end for _, end, _, _ in arcs]
+    for key in keys:
+        arc = find_arc(arcs, ends, hash_value(key, num_bits, hash_name))
+        if arc is not None:
+            yield key, arc[2], arc[3]
+
+
+def arc_length(start, end, num_bits=NUM_BITS):
+    """ Number of digests in (start, end] """
+    return (end - start - 1) % ring_size(num_bits) + 1
+
+
+def ring_fraction(arcs, num_bits=NUM_BITS):
+    """ Fraction of the identifier space that changes owner, the expected fraction of keys to move """
+    return sum(arc_length(start, end, num_bits) for start, end, _, _ in arcs) / ring_size(num_bits)
+
+
+def format_arcs(arcs):
+    return [{"start": start, "end": end, "from": old_owner, "to": new_owner}
+            for start, end, old_owner, new_owner in arcs]
+
+
+def config_parser():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('num_servers', type=int, help='number of servers to build')
+    parser.add_argument('num_keys', type=int, help='number of keys to check')
+    parser.add_argument('--additional', '-a', type=int, default=0,
+                        help='number of servers to add')
+    parser.add_argument('--remove', '-r', type=int, default=0,
+                        help='number of the original servers to remove')
+    parser.add_argument('--num-bits', '-b', type=int, default=NUM_BITS,
+                        help='number of bits in the identifier space')
+    parser.add_argument('--hash', type=str, choices=HASH_FUNCTIONS.keys(), default=None,
+                        help='hash function to use. Defaults to md5, or sha1 for more than 128 bits')
+    parser.add_argument('--vnodes-per-server', '-v', type=int, default=1,
+                        help='number of points (virtual nodes) to place on the ring for each server')
+    parser.add_argument('--no-formatting', action='store_true',
+                        help='print raw data without formatting')
+
+    return parser
+
+
+def main(output, args):
+    parser = config_parser()
+    args = parser.parse_args(args)
+
+    indent = None if args.no_formatting else 4
+
+    balancer = consistent_load_balancer.ConsistentBalancer(args.num_bits, args.hash, args.vnodes_per_server)
+    balancer.build_server_list(args.num_servers)
+    before = balancer.servers.copy()
+    before_points = {name: list(points) for name, points in balancer.points.items()}
+
+    balancer.remove_server_list(args.remove)
+    balancer.build_server_list(args.additional)
+
+    # Only the points of servers that joined or left can change owner
+    arcs = plan_migration(before, balancer.servers, server_points(before_points, balancer.points))
+    moved = sum(1 for _ in affected_keys(arcs, generate_keys(args.num_keys), args.num_bits, args.hash))
+
+    print(f"\nArcs that change hosts going from {args.num_servers} to {balancer.count_servers()} servers:",
+          file=output)
+    print(json.dumps(format_arcs(arcs), indent=indent, default=vars), file=output)
+
+    print(f"\n{len(arcs)} arcs cover {ring_fraction(arcs, args.num_bits):.4f} of the ring. "
+          f"{moved} out of {args.num_keys} keys have to move", file=output)
+
+
+if __name__ == "__main__":
+    main(sys.stdout, sys.argv[1:])
@@ -5,41 +5,81 @@ import argparse
 import json
 import sys
 
+import numpy as np
+
+import ring_assignment
 from util import generate_keys
-from hash import hash_value
+from hash import hash_value, hash_values, NUM_BITS, HASH_FUNCTIONS
 from server import Server
 
 
 server_name_fmt = "server_{id}"
-server_list = []
 
 
-def responsible_server(key):
-    return server_list[hash_value(key) % len(server_list)]
+class ModNBalancer:
+    """ Assigns each key to the server at index digest mod N
+
+    Each balancer keeps its own list of servers, so several balancers can be used side
+    by side. Changing N moves almost every key, so unlike `ConsistentBalancer` there is
+    no cheap description of the keys that change servers.
+    """
+
+    def __init__(self, num_bits=NUM_BITS, hash_name=None):
+        self.num_bits = num_bits
+        self.hash_name = hash_name
+
+        self.server_list = []
 
+    def responsible_server(self, key):
+        return self.digest_responsible_server(hash_value(key, self.num_bits, self.hash_name))
 
-def build_server_list(num_servers):
+    def digest_responsible_server(self, key_digest):
+        return self.server_list[key_digest % len(self.server_list)]
 
-    curr_max = len(server_list)
-    for i in range(curr_max, curr_max + num_servers):
-        name = server_name_fmt.format(id=str(i))
-        server_list.append(Server(name))
+    def build_server_list(self, num_servers):
 
+        curr_max = len(self.server_list)
+        for i in range(curr_max, curr_max + num_servers):
+            name = server_name_fmt.format(id=str(i))
+            self.server_list.append(Server(name))
 
-def get_servers(keys):
-    result = {}
+    def remove_server_list(self, num_servers):
+        # Remove the most recently added servers
+        del self.server_list[len(self.server_list) - num_servers:]
 
-    for key in keys:
-        server = responsible_server(key)
-        result[key] = server
+    def count_servers(self):
+        return len(self.server_list)
 
-    return result
+    def get_servers(self, keys):
+        result = {}
+
+        for key, key_digest in zip(keys, hash_values(keys, self.num_bits, self.hash_name)):
+            server = self.digest_responsible_server(key_digest)
+            result[key] = server
+
+        return result
 
 
 def calculate_change(servers_orig, servers_appended):
     return [changed for changed in servers_orig if servers_orig[changed] != servers_appended[changed]]
 
 
+def summarize_change(output, balancer, num_keys, additional):
+    orig_length = balancer.count_servers()
+    key_digests = ring_assignment.hash_keys(num_keys, num_bits=balancer.num_bits, hash_name=balancer.hash_name)
+
+    # Servers are only ever appended, so a server's index in the list identifies it
+    result1 = ring_assignment.modn_assign(key_digests, np.arange(orig_length))
+
+    balancer.build_server_list(additional)
+
+    result2 = ring_assignment.modn_assign(key_digests, np.arange(balancer.count_servers()))
+    changes = ring_assignment.calculate_change(result1, result2)
+
+    print(f"\n A total of {changes} out of {num_keys} keys have changed hosts going from "
+          f"{orig_length} to {balancer.count_servers()} servers", file=output)
+
+
 def config_parser():
     parser = argparse.ArgumentParser()
 
@@ -47,8 +87,15 @@ def config_parser():
     parser.add_argument('num_keys', type=int, help='number of keys to build')
     parser.add_argument('--additional', '-a', type=int, default=1,
                         help='number of servers to add')
+    parser.add_argument('--num-bits', '-b', type=int, default=NUM_BITS,
+                        help='number of bits in the identifier space')
+    parser.add_argument('--hash', type=str, choices=HASH_FUNCTIONS.keys(), default=None,
+                        help='hash function to use. Defaults to md5, or sha1 for more than 128 bits')
     parser.add_argument('--no-formatting', action='store_true',
                         help='print raw data without formatting')
+    parser.add_argument('--summary', action='store_true',
+                        help='only print the number of keys that changed hosts. Keys are assigned '
+                             'with NumPy arrays rather than one at a time, so this scales to millions of keys')
 
     return parser
 
@@ -62,16 +109,22 @@ def main(output, args):
     additional = args.additional
     indent = None if args.no_formatting else 4
 
-    build_server_list(num_servers)
-    orig_length = len(server_list)
+    balancer = ModNBalancer(args.num_bits, args.hash)
+    balancer.build_server_list(num_servers)
+    orig_length = balancer.count_servers()
+
+    if args.summary:
+        summarize_change(output, balancer, num_keys, additional)
+        return
+
     keys = generate_keys(num_keys)
 
-    result1 = get_servers(keys)
+    result1 = balancer.get_servers(keys)
 
     # Add a server
-    build_server_list(additional)
+    balancer.build_server_list(additional)
 
-    result2 = get_servers(keys)
+    result2 = balancer.get_servers(keys)
 
     # Calculate the number of changes
     changes = calculate_change(result1, result2)
@@ -80,7 +133,7 @@ def main(output, args):
     print(f"\nMapping of keys to server hosting key with {orig_length} servers:", file=output)
     print(json.dumps(result1, indent=indent, default=vars), file=output)
 
-    print(f"\nMapping of keys to server hosting key with {len(server_list)} servers:", file=output)
+    print(f"\nMapping of keys to server hosting key with {balancer.count_servers()} servers:", file=output)
     print(json.dumps(result2, indent=indent, default=vars), file=output)
 
     print(f"\n A total of {len(changes)} out of {len(keys)} keys have changed hosts:", file=output)
@@ -1,35 +1,91 @@
 import argparse
+import itertools
 import logging
-import pprint
-import struct
-import threading
 import time
-import random
 from urllib.parse import urlparse
 
 import zmq
 
-from util import open_closed, open_open
-from hash import NUM_BITS, hash_value
+import wire
+from connections import ConnectionManager
+from replication import Consistency, Quorum, ANTI_ENTROPY_ROUNDS, WRITE, READ, TREE
+from store import Store, GET, PUT, DELETE, OK, NOT_FOUND, UNAVAILABLE, INVALID
+from transfer import OutgoingTransfer, IncomingTransfer, TransferStats, CHUNK_KEYS
+from util import open_closed, open_open, finger_start
+from hash import NUM_BITS, HASH_FUNCTIONS, hash_value
 
 # -----------------------------------------------------------------------------
 # Networked Chord Implementation
 # -----------------------------------------------------------------------------
 
-# Define milliseconds PAIR sockets should wait for main thread to acknowledge
-# command is complete
+# Milliseconds stabilize and fix fingers wait for the commands they start to complete
 STABILIZE_WAIT = 1000
 FIX_FINGERS_WAIT = 1000
 
+# Milliseconds to wait for a new connection before the event loop is running
+CONNECT_WAIT = 5000
+
+# Number of nodes following each virtual node that it keeps track of. A virtual node
+# loses its place in the ring only if all of them fail before the next stabilize
+SUCCESSOR_LIST_LENGTH = 3
+
+# Stabilize requests a successor can leave unanswered in a row before it is treated as failed
+MAX_MISSED_REPLIES = 3
+
+# Milliseconds a message can stay queued for a peer before the peer is treated as failed
+FORWARD_WAIT = 1000
+
+# Milliseconds a node that is shutting down waits for its keys to reach its successors
+LEAVE_WAIT = 10000
+
+# Milliseconds between checks for stalled transfers while a node is leaving
+LEAVE_POLL = 100
+
+
+def routing_identity(digest):
+    # ZMQ identities are limited to 255 bytes and may not start with a zero byte, so
+    # the decimal digest is used rather than a fixed width integer. This supports
+    # digests from any identifier space up to hash.MAX_BITS
+    return str(digest).encode('ascii')
+
 
 class VirtualNode:
 
-    def __init__(self, name, digest, parent_digest, endpoint):
+    def __init__(self, name, digest, parent_digest, endpoint, num_bits=NUM_BITS,
+                 num_successors=SUCCESSOR_LIST_LENGTH):
         self.name = name
+        self.num_bits = num_bits
+        self.num_successors = num_successors
         self.routing_info = RoutingInfo(digest, parent_digest, endpoint)
-        self.successor = self.routing_info
+        self.successor_list = [self.routing_info]
         self.predecessor = self.routing_info
-        self.fingers = [None] * NUM_BITS
+        self.fingers = [None] * num_bits
+        self.missed_replies = 0
+        self.store = Store()
+
+        # Keys being handed to and received from other virtual nodes. Keys written here
+        # while a transfer comes in are kept in `written` so older values do not replace them
+        self.outgoing = None
+        self.incoming = {}
+        self.written = set()
+
+        # Copies of the keys of the virtual nodes before this one, by the digest of their owner
+        self.replicas = {}
+
+    @property
+    def successor(self):
+        return self.successor_list[0]
+
+    @successor.setter
+    def successor(self, other):
+        # Entries past the new successor are still the nodes that follow it. Entries
+        # before it were skipped, e.g. because they failed, and are dropped
+        if other == self.successor:
+            return
+
+        following = [entry for entry in self.successor_list
+                     if open_open(other.digest, self.routing_info.digest, entry.digest)]
+        self.successor_list = ([other] + following)[:self.num_successors]
 
     def get_digest(self):
         return self.routing_info.get_digest()
@@ -40,6 +96,10 @@ class VirtualNode:
     def get_address(self):
         return self.routing_info.get_address()
 
+    def next_finger_key(self):
+        for i in range(self.num_bits):
+            yield finger_start(self.get_digest(), i, self.num_bits)
+
     def find_successor(self, digest, hops):
         if digest == self.routing_info.digest:
             return True, self.routing_info, hops
@@ -62,6 +122,70 @@ class VirtualNode:
     def find_next_node(self, digest):
         return self.successor
 
+    def store_target(self, key, digest, operation):
+        """ Finds where an operation on a key belongs while keys move between virtual nodes
+
+        :return: RoutingInfo of the virtual node to forward the operation to, or None to
+                 apply it here
+        """
+        if self.outgoing and self.outgoing.leaving:
+            return self.outgoing.target
+        if not self.owns(digest):
+            return self.predecessor
+        if operation == GET and key not in self.store and key not in self.written:
+            # The key may not have arrived yet
+            return next((transfer.sender for transfer in self.receiving()), None)
+        return None
+
+    def owns(self, digest):
+        """ Whether the key with `digest` belongs to this virtual node
+
+        Once a node that is leaving starts to hand over its keys, they belong to the
+        virtual node receiving them.
+        """
+        if not self.predecessor or open_closed(self.predecessor.digest, self.routing_info.digest, digest):
+            return True
+
+        return any(open_closed(transfer.predecessor.digest, self.routing_info.digest, digest)
+                   for transfer in self.receiving() if transfer.leaving and transfer.predecessor)
+
+    def receiving(self):
+        """ :return: incoming transfers that have not completed, after dropping those that stopped """
+        expired = [sender for sender, transfer in self.incoming.items() if transfer.expired()]
+        for sender in expired:
+            logging.warning(f'Node {self.routing_info.digest} gave up on the transfer from {sender}')
+            del self.incoming[sender]
+
+        active = [transfer for transfer in self.incoming.values() if not transfer.complete]
+        if expired and not active:
+            self.written.clear()
+        return active
+
+    def newest_entry(self, key):
+        """ :return: newest copy of `key` held as owner or replica, as (digest, value, version), or None """
+        entries = [store.entries[key] for store in [self.store, *self.replicas.values()] if key in store]
+        return max(entries, key=lambda entry: entry[2], default=None)
+
+    def arc_tree(self):
+        """ :return: MerkleTree of the keys in the arc this virtual node owns """
+        start = self.predecessor.digest if self.predecessor else self.routing_info.digest
+        return self.store.track(start, self.routing_info.digest, self.num_bits)
+
+    def promote_replicas(self):
+        """ Takes over the copies of keys that belong to this virtual node, e.g. after its predecessor failed
+
+        :return: number of keys taken over
+        """
+        promoted = 0
+        for owner, store in list(self.replicas.items()):
+            for key, (digest, value, version) in list(store.entries.items()):
+                if self.owns(digest):
+                    promoted += self.store.put(key, digest, value, version) is not None
+                    store.remove(key)
+            if not store:
+                del self.replicas[owner]
+        return promoted
+
     def notify(self, other):
         logging.debug(f'Node {self.routing_info.digest} notified by node {other.digest}')
         if not self.predecessor \
@@ -74,6 +198,60 @@ class VirtualNode:
                 open_open(self.routing_info.digest, self.successor.digest, other.digest):
             self.successor = other
 
+    def update_successor_list(self, successor, successors):
+        """ Rebuilds the successor list from the list of the successor
+
+        :param successor: the successor that sent its list
+        :param successors: successor list of `successor`
+        """
+        if successor != self.successor:
+            # The successor changed while its list was on the way
+            return
+
+        self.missed_replies = 0
+        successor_list = [successor]
+        for entry in successors:
+            # Stop when the list wraps around to this node in rings smaller than the list
+            if entry.digest == self.routing_info.digest or entry in successor_list:
+                break
+            successor_list.append(entry)
+
+        self.successor_list = successor_list[:self.num_successors]
+
+    def successor_missed(self, successor):
+        """ Counts a stabilize request that `successor` did not answer
+
+        The successor is removed once it misses MAX_MISSED_REPLIES requests in a row,
+        so one slow reply does not cost the node its successor.
+        """
+        if successor != self.successor:
+            return
+
+        self.missed_replies += 1
+        if self.missed_replies >= MAX_MISSED_REPLIES:
+            self.remove_failed(successor)
+
+    def remove_failed(self, failed):
+        """ Fails over to the next entry in the successor list and forgets every link to `failed` """
+        logging.info(f'Node {self.routing_info.digest} removing failed node {failed.digest}')
+
+        successor_list = [entry for entry in self.successor_list if entry.digest != failed.digest]
+        if not successor_list:
+            # Making this node its own successor would split it off from the ring. Fall
+            # back to the closest finger or the predecessor, or keep the failed successor
+            # if there is nothing else
+            fallback = next((link for link in self.fingers + [self.predecessor]
+                             if link and link.digest not in (failed.digest, self.routing_info.digest)), None)
+            successor_list = [fallback] if fallback else self.successor_list
+
+        if successor_list[0] != self.successor:
+            self.missed_replies = 0
+        self.successor_list = successor_list
+
+        self.fingers = [None if finger and finger.digest == failed.digest else finger for finger in self.fingers]
+        if self.predecessor and self.predecessor.digest == failed.digest:
+            self.predecessor = None
+
 
 class ChordVirtualNode(VirtualNode):
 
@@ -91,6 +269,13 @@ class ChordVirtualNode(VirtualNode):
                 logging.debug(f"        Yes, returning finger {finger.digest}")
                 return finger
 
+        # Without a usable finger, the furthest entry in the successor list still
+        # skips over nodes that are closer
+        for entry in reversed(self.successor_list):
+            if open_open(self.routing_info.digest, digest, entry.digest):
+                logging.debug(f"        Returning successor list entry {entry.digest}")
+                return entry
+
         logging.debug(f"      Finger not found. Returning successor {self.successor.digest}")
         return self.successor
 
@@ -125,16 +310,33 @@ class RoutingInfo:
 
 
 class Node:
+    """ Networked chord node: its sockets, virtual nodes and the commands it handles
+
+    `async_node.AsyncNode` runs a node, handling commands and running stabilize and
+    fix fingers on an asyncio event loop.
+    """
 
-    def __init__(self, node_name, node_id, address, external_port=None, internal_port=None, virtual={}):
+    def __init__(self, node_name, node_id, address, external_port=None, internal_port=None, virtual={},
+                 num_bits=NUM_BITS, num_successors=SUCCESSOR_LIST_LENGTH, hash_name=None, consistency=None):
         endpoint_fmt = '{0}:{1}'
 
         # Node identification
         self.name = node_name
         self.digest_id = node_id
+        self.num_bits = num_bits
+        self.num_successors = num_successors
+
+        # Hash function for the keys clients store
+        self.hash_name = hash_name
+
+        # Replicas are found in the successor lists, so there cannot be more of them than successors
+        self.consistency = consistency or Consistency()
+        if self.consistency.replicas - 1 > num_successors:
+            raise ValueError(f'{self.consistency.replicas} replicas need at least '
+                             f'{self.consistency.replicas - 1} successors, not {num_successors}')
 
         # ZMQ sockets
-        self.context = zmq.Context()
+        self.context = self.create_context()
         self.router = self.context.socket(zmq.ROUTER)
         self.router.setsockopt(zmq.LINGER, 0)
 
@@ -145,7 +347,7 @@ class Node:
             port = self.router.bind_to_random_port(address)
             self.external_endpoint = endpoint_fmt.format(address, port)
 
-        identity = struct.pack('i', self.digest_id)
+        identity = routing_identity(self.digest_id)
         self.receiver = self.context.socket(zmq.DEALER)
         self.receiver.setsockopt(zmq.LINGER, 0)
         self.receiver.setsockopt(zmq.IDENTITY, identity)
@@ -157,27 +359,42 @@ class Node:
             port = self.receiver.bind_to_random_port(address)
             self.internal_endpoint = endpoint_fmt.format(address, port)
 
+        # Stabilize and fix fingers commands return these addresses when they are complete,
+        # rather than the address of a node to send them on to
         self.stabilize_address = f'inproc://stabilize_{self.digest_id}'
         self.fix_fingers_address = f'inproc://fix_fingers_{self.digest_id}'
 
-        self.connected = set()
+        self.connections = ConnectionManager(self.router)
         self.shutdown = False
 
+        self.transfer_stats = TransferStats()
+
+        # Operations waiting for replicas to reply, by request id
+        self.quorums = {}
+        self.quorum_ids = itertools.count()
+        self.stabilize_rounds = 0
+
         self.virtual_nodes = self.create_virtual_nodes(virtual)
 
     def create_virtual_nodes(self, virtual):
         virtual_node_type = self.get_virtual_node_type()
 
-        virtual_nodes = {digest: virtual_node_type(name, digest, self.digest_id, self.internal_endpoint)
+        virtual_nodes = {digest: virtual_node_type(name, digest, self.digest_id, self.internal_endpoint,
+                                                   self.num_bits, self.num_successors)
                          for name, digest in virtual.items()}
 
         # Add the host last so that if the same digest was used in virtual nodes dictionary, this will
         # override it and ensure that the name of the node is correct
         virtual_nodes[self.digest_id] = virtual_node_type(self.name, self.digest_id, self.digest_id,
-                                                          self.internal_endpoint)
+                                                          self.internal_endpoint, self.num_bits,
+                                                          self.num_successors)
 
         return virtual_nodes
 
+    @staticmethod
+    def create_context():
+        return zmq.Context()
+
     @staticmethod
     def get_virtual_node_type():
         return VirtualNode
@@ -212,252 +429,406 @@ class Node:
                 digest = node.get_digest()
                 found, next_node, hops = node1.find_successor(digest, 0)
                 while not found:
-                    node = self.virtual_nodes[next_node.get_digest()]
-                    found, next_node, hops = node.find_successor(digest, hops)
+                    current = self.virtual_nodes[next_node.get_digest()]
+                    found, next_node, hops = current.find_successor(digest, hops)
                 node.successor = next_node
 
         return len(self.virtual_nodes)
 
-    def join(self, known_id, known_address):
-        logging.debug(f'Node {self.digest_id} at {self.internal_endpoint} joining '
-                      f'known node {known_id} at {known_address}')
-
-        for v_node in self.virtual_nodes.values():
-            success = self.join_vnode(known_id, known_address, v_node)
-            if not success:
-                self.virtual_nodes.pop(v_node.get_digest())
-
-        # TODO - log an error if there are no virtual nodes at this point
-
-        return len(self.virtual_nodes)
-
-    def join_vnode(self, known_id, known_address, virtual_node):
-        recipient = RoutingInfo(known_id, known_id, known_address)
-        cmd = FindSuccessorCommand(search_digest=virtual_node.get_digest(),
-                                   initiator=virtual_node.routing_info,
-                                   recipient=recipient)
-        logging.debug(f'Virtual node {virtual_node.get_digest()} is sending command: {cmd}')
-        self.route_result(known_address, known_id, cmd)
-
-        # Block waiting for result. We can't start execution without know our successor
-        # Because loop has not started, socket is not being used. We can wait for the message here
-        result = self.receiver.recv_pyobj()
-        virtual_node.successor = result.recipient
-
-        # If the found successor has the same id as we do, there is already
-        # a node the same value in the network and we cannot join with that id
-        if virtual_node.successor.get_digest() == virtual_node.get_digest():
-            return False
+    def route_result(self, address, identity, command):
+        logging.debug(f'Node {self.digest_id} sending {command} to node {identity} at {address}')
+        self.connections.send(address, [routing_identity(identity), command.encode()] + command.data_frames())
 
-        logging.debug(f'Node {virtual_node.get_digest()} initialized successor '
-                      f'{virtual_node.successor.get_digest()} at {virtual_node.successor.get_address()}')
-        return True
+    def client_command(self, frames):
+        """ Starts handling a request a client sent to the external endpoint
 
-    def run_stabilize(self, context, interval, shutdown_event):
-        pair = context.socket(zmq.PAIR)
-        pair.setsockopt(zmq.LINGER, 0)
-        pair.connect(self.stabilize_address)
+        :param frames: frames received by the router, starting with the identity of the client
+        Keys longer than `wire.MAX_KEY_SIZE` bytes are answered with INVALID.
 
+        :return: StoreCommand to execute, or None if the request is invalid or was answered here
+        """
         try:
-            while not shutdown_event.is_set():
-                self._stabilize(pair)
-                time.sleep(interval)
-        finally:
-            pair.close()
-
-    def _stabilize(self, pair):
-        logging.debug(f'Node {self.digest_id} running stabilize')
-
-        for v_node in self.virtual_nodes.values():
-            logging.debug(f'Node {v_node.get_digest()} updating successor {v_node.successor.get_digest()}')
-            self._get_predecessor(pair, v_node)
-
-            logging.debug(f'Node {v_node.get_digest()} notifying successor {v_node.successor.get_digest()}')
-            self._notify_successor(pair, v_node)
-
-    @staticmethod
-    def _get_predecessor(pair, v_node):
-        cmd = PredecessorCommand(initiator=v_node.routing_info)
-        pair.send_pyobj(cmd)
-
-        # While we don't use the results received, it is important to acknowledge that the successor
-        # has been updated before continuing with the stabilization protocol because the next step
-        # involves notifying the new successor of the current nodes existence. If we don't wait for this
-        # acknowledgement, we may end up notifying the old successor
-        if pair.poll(STABILIZE_WAIT, zmq.POLLIN) == zmq.POLLIN:
-            success = pair.recv_pyobj()
-            if not success:
-                logging.warning(f'Node {v_node.get_parent()} unable to update successor for '
-                                f'virtual node {v_node.get_digest()}')
-        else:
-            # TODO implement successor lists to handle cases where successor fails
-            logging.debug(f'Node {v_node.get_parent()}, Virtual Node {v_node.get_digest()} stabilize did not receive '
-                          f'response from successor in {STABILIZE_WAIT} milliseconds. Continuing')
-
-    @staticmethod
-    def _notify_successor(pair, v_node):
-        cmd = NotifyCommand(initiator=v_node.routing_info)
-        pair.send_pyobj(cmd)
-
-        # Note that other synchronization processes (updating successor, fixing fingers) wait for a response.
-        # Those protocols require information to be sent back to the initiating node for processing. Once that
-        # processing is done, the node sends a message to the thread the task is complete and the task movies on.
-        # Notify is different from the other synchronization processes because it does not send information back to
-        # the initiating node. We make notify asynchronous because we don't want to add network traffic just for
-        # the purpose of being synchronous.
-
-    def run_fix_fingers(self, context, interval, shutdown_event):
-        pair = context.socket(zmq.PAIR)
-        pair.setsockopt(zmq.LINGER, 0)
-        pair.connect(self.fix_fingers_address)
-
+            if len(frames) < 2:
+                raise wire.WireError('Request has no command')
+            command = decode_command(frames[1], frames[2:])
+            if not isinstance(command, StoreCommand) or command.status is not None:
+                raise wire.WireError(f'Clients cannot send {type(command).__name__}')
+        except wire.WireError as e:
+            logging.warning(f'Node {self.digest_id} dropping client request it cannot decode: {e}')
+            return None
+
+        command.client = frames[0]
+        if len(command.key.encode()) > wire.MAX_KEY_SIZE:
+            # The key could not be handed to other nodes or replicas later on
+            logging.warning(f'Node {self.digest_id} rejecting key of {len(command.key.encode())} bytes')
+            command.status = INVALID
+            command.value = None
+            self.reply_client(command)
+            return None
+
+        # Results come back to this node, which replies to the client
+        host = self.virtual_nodes[self.digest_id]
+        command.initiator = RoutingInfo(None, self.digest_id, self.internal_endpoint)
+        command.recipient = host.routing_info
+        command.search_digest = hash_value(command.key, self.num_bits, self.hash_name)
+
+        if self.consistency.nearest_reads and command.operation == GET:
+            # Any copy of the key on this node answers, without going to the owner
+            entry = max((v_node.newest_entry(command.key) for v_node in self.virtual_nodes.values()),
+                        key=lambda entry: entry[2] if entry else 0)
+            if entry:
+                command.value = entry[1]
+                command.status = OK if command.value is not None else NOT_FOUND
+                self.reply_client(command)
+                return None
+
+        return command
+
+    def reply_client(self, command):
         try:
-            while not shutdown_event.is_set():
-                self._fix_fingers(pair)
-                time.sleep(interval)
-        finally:
-            pair.close()
-
-    def _fix_fingers(self, pair):
-        for v_node in self.virtual_nodes.values():
-            logging.debug(f"Building finger table for {v_node.name} (Digest: {v_node.get_digest()})")
-
-            random_index = random.randint(0, NUM_BITS - 1)
-            next_key = (v_node.get_digest() + pow(2, random_index)) % (pow(2, NUM_BITS) - random_index)
-            self._find_successor(pair, next_key, v_node.routing_info, random_index)
-            logging.debug(f"  Found finger {random_index} is successor({next_key}) = {v_node.fingers[random_index]}")
-
-    @staticmethod
-    def _find_successor(pair, digest, initiator, index):
-        cmd = FindSuccessorCommand()
-        cmd.initiator = initiator
-        cmd.recipient = initiator
-        cmd.return_data = index
-        cmd.search_digest = digest
-
-        pair.send_pyobj(cmd)
-
-        if pair.poll(STABILIZE_WAIT, zmq.POLLIN) == zmq.POLLIN:
-            success = pair.recv_pyobj()
-            if not success:
-                logging.error(f'Node {initiator.get_parent()} unable to update finger {index} '
-                              f'on virtual node {initiator.get_digest()}')
-        else:
-            logging.debug(f'Node {initiator.get_parent()}, Virtual Node {initiator.get_digest()}: fix fingers did '
-                          f'not receive response in {FIX_FINGERS_WAIT} milliseconds. Continuing.')
-
-    def run(self, stabilize_interval=5, fix_fingers_interval=7):
-        logging.info(f'Starting loop for node {self.digest_id}')
-        logging.info(f'Node {self.digest_id} managing virtual nodes: {self.virtual_nodes.keys()}')
-
-        # Create PAIR socket for stabilize
-        stability = self.context.socket(zmq.PAIR)
-        stability.setsockopt(zmq.LINGER, 0)
-        stability.bind(self.stabilize_address)
-
-        # Create PAIR socket for fix_fingers
-        fix_fingers = self.context.socket(zmq.PAIR)
-        fix_fingers.setsockopt(zmq.LINGER, 0)
-        fix_fingers.bind(self.fix_fingers_address)
-
-        # Create Poller to listen for messages on all sockets
-        poller = zmq.Poller()
-        poller.register(self.receiver, zmq.POLLIN)
-        poller.register(stability, zmq.POLLIN)
-        poller.register(fix_fingers, zmq.POLLIN)
-
-        shutdown_event = threading.Event()
-
-        # Start stabilize thread
-        if stabilize_interval:
-            stability_t = threading.Thread(target=self.run_stabilize,
-                                           args=[self.context, stabilize_interval, shutdown_event],
-                                           daemon=True)
-            stability_t.start()
-
-        # Start fix fingers thread
-        if fix_fingers_interval:
-            fix_fingers_t = threading.Thread(target=self.run_fix_fingers,
-                                             args=[self.context, fix_fingers_interval, shutdown_event],
-                                             daemon=True)
-            fix_fingers_t.start()
-
-        try:
-            while True:
-
-                logging.debug(f'Node {self.digest_id} waiting for messages')
-                socks = dict(poller.poll())
-                received_exit = self.process_input(socks, stability, fix_fingers)
-                if received_exit:
-                    shutdown_event.set()
-                    break
-
-            logging.info(f'Node {self.digest_id} shutting down...')
-            logging.info(f'Node state: {[vars(v_node) for v_node in self.virtual_nodes.values()]}')
-
-        # TODO notify successors and predecessors of known departure
-
-        finally:
-            logging.debug(f'Node {self.digest_id} destroying context...')
-
-            fix_fingers_t.join()
-            stability_t.join()
-            fix_fingers.close()
-            stability.close()
-
-            self.receiver.close()
-            self.router.close()
-            self.context.term()
-
-            self.shutdown = True
+            self.connections.send_now([command.client, command.encode()] + command.data_frames())
+        except zmq.ZMQError as e:
+            logging.warning(f'Node {self.digest_id} unable to reply to client: {e}')
+
+    def reroute_expired(self):
+        """ Treats peers that lookups could not be forwarded to within FORWARD_WAIT as failed
+
+        Every link to a failed peer is removed, and the lookups that were being forwarded
+        to it continue from this node through the next closest finger or successor. Virtual
+        nodes that were handing their keys to the peer while leaving hand them to the next
+        successor instead. Other messages queued for unreachable peers are dropped. A
+        message sent just as a peer goes down can be lost without an error, and is left to
+        the timeout of the node waiting for its result.
+        """
+        for address, messages in self.connections.expire(FORWARD_WAIT):
+            commands = [decode_command(frames[1], frames[2:]) for frames in messages]
+            lookups = [command for command in commands
+                       if isinstance(command, FindSuccessorCommand) and not command.found]
+            leaving = [v_node for v_node in self.virtual_nodes.values() if v_node.outgoing and
+                       v_node.outgoing.leaving and v_node.outgoing.target.address == address]
+            logging.warning(f'Node {self.digest_id} could not reach {address} in {FORWARD_WAIT} milliseconds. '
+                            f'Dropping {len(commands) - len(lookups)} message(s)')
+            if not lookups and not leaving:
+                # Stabilize decides on its own when a successor has failed
+                continue
 
-        logging.info(f'Node {self.digest_id} says Goodbye!')
+            for v_node in self.virtual_nodes.values():
+                links = v_node.successor_list + v_node.fingers + [v_node.predecessor]
+                for failed in {link.digest: link for link in links if link and link.address == address}.values():
+                    v_node.remove_failed(failed)
 
-    def process_input(self, socks, stability, fix_fingers):
-        logging.debug(f'Node {self.digest_id} processing {len(socks)} messages')
-        for sock in socks:
+            for command in lookups:
+                self.reroute(address, command)
 
-            # Receive command object
-            command = sock.recv_pyobj()
-            logging.debug(f'Node {self.digest_id} received command {command}')
+            for v_node in leaving:
+                # A node that is leaving no longer stabilizes, so it does not wait for the peer to come back
+                target = self.leaving_successor(v_node)
+                if target and target.address != address:
+                    self.start_handoff(v_node, target, leaving=True)
+                else:
+                    logging.warning(f'Node {self.digest_id}, Virtual Node {v_node.get_digest()} has no other node '
+                                    f'to hand {len(v_node.store)} key(s) to')
+                    v_node.outgoing = None
+
+    def reroute(self, failed_address, command):
+        # Continue from the local virtual node closest before the digest. The command goes
+        # through the receiver so results are handled as for any other command
+        v_node = min(self.virtual_nodes.values(),
+                     key=lambda v: (command.search_digest - v.get_digest()) % 2 ** v.num_bits)
+        if v_node.successor.address == failed_address:
+            logging.error(f'Node {self.digest_id} has no route around {failed_address}. Dropping {command}')
+            return
+
+        command.recipient = v_node.routing_info
+        self.route_result(v_node.get_address(), v_node.get_parent(), command)
+
+    def start_handoff(self, v_node, target, leaving=False):
+        """ Hands the keys `v_node` does not own to `target`, or every key if it is leaving
+
+        Replaces the transfer `v_node` had under way. Keys that transfer sent without
+        an acknowledgement are still in the store, so they are sent again.
+        """
+        entries = v_node.store.entries
+        moves = None if leaving else lambda digest: not v_node.owns(digest)
+
+        v_node.outgoing = None
+        if not entries:
+            return
+
+        if target.digest in self.virtual_nodes:
+            # Keys move between virtual nodes of this node without a transfer
+            receiver = self.virtual_nodes[target.digest].store
+            for key in [key for key, (digest, _, _) in entries.items() if not moves or moves(digest)]:
+                receiver.put(key, *entries.pop(key))
+            return
+
+        logging.info(f'Node {self.digest_id}, Virtual Node {v_node.get_digest()} handing keys to {target.digest}')
+        # The keys that move are picked as chunks are built, so a large store is not scanned at once
+        v_node.outgoing = OutgoingTransfer(target, list(entries), leaving, moves)
+        self.send_chunks(v_node)
+
+    def send_chunks(self, v_node):
+        transfer = v_node.outgoing
+        predecessor = self.leaving_predecessor(v_node) if transfer.leaving else None
+        for sequence, entries, last in transfer.chunks(v_node.store):
+            command = TransferCommand(v_node.routing_info, transfer.target, sequence, entries, last, transfer.leaving,
+                                      predecessor)
+            command.request_id = transfer.transfer_id
+            self.route_result(transfer.target.address, transfer.target.parent_digest, command)
+
+    def transfer_acknowledged(self, v_node, command):
+        transfer = v_node.outgoing
+        if not transfer or transfer.transfer_id != command.request_id:
+            # The transfer was replaced since the chunk was sent
+            return
+
+        keys, size = transfer.acknowledge(command.sequence, v_node.store)
+        self.transfer_stats.keys_sent += keys
+        self.transfer_stats.bytes_sent += size
+
+        if not transfer.done():
+            self.send_chunks(v_node)
+            return
+
+        elapsed = time.monotonic() - transfer.started
+        self.transfer_stats.transfers_completed += 1
+        self.transfer_stats.seconds_sending += elapsed
+        v_node.outgoing = None
+        logging.info(f'Node {self.digest_id}, Virtual Node {v_node.get_digest()} finished handing keys to '
+                     f'{transfer.target.digest} in {elapsed:.3f} seconds. Totals: {self.transfer_stats.as_dict()}')
+
+    def check_handoff(self, v_node, predecessor):
+        """ Hands keys to a new predecessor of `v_node`, or resumes a transfer that stalled
+
+        Runs whenever `v_node` is notified, so a stalled transfer to the predecessor is
+        resumed on the predecessor's next stabilize.
+
+        :param predecessor: predecessor of `v_node` before it was notified
+        """
+        transfer = v_node.outgoing
+        if transfer and transfer.leaving:
+            return
+
+        if v_node.predecessor and v_node.predecessor != predecessor:
+            promoted = v_node.promote_replicas()
+            if promoted:
+                logging.info(f'Node {self.digest_id}, Virtual Node {v_node.get_digest()} took over {promoted} '
+                             f'key(s) from its replicas')
+            self.start_handoff(v_node, v_node.predecessor)
+        elif transfer and transfer.stalled():
+            self.resume_handoff(v_node)
+
+    def resume_handoff(self, v_node):
+        resent = v_node.outgoing.rewind()
+        self.transfer_stats.chunks_resent += resent
+        logging.info(f'Node {self.digest_id}, Virtual Node {v_node.get_digest()} resuming transfer to '
+                     f'{v_node.outgoing.target.digest}, sending {resent} chunk(s) again')
+        self.send_chunks(v_node)
+
+    def start_leave(self):
+        """ Hands the keys of every virtual node to its first successor on another node
+
+        :return: True if any keys are being handed off
+        """
+        for v_node in self.virtual_nodes.values():
+            target = self.leaving_successor(v_node)
+            if not len(v_node.store):
+                continue
+            elif target:
+                self.start_handoff(v_node, target, leaving=True)
+            else:
+                logging.warning(f'Node {self.digest_id}, Virtual Node {v_node.get_digest()} has no other node '
+                                f'to hand {len(v_node.store)} key(s) to')
 
-            if command == EXIT_COMMAND:
-                logging.debug(f'Node {self.digest_id} received EXIT message. Node shutting down.')
-                return True
+        return not self.handoffs_done()
 
-            # Process the command
-            result = command.execute(self)
+    def handoffs_done(self):
+        return not any(v_node.outgoing for v_node in self.virtual_nodes.values())
 
-            # Process results
-            if result:
-                address = result.get_address()
-                identity = result.get_parent()
+    def resume_stalled(self):
+        for v_node in self.virtual_nodes.values():
+            if v_node.outgoing and v_node.outgoing.stalled():
+                self.resume_handoff(v_node)
+
+    def leaving_successor(self, v_node):
+        """ :return: RoutingInfo of the closest node after `v_node` that is not on this node, if known """
+        for _ in range(len(self.virtual_nodes)):
+            target = next((entry for entry in v_node.successor_list if entry.digest not in self.virtual_nodes), None)
+            if target:
+                return target
+            v_node = self.virtual_nodes[v_node.successor_list[-1].digest]
+        return None
+
+    def leaving_predecessor(self, v_node):
+        """ :return: RoutingInfo of the closest node before `v_node` that is not on this node, if known """
+        predecessor = v_node.predecessor
+        for _ in range(len(self.virtual_nodes)):
+            if not predecessor or predecessor.digest not in self.virtual_nodes:
+                return predecessor
+            predecessor = self.virtual_nodes[predecessor.digest].predecessor
+        return None
+
+    def replica_targets(self, v_node):
+        """ :return: RoutingInfo of the virtual nodes after `v_node` keeping copies of its keys, each on another node """
+        targets = []
+        parents = {self.digest_id}
+        for _ in range(len(self.virtual_nodes)):
+            for entry in v_node.successor_list:
+                if len(targets) < self.consistency.replicas - 1 and entry.parent_digest not in parents:
+                    parents.add(entry.parent_digest)
+                    targets.append(entry)
+
+            # Continue from the successors of the last virtual node in the list if it is on this node
+            if v_node.successor_list[-1].digest not in self.virtual_nodes:
+                break
+            v_node = self.virtual_nodes[v_node.successor_list[-1].digest]
+        return targets
+
+    def replicate(self, v_node, command, targets, needed):
+        """ Sends an operation `v_node` applied to the replicas of the key
+
+        :param targets: RoutingInfo of the replicas
+        :param needed: number of replicas that must reply before the client is answered
+        :return: True if the reply to the client waits for the replicas
+        """
+        if command.operation == GET and not needed:
+            return False
 
-                if address == self.stabilize_address and not identity:
-                    stability.send_pyobj(True)
-                elif address == self.fix_fingers_address and not identity:
-                    fix_fingers.send_pyobj(True)
-                else:
-                    self.route_result(address, identity, command)
+        digest, value, version = v_node.newest_entry(command.key) or (command.search_digest, None, 0)
+        entry = (command.key, digest, value, version)
+        request_id = next(self.quorum_ids) if needed else None
+        for target in targets:
+            # Reads only send the key, and the replica answers with its copy
+            entries = [entry if command.operation != GET else (command.key, digest, None, 0)]
+            self.send_replica(ReplicaCommand(READ if command.operation == GET else WRITE, v_node.routing_info,
+                                             target, entries), request_id)
 
+        if not needed:
             return False
+        self.wait_quorum(request_id, Quorum(command, v_node.get_digest(), needed, entry))
+        return True
 
-    def route_result(self, address, identity, command):
-        logging.debug(f'Node {self.digest_id} sending {command} to node {identity} at {address}')
-        if address not in self.connected:
-            self.connected.add(address)
-            self.router.connect(address)
-            time.sleep(.5)
-
-        identity_b = struct.pack('i', identity)
-        self.router.send(identity_b, zmq.SNDMORE)
-        self.router.send_pyobj(command)
+    def send_replica(self, command, request_id=None):
+        command.request_id = request_id
+        self.route_result(command.recipient.address, command.recipient.parent_digest, command)
+
+    def wait_quorum(self, request_id, quorum):
+        self.quorums[request_id] = quorum
+
+    def replica_replied(self, v_node, command):
+        quorum = self.quorums.get(command.request_id) if command.request_id is not None else None
+        if quorum and quorum.owner == v_node.get_digest():
+            # Replicas acknowledge writes without sending the key back
+            entry = command.entries[0] if command.entries else quorum.newest
+            if quorum.add(command.recipient, entry):
+                del self.quorums[command.request_id]
+                self.finish_quorum(v_node, quorum)
+        elif command.kind == READ:
+            # Keys the owner pulled from a replica during anti-entropy, or late replies to reads
+            for key, digest, value, version in command.entries:
+                if version and v_node.owns(digest):
+                    v_node.store.put(key, digest, value, version)
+        elif command.kind == TREE:
+            self.compare_trees(v_node, command)
+
+    def finish_quorum(self, v_node, quorum):
+        command = quorum.command
+        if command.operation == GET:
+            key, digest, value, version = quorum.newest
+            command.value = value
+            command.status = OK if value is not None else NOT_FOUND
+
+            # Read repair. Replicas that answered with an older copy are sent the newest
+            for replica in quorum.stale():
+                self.send_replica(ReplicaCommand(WRITE, v_node.routing_info, replica, [quorum.newest]))
+            if version and v_node.owns(digest):
+                v_node.store.put(key, digest, value, version)
+
+        self.send_store_result(command)
+
+    def expire_quorums(self):
+        """ Fails the operations that did not hear from enough replicas in QUORUM_WAIT milliseconds
+
+        A write that fails may still have been stored by the owner and some replicas.
+        """
+        for request_id, quorum in list(self.quorums.items()):
+            if quorum.expired():
+                del self.quorums[request_id]
+                logging.warning(f'Node {self.digest_id} heard from {len(quorum.replies)} of {quorum.needed} '
+                                f'replica(s) for {quorum.command}')
+                quorum.command.status = UNAVAILABLE
+                quorum.command.value = None
+                self.send_store_result(quorum.command)
+
+    def send_store_result(self, command):
+        target = command.result_target(self)
+        if target:
+            self.route_result(target.address, target.parent_digest, command)
+
+    def sync_due(self):
+        """ Counts a round of stabilize
+
+        :return: True on the rounds that owners compare their keys with their replicas
+        """
+        self.stabilize_rounds += 1
+        return self.consistency.replicas > 1 and self.stabilize_rounds % ANTI_ENTROPY_ROUNDS == 0
+
+    def start_sync(self, v_node):
+        """ Sends every replica of `v_node` the root of the Merkle tree of its keys """
+        root = v_node.arc_tree().root()
+        for target in self.replica_targets(v_node):
+            self.send_replica(ReplicaCommand(TREE, v_node.routing_info, target, predecessor=v_node.predecessor,
+                                             nodes=root))
+
+    def compare_trees(self, v_node, command):
+        """ Continues the comparison of the Merkle trees of `v_node` and a replica
+
+        :param command: reply of the replica, with the tree nodes that differ and the
+                        versions of the copies in the leaves that differ
+        """
+        tree = v_node.arc_tree()
+        start = command.predecessor.digest if command.predecessor else command.initiator.digest
+        if tree.start != start:
+            # The arc changed since the comparison started. The next round compares the new one
+            return
+
+        indices = [index for index, _ in command.nodes]
+        leaves = [index for index in indices if tree.is_leaf(index)]
+        if leaves:
+            self.repair(v_node, command.recipient, tree.keys(leaves), command.entries)
+
+        nodes = tree.expand(indices)
+        if nodes:
+            self.send_replica(ReplicaCommand(TREE, v_node.routing_info, command.recipient,
+                                             predecessor=v_node.predecessor, nodes=nodes))
+
+    def repair(self, v_node, replica, keys, entries):
+        """ Sends a replica the keys it is missing, and reads the keys it has newer versions of
+
+        :param replica: RoutingInfo of the replica
+        :param keys: keys of `v_node` in the buckets that differ
+        :param entries: versions of the replica's copies in those buckets
+        """
+        theirs = {key: version for key, _, _, version in entries}
+        push = [(key, *v_node.store.entries[key]) for key in keys if v_node.store.version(key) > theirs.get(key, 0)]
+        pull = [(key, digest, None, 0) for key, digest, _, version in entries
+                if version > v_node.store.version(key) and v_node.owns(digest)]
+        if not push and not pull:
+            return
+
+        logging.info(f'Node {self.digest_id}, Virtual Node {v_node.get_digest()} sending {len(push)} and reading '
+                     f'{len(pull)} key(s) to repair replica {replica.digest}')
+        for kind, entries in [(WRITE, push), (READ, pull)]:
+            for start in range(0, len(entries), CHUNK_KEYS):
+                self.send_replica(ReplicaCommand(kind, v_node.routing_info, replica, entries[start:start + CHUNK_KEYS]))
 
 
 class ChordNode(Node):
 
-    def __init__(self, node_name, node_id, address, external_port=None, internal_port=None, virtual={}):
-        super().__init__(node_name, node_id, address, external_port, internal_port, virtual)
+    def __init__(self, node_name, node_id, address, external_port=None, internal_port=None, virtual={},
+                 num_bits=NUM_BITS, num_successors=SUCCESSOR_LIST_LENGTH, hash_name=None, consistency=None):
+        super().__init__(node_name, node_id, address, external_port, internal_port, virtual, num_bits,
+                         num_successors, hash_name, consistency)
 
     @staticmethod
     def get_virtual_node_type():
@@ -466,13 +837,43 @@ class ChordNode(Node):
 
 # TODO extract common logic to command
 # TODO refactor if/else in execute() to state pattern
-# TODO optimize requests on the same host
 # TODO move commands to their own module
 class Command:
 
+    # Set by nodes that wait for the result of a command they started, to match the
+    # result to the request. Commands from other nodes carry it along unchanged
+    request_id = None
+
+    # Command type in the wire format, and the attributes sent as routing info
+    WIRE_TYPE = None
+    ROUTING_FIELDS = ()
+
     def execute(self, node):
         pass
 
+    def encode(self):
+        """ Encodes the command in the wire format """
+        header = wire.pack_header(self.WIRE_TYPE, getattr(self, 'hops', 0), getattr(self, 'found', False),
+                                  self.request_id, getattr(self, 'search_digest', None),
+                                  getattr(self, 'return_data', None))
+        routing_infos = [getattr(self, field) for field in self.ROUTING_FIELDS] + self.routing_info_list()
+        return header + b''.join(wire.pack_routing_info(routing_info) for routing_info in routing_infos)
+
+    def routing_info_list(self):
+        """ Routing info sent after the routing fields """
+        return []
+
+    def read_routing_info_list(self, routing_infos):
+        pass
+
+    def data_frames(self):
+        """ Frames sent after the command with data of its own """
+        return []
+
+    def read_data_frames(self, frames):
+        if frames:
+            raise wire.WireError(f'{type(self).__name__} has no data frames')
+
     def __repr__(self):
         return f'{type(self).__name__}: {vars(self)}'
 
@@ -480,6 +881,8 @@ class Command:
 class ExitCommand(Command):
     """ Command to signal the server to shutdown"""
 
+    WIRE_TYPE = 0
+
     def __init__(self):
         pass
 
@@ -500,6 +903,9 @@ class ExitCommand(Command):
 
 class NotifyCommand(Command):
 
+    WIRE_TYPE = 1
+    ROUTING_FIELDS = ('initiator', 'recipient')
+
     def __init__(self, initiator=None, recipient=None):
         self.initiator = initiator
         self.recipient = recipient
@@ -509,17 +915,24 @@ class NotifyCommand(Command):
             self.recipient = node.virtual_nodes[self.initiator.digest].successor
             return self.recipient
         elif self.recipient.digest in node.virtual_nodes:
-            node.virtual_nodes[self.recipient.digest].notify(self.initiator)
+            v_node = node.virtual_nodes[self.recipient.digest]
+            predecessor = v_node.predecessor
+            v_node.notify(self.initiator)
+            node.check_handoff(v_node, predecessor)
         else:
             logging.error(f'Node {node.digest_id} unable to execute {self}')
 
 
 class PredecessorCommand(Command):
 
-    def __init__(self, initiator=None, recipient=None, successors_predecessor=None):
+    WIRE_TYPE = 2
+    ROUTING_FIELDS = ('initiator', 'recipient', 'successors_predecessor')
+
+    def __init__(self, initiator=None, recipient=None, successors_predecessor=None, successor_list=None):
         self.initiator = initiator
         self.recipient = recipient
         self.successors_predecessor = successors_predecessor
+        self.successor_list = successor_list
 
     def execute(self, node):
         if not self.recipient and \
@@ -530,20 +943,31 @@ class PredecessorCommand(Command):
             return self.recipient
         elif not self.successors_predecessor and \
                 self.recipient.digest in node.virtual_nodes:
-            # Return to initiator
-            self.successors_predecessor = node.virtual_nodes[self.recipient.digest].predecessor
+            # Return to initiator along with the successor list the initiator builds its own from
+            successor = node.virtual_nodes[self.recipient.digest]
+            self.successors_predecessor = successor.predecessor
+            self.successor_list = successor.successor_list
             return self.initiator
         elif self.initiator.digest in node.virtual_nodes:
             # Initiator updates successor
-            node.virtual_nodes[self.initiator.digest].update_successor(self.successors_predecessor)
+            v_node = node.virtual_nodes[self.initiator.digest]
+            v_node.update_successor_list(self.recipient, self.successor_list or [])
+            v_node.update_successor(self.successors_predecessor)
             return RoutingInfo(address=node.stabilize_address)
         else:
             logging.error(f'Node {node.digest_id} unable to execute {self}')
 
+    def routing_info_list(self):
+        return self.successor_list or []
+
+    def read_routing_info_list(self, routing_infos):
+        self.successor_list = routing_infos or None
+
 
 class FindSuccessorCommand(Command):
 
-    # TODO handle get/put requests from clients
+    WIRE_TYPE = 4
+    ROUTING_FIELDS = ('initiator', 'recipient')
 
     def __init__(self, initiator=None, recipient=None, hops=0, found=False,
                  search_digest=None, return_data=None):
@@ -559,24 +983,18 @@ class FindSuccessorCommand(Command):
     def execute(self, node):
         logging.debug(f'Node {node.digest_id} executing command: {vars(self)}')
 
-        if self.found:
-            if not self.initiator.digest:
-                return self.client_response()
-            elif self.initiator.digest in node.virtual_nodes:
-                return self.update_node(node)
-        elif self.recipient.digest in node.virtual_nodes:
-            v_node = node.virtual_nodes[self.recipient.digest]
-            self.found, self.recipient, self.hops = v_node.find_successor(self.search_digest, self.hops)
+        if self.found and self.initiator.digest in node.virtual_nodes:
+            return self.update_node(node)
+        elif not self.found and self.recipient.digest in node.virtual_nodes:
+            # Hops to other virtual nodes of this node are taken here. The lookup only goes
+            # over the network once it is found or its next hop is on another node
+            while not self.found and self.recipient.digest in node.virtual_nodes:
+                v_node = node.virtual_nodes[self.recipient.digest]
+                self.found, self.recipient, self.hops = v_node.find_successor(self.search_digest, self.hops)
             return self.forward_result()
         else:
             logging.error(f'Node {node.digest_id} unable to execute {self}')
 
-    def client_response(self):
-        # if return_data has value `put`
-        # else `get`
-        message = None
-        return self.initiator
-
     def update_node(self, node):
         # If the current node is the initiator, then it has received its response and must
         # process/store the information appropriately
@@ -585,8 +1003,9 @@ class FindSuccessorCommand(Command):
         v_node.fingers[index] = self.recipient
         if index == 0:
             v_node.successor = self.recipient
-        node.router.connect(self.recipient.address)
-        node.connected.add(self.recipient.address)
+
+        # Connect ahead of time so the finger is ready when a lookup is routed to it
+        node.connections.connect(self.recipient.address)
         return RoutingInfo(address=node.fix_fingers_address)
 
     def forward_result(self):
@@ -597,15 +1016,336 @@ class FindSuccessorCommand(Command):
         else:
             # If the successor is found and the initiator does not have a digest set,
             # we have a client request. This result needs to be forwarded to the found successor
-            # which will handle the response to the client
+            # which will handle the response to the client (see StoreCommand)
             #
             # If the successor is not found, the search for the successor is forwarded to the result
             # found on this node
             return self.recipient
 
 
+class StoreCommand(FindSuccessorCommand):
+    """ GET, PUT or DELETE of a key, sent by a client to the external endpoint of a node
+
+    The node the client sent it to routes it like a lookup for the digest of the key.
+    The virtual node owning the key applies the operation and sends the command back,
+    with the status and the value for GET, so that node can reply to the client.
+    """
+
+    WIRE_TYPE = 5
+
+    def __init__(self, operation=GET, key=None, value=None, client_request_id=None, **kwargs):
+        super().__init__(**kwargs)
+        self.operation = operation
+        self.key = key
+        self.value = value
+        self.client_request_id = client_request_id
+
+        # Set by the node the client sent the command to, and once the operation is applied
+        self.client = None
+        self.status = None
+
+        # Set when the owner forwards the operation to where its key moved, so it is not
+        # forwarded again
+        self.forwarded = False
+        self.handing_off = False
+
+    def execute(self, node):
+        logging.debug(f'Node {node.digest_id} executing command: {vars(self)}')
+
+        if self.status is not None:
+            # The result is back at the node the client sent the command to
+            node.reply_client(self)
+            return None
+
+        if not self.found:
+            result = super().execute(node)
+            if not self.found or self.recipient.digest not in node.virtual_nodes:
+                return result
+
+        if self.recipient.digest not in node.virtual_nodes:
+            logging.error(f'Node {node.digest_id} unable to execute {self}')
+            return None
+
+        v_node = node.virtual_nodes[self.recipient.digest]
+        target = None if self.forwarded else v_node.store_target(self.key, self.search_digest, self.operation)
+        if target:
+            self.forwarded = True
+            self.handing_off = v_node.outgoing is not None and v_node.outgoing.target == target
+            self.recipient = target
+            if target.digest in node.virtual_nodes:
+                return self.execute(node)
+            return target
+
+        # The owner coordinates the replicas of the key
+        needed = node.consistency.needed(self.operation)
+        targets = node.replica_targets(v_node) if node.consistency.replicas > 1 else []
+        if needed > len(targets):
+            logging.warning(f'Node {node.digest_id} has {len(targets)} replica(s) for {self.key}, '
+                            f'{needed} must answer')
+            self.status = UNAVAILABLE
+            self.value = None
+            return self.result_target(node)
+
+        if self.operation != GET and (self.handing_off or v_node.receiving()):
+            v_node.written.add(self.key)
+        self.apply(v_node)
+        if node.replicate(v_node, self, targets, needed):
+            return None
+
+        return self.result_target(node)
+
+    def apply(self, v_node):
+        store = v_node.store
+        if self.operation == PUT:
+            store.put(self.key, self.search_digest, self.value)
+            self.status = OK
+        elif self.operation == DELETE:
+            self.status = OK if store.delete(self.key, self.search_digest) else NOT_FOUND
+        else:
+            # Replicas of a predecessor that failed hold its keys until they are promoted
+            entry = v_node.newest_entry(self.key)
+            self.value = entry[1] if entry else None
+            self.status = OK if self.value is not None else NOT_FOUND
+
+        # Only GET returns the value
+        if self.operation != GET:
+            self.value = None
+
+    def result_target(self, node):
+        """ Replies to the client if it is connected to `node`
+
+        :return: RoutingInfo of the node the client is connected to otherwise
+        """
+        if self.initiator.parent_digest == node.digest_id:
+            node.reply_client(self)
+            return None
+        return self.initiator
+
+    def data_frames(self):
+        return [wire.pack_store(self.operation, self.status, self.client_request_id, self.value is not None,
+                                self.forwarded, self.handing_off),
+                self.client or b'', self.key.encode(), self.value or b'']
+
+    def read_data_frames(self, frames):
+        if len(frames) != 4:
+            raise wire.WireError(f'Store operation has {len(frames)} data frames, expected 4')
+
+        self.operation, self.status, self.client_request_id, has_value, self.forwarded, self.handing_off = \
+            wire.unpack_store(frames[0])
+        if self.operation not in (GET, PUT, DELETE):
+            raise wire.WireError(f'Unknown store operation {self.operation}')
+
+        try:
+            self.key = bytes(frames[2]).decode()
+        except UnicodeDecodeError as e:
+            raise wire.WireError(f'Invalid key: {e}')
+
+        self.client = bytes(frames[1]) or None
+        self.value = bytes(frames[3]) if has_value else None
+
+
+class TransferCommand(Command):
+    """ Chunk of the keys one virtual node hands to another
+
+    The receiver applies the chunk and sends the command back as its acknowledgement,
+    without the keys and with `sequence` set to the next chunk it expects.
+    """
+
+    WIRE_TYPE = 6
+    ROUTING_FIELDS = ('initiator', 'recipient')
+
+    def __init__(self, initiator=None, recipient=None, sequence=0, entries=None, last=False, leaving=False,
+                 predecessor=None):
+        self.initiator = initiator
+        self.recipient = recipient
+        self.sequence = sequence
+        self.entries = entries or []
+        self.last = last
+        self.leaving = leaving
+        self.predecessor = predecessor
+        self.acknowledged = False
+
+    def execute(self, node):
+        if self.acknowledged and self.initiator.digest in node.virtual_nodes:
+            node.transfer_acknowledged(node.virtual_nodes[self.initiator.digest], self)
+        elif not self.acknowledged and self.recipient.digest in node.virtual_nodes:
+            self.apply(node, node.virtual_nodes[self.recipient.digest])
+            return self.initiator
+        else:
+            logging.error(f'Node {node.digest_id} unable to execute {self}')
+
+    def apply(self, node, v_node):
+        incoming = v_node.incoming.get(self.initiator.digest)
+        if not incoming or incoming.transfer_id != self.request_id:
+            incoming = v_node.incoming[self.initiator.digest] = IncomingTransfer(
+                self.request_id, self.initiator, self.sequence, self.leaving, self.predecessor)
+
+        if incoming.apply(self.sequence, self.entries, self.last, v_node.store, v_node.written):
+            node.transfer_stats.keys_received += len(self.entries)
+            node.transfer_stats.bytes_received += sum(len(key.encode()) + len(value or b'')
+                                                      for key, _, value, _ in self.entries)
+
+            if incoming.complete:
+                logging.info(f'Node {node.digest_id}, Virtual Node {v_node.get_digest()} received the keys '
+                             f'of {self.initiator.digest}')
+                if self.leaving and v_node.predecessor and \
+                        v_node.predecessor.parent_digest == self.initiator.parent_digest:
+                    # The node before the one that left is the predecessor now
+                    v_node.predecessor = self.predecessor
+                if not v_node.receiving():
+                    v_node.written.clear()
+
+        self.acknowledged = True
+        self.sequence = incoming.expected
+        self.entries = []
+        self.predecessor = None
+
+    def routing_info_list(self):
+        return [self.predecessor] if self.predecessor else []
+
+    def read_routing_info_list(self, routing_infos):
+        self.predecessor = routing_infos[0] if routing_infos else None
+
+    def data_frames(self):
+        return [wire.pack_transfer(self.sequence, self.entries, self.last, self.leaving, self.acknowledged)]
+
+    def read_data_frames(self, frames):
+        if len(frames) != 1:
+            raise wire.WireError(f'Transfer has {len(frames)} data frames, expected 1')
+
+        self.sequence, self.entries, self.last, self.leaving, self.acknowledged = wire.unpack_transfer(frames[0])
+
+    def __repr__(self):
+        # Chunks can hold many keys, which are left out
+        return f'{type(self).__name__}: initiator {self.initiator}, recipient {self.recipient}, ' \
+               f'sequence {self.sequence}, {len(self.entries)} key(s), last {self.last}, ' \
+               f'acknowledged {self.acknowledged}'
+
+
+class ReplicaCommand(Command):
+    """ Copies of keys an owner sends to a replica, or asks a replica for
+
+    `WRITE` sends copies to store, `READ` asks for the replica's copies of keys and
+    `TREE` sends nodes of the owner's Merkle tree to compare with the replica's. The
+    replica answers by sending the command back, with its copies for `READ`, and for
+    `TREE` with the nodes that differ and the versions of its copies in the leaves
+    that differ.
+    """
+
+    WIRE_TYPE = 7
+    ROUTING_FIELDS = ('initiator', 'recipient')
+
+    def __init__(self, kind=WRITE, initiator=None, recipient=None, entries=None, predecessor=None, nodes=None):
+        self.kind = kind
+        self.initiator = initiator
+        self.recipient = recipient
+        self.entries = entries or []
+        self.nodes = nodes or []
+        self.predecessor = predecessor
+        self.acknowledged = False
+
+    def execute(self, node):
+        if not self.recipient and self.kind == TREE and self.initiator.digest in node.virtual_nodes:
+            # Anti-entropy started by stabilize
+            node.start_sync(node.virtual_nodes[self.initiator.digest])
+        elif self.acknowledged and self.initiator.digest in node.virtual_nodes:
+            node.replica_replied(node.virtual_nodes[self.initiator.digest], self)
+        elif not self.acknowledged and self.recipient.digest in node.virtual_nodes:
+            self.apply(node.virtual_nodes[self.recipient.digest])
+            return self.initiator
+        else:
+            logging.error(f'Node {node.digest_id} unable to execute {self}')
+
+    def apply(self, v_node):
+        store = v_node.replicas.setdefault(self.initiator.digest, Store())
+        if self.kind == WRITE:
+            for entry in self.entries:
+                store.put(*entry)
+            self.entries = []
+        elif self.kind == READ:
+            self.entries = [(key, *(v_node.newest_entry(key) or (digest, None, 0)))
+                            for key, digest, _, _ in self.entries]
+        else:
+            start = self.predecessor.digest if self.predecessor else self.initiator.digest
+            previous = store.tree
+            tree = store.track(start, self.initiator.digest, v_node.num_bits)
+            if tree is not previous:
+                # The owner's arc changed, and copies outside it moved to another owner
+                for key, (digest, _, _) in list(store.entries.items()):
+                    if not tree.covers(digest):
+                        store.remove(key)
+
+            # Only the versions of the copies in the leaves that differ are sent back
+            differing = tree.differing(self.nodes)
+            self.nodes = [(index, tree.hash(index)) for index in differing]
+            self.entries = [(key, store.entries[key][0], None, store.entries[key][2])
+                            for key in tree.keys(index for index in differing if tree.is_leaf(index))]
+
+        self.acknowledged = True
+        if self.kind != TREE:
+            # The owner checks that trees were compared over the arc it still owns
+            self.predecessor = None
+
+    def routing_info_list(self):
+        return [self.predecessor] if self.predecessor else []
+
+    def read_routing_info_list(self, routing_infos):
+        self.predecessor = routing_infos[0] if routing_infos else None
+
+    def data_frames(self):
+        return [wire.pack_replica(self.kind, self.entries, self.nodes, self.acknowledged)]
+
+    def read_data_frames(self, frames):
+        if len(frames) != 1:
+            raise wire.WireError(f'Replica message has {len(frames)} data frames, expected 1')
+
+        self.kind, self.entries, self.nodes, self.acknowledged = wire.unpack_replica(frames[0])
+        if self.kind not in (WRITE, READ, TREE):
+            raise wire.WireError(f'Unknown replica message kind {self.kind}')
+
+    def __repr__(self):
+        return f'{type(self).__name__}: kind {self.kind}, initiator {self.initiator}, recipient {self.recipient}, ' \
+               f'{len(self.entries)} key(s), {len(self.nodes)} tree node(s), acknowledged {self.acknowledged}'
+
+
 EXIT_COMMAND = ExitCommand()
 
+COMMAND_TYPES = {command_type.WIRE_TYPE: command_type
+                 for command_type in [ExitCommand, NotifyCommand, PredecessorCommand, FindSuccessorCommand,
+                                      StoreCommand, TransferCommand, ReplicaCommand]}
+
+
+def decode_command(frame, data=()):
+    """ Decodes a command in the wire format
+
+    :param frame: frame holding the command
+    :param data: frames sent after the command with data of its own
+    :raises wire.WireError: if the frames do not hold a valid command
+    """
+    command_type, hops, found, request_id, search_digest, return_data = wire.unpack_header(frame)
+    if command_type not in COMMAND_TYPES:
+        raise wire.WireError(f'Unknown command type {command_type}')
+
+    command = COMMAND_TYPES[command_type]()
+    routing_infos = [RoutingInfo(*fields) if fields else None for fields in wire.unpack_routing_infos(frame)]
+    if len(routing_infos) < len(command.ROUTING_FIELDS):
+        raise wire.WireError(f'{type(command).__name__} needs {len(command.ROUTING_FIELDS)} routing infos')
+
+    if request_id is not None:
+        command.request_id = request_id
+    if isinstance(command, FindSuccessorCommand):
+        command.hops = hops
+        command.found = found
+        command.search_digest = search_digest
+        command.return_data = return_data
+
+    for field, routing_info in zip(command.ROUTING_FIELDS, routing_infos):
+        setattr(command, field, routing_info)
+    command.read_routing_info_list(routing_infos[len(command.ROUTING_FIELDS):])
+    command.read_data_frames(data)
+
+    return command
+
 
 # -----------------------------------------------------------------------------
 # CLI Helpers
@@ -627,36 +1367,17 @@ def handle_shutdown(name, address, internal_port, hash_func):
     try:
         context = zmq.Context()
         shutdown_socket = context.socket(zmq.ROUTER)
-        shutdown_socket.connect(endpoint)
-        time.sleep(0.5)
+        connections = ConnectionManager(shutdown_socket)
 
-        identity = struct.pack('i', digest)
-        shutdown_socket.send(identity, zmq.SNDMORE)
-        shutdown_socket.send_pyobj(EXIT_COMMAND)
+        connections.send(endpoint, [routing_identity(digest), EXIT_COMMAND.encode()])
+        if not connections.wait(CONNECT_WAIT):
+            logging.error(f'Unable to connect to node {name} at {endpoint}')
+        connections.close()
     finally:
         shutdown_socket.close()
         context.destroy()
 
 
-def handle_new_node(name, address, external_port, internal_port, action,
-                    known_endpoint, known_name, stabilize_interval, fix_fingers_interval,
-                    node_type, hash_func, virtual_nodes):
-    node = node_type(name, hash_func(name), address, external_port, internal_port, dict(virtual_nodes))
-
-    if action == 'create':
-        num_added = node.create()
-    elif action == 'join':
-        if not known_endpoint or not known_name:
-            raise ValueError('join action requires known name and known address')
-
-        num_added = node.join(hash_func(known_name), known_endpoint)
-
-    node_t = threading.Thread(target=node.run, args=[stabilize_interval, fix_fingers_interval])
-    node_t.start()
-
-    return node, node_t
-
-
 def virtual_node(v_node):
     split = v_node.split(':')
     return split[0], int(split[1])
@@ -701,6 +1422,23 @@ def config_parser():
     parser.add_argument('--real-hashes', '-rh', action='store_const', const=hash_value,
                         help='By default, hashes are artificially generated to avoid duplicates in '
                              'the small address space. This option allows using real hashes.')
+    parser.add_argument('--num-bits', '-b', type=int, default=NUM_BITS,
+                        help='number of bits in the identifier space')
+    parser.add_argument('--hash', type=str, choices=HASH_FUNCTIONS.keys(), default=None,
+                        help='hash function to use with --real-hashes and for the keys clients store. '
+                             'Defaults to md5, or sha1 for more than 128 bits')
+    parser.add_argument('--successors', '-r', type=int, default=SUCCESSOR_LIST_LENGTH,
+                        help='number of successors each node keeps to fail over to')
+    parser.add_argument('--replicas', type=int, default=1,
+                        help='number of nodes keeping each key, counting its owner. At most one more than '
+                             '--successors')
+    parser.add_argument('--read-quorum', type=int, default=1,
+                        help='number of replicas a read waits for, counting the owner')
+    parser.add_argument('--write-quorum', type=int, default=1,
+                        help='number of replicas a write waits for, counting the owner')
+    parser.add_argument('--nearest-reads', action='store_true',
+                        help='answer reads from copies of the key on the node the client is connected to. '
+                             'Requires a read quorum of 1')
 
     node_type_group = parser.add_mutually_exclusive_group()
     node_type_group.add_argument('--naive-nodes', action='store_const', const=Node,
@@ -712,54 +1450,11 @@ def config_parser():
     return parser
 
 
-def main():
-    pp = pprint.PrettyPrinter()
-
-    parser = config_parser()
-    args = parser.parse_args()
-
-    action = args.action
-    name = args.name
-    address = args.address
-
-    known_endpoint = args.known_endpoint
-    known_name = args.known_name
-
-    external_port = args.external_port
-    internal_port = args.internal_port
-    stabilize_interval = args.stabilize_interval
-    fix_fingers_interval = args.fix_fingers_interval
-    quiet = args.quiet
-    virtual_nodes = args.virtual_nodes
-
-    hash_func = next(hash_func for hash_func in [args.real_hashes, to_int]
-                     if hash_func is not None)
-
-    # Retrieve first non None value
-    node_type = next(node_type
-                     for node_type in [args.chord_nodes, args.naive_nodes, ChordNode]
-                     if node_type is not None)
-
-    if action == 'create' or action == 'join':
-
-        node, node_t = handle_new_node(name, address, external_port, internal_port, action,
-                                       known_endpoint, known_name, stabilize_interval,
-                                       fix_fingers_interval, node_type, hash_func, virtual_nodes)
-
-        print(f'Node {node.name} joined network with {len(node.virtual_nodes)} virtual node(s)')
-        # TODO - exit with error code if no nodes were added to network
-
-        while node_t.is_alive():
-            if not quiet:
-                pp.pprint(finger_table_links(node))
-            node_t.join(30)
-
-    elif action == 'shutdown':
-
-        print('Shutting down...')
-        handle_shutdown(name, address, internal_port, hash_func)
-        print(f'Shutdown node {name}')
-
+def parse_consistency(parser, args):
+    try:
+        if args.replicas - 1 > args.successors:
+            raise ValueError(f'{args.replicas} replicas need at least {args.replicas - 1} successors')
+        return Consistency(args.replicas, args.read_quorum, args.write_quorum, args.nearest_reads)
+    except ValueError as e:
+        parser.error(str(e))
 
-if __name__ == '__main__':
-    main()
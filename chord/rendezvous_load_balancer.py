@@ -0,0 +1,150 @@
+"""Rendezvous (highest random weight) load balancer
+
+Each key is scored against every server and hosted by the server with the
+highest score (Thaler and Ravishankar, "Using name-based mappings to increase hit
+rates"). Adding or removing a server only moves the keys that server wins or
+held. The top k servers for a key give a stable set of replicas.
+
+Server digests are computed once when servers are added. A key's score for a
+server mixes the key digest with the server digest using the splitmix64
+finalizer, so scoring a key does not rehash any strings.
+"""
+import argparse
+import heapq
+import json
+import sys
+
+from util import generate_keys
+from hash import hash_value, hash_values, HASH_FUNCTIONS
+from server import Server
+
+# Scores are computed from 64 bit digests
+RENDEZVOUS_BITS = 64
+MASK_64 = pow(2, RENDEZVOUS_BITS) - 1
+
+server_name_fmt = "server_{id}"
+
+
+def score(key_digest, server_digest):
+    """ Pseudo random weight of a server for a key using the splitmix64 finalizer """
+    value = key_digest ^ server_digest
+    value = ((value ^ (value >> 30)) * 0xbf58476d1ce4e5b9) & MASK_64
+    value = ((value ^ (value >> 27)) * 0x94d049bb133111eb) & MASK_64
+    return value ^ (value >> 31)
+
+
+class RendezvousBalancer:
+    """ Assigns each key to the server with the highest score for the key
+
+    Each balancer keeps its own servers, so several balancers can be used side by side.
+    Servers are stored by digest in insertion order.
+    """
+
+    def __init__(self, hash_name=None):
+        self.hash_name = hash_name
+
+        self.servers = {}
+        self.max_server_id = 0
+
+    def responsible_server(self, key):
+        return self.digest_responsible_server(hash_value(key, RENDEZVOUS_BITS, self.hash_name))
+
+    def digest_responsible_server(self, key_digest):
+        server_digest = max(self.servers, key=lambda digest: score(key_digest, digest))
+        return self.servers[server_digest]
+
+    def responsible_servers(self, key, num_replicas):
+        """ Servers with the `num_replicas` highest scores for the key, highest first
+
+        The first server is the one returned by `responsible_server`. Because scores do not
+        depend on the other servers, removing a server only promotes the next server in
+        each affected key's list, which makes the list suitable for replica placement.
+        """
+        key_digest = hash_value(key, RENDEZVOUS_BITS, self.hash_name)
+        top = heapq.nlargest(num_replicas, self.servers, key=lambda digest: score(key_digest, digest))
+        return [self.servers[server_digest] for server_digest in top]
+
+    def build_server_list(self, num_servers):
+        i = self.max_server_id
+        new_total = len(self.servers) + num_servers
+        while len(self.servers) < new_total:
+            name = server_name_fmt.format(id=str(i))
+            self.servers[hash_value(name, RENDEZVOUS_BITS, self.hash_name)] = Server(name)
+            i += 1
+
+        self.max_server_id = i
+
+    def remove_server_list(self, num_servers):
+        # Remove the most recently added servers
+        for server_digest in list(self.servers)[len(self.servers) - num_servers:]:
+            del self.servers[server_digest]
+
+    def count_servers(self):
+        return len(self.servers)
+
+    def get_servers(self, keys):
+        result = {}
+
+        for key, key_digest in zip(keys, hash_values(keys, RENDEZVOUS_BITS, self.hash_name)):
+            server = self.digest_responsible_server(key_digest)
+            result[key] = server
+
+        return result
+
+
+def calculate_change(servers_orig, servers_appended):
+    return [changed for changed in servers_orig if servers_orig[changed] != servers_appended[changed]]
+
+
+def config_parser():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('num_servers', type=int, help='number of servers to build')
+    parser.add_argument('num_keys', type=int, help='number of keys to build')
+    parser.add_argument('--additional', '-a', type=int, default=1,
+                        help='number of servers to add')
+    parser.add_argument('--hash', type=str, choices=HASH_FUNCTIONS.keys(), default=None,
+                        help='hash function to use. Defaults to md5')
+    parser.add_argument('--no-formatting', action='store_true',
+                        help='print raw data without formatting')
+
+    return parser
+
+
+def main(output, args):
+    parser = config_parser()
+    args = parser.parse_args(args)
+
+    num_servers = args.num_servers
+    num_keys = args.num_keys
+    additional = args.additional
+    indent = None if args.no_formatting else 4
+
+    balancer = RendezvousBalancer(args.hash)
+    balancer.build_server_list(num_servers)
+    orig_length = balancer.count_servers()
+    keys = generate_keys(num_keys)
+
+    result1 = balancer.get_servers(keys)
+
+    # Add a server
+    balancer.build_server_list(additional)
+
+    result2 = balancer.get_servers(keys)
+
+    # Calculate the number of changes
+    changes = calculate_change(result1, result2)
+
+    # Print results
+    print(f"\nMapping of keys to server hosting key with {orig_length} servers:", file=output)
+    print(json.dumps(result1, indent=indent, default=vars), file=output)
+
+    print(f"\nMapping of keys to server hosting key with {balancer.count_servers()} servers:", file=output)
+    print(json.dumps(result2, indent=indent, default=vars), file=output)
+
+    print(f"\n A total of {len(changes)} out of {len(keys)} keys have changed hosts:", file=output)
+    print(json.dumps(changes, indent=indent), file=output)
+
+
+if __name__ == "__main__":
+    main(sys.stdout, sys.argv[1:])
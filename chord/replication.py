@@ -0,0 +1,115 @@
+"""Copies of stored keys on the successors of their owner
+
+With `Consistency.replicas` set to N, every key is kept by the virtual node that
+owns it and by the first N - 1 virtual nodes after it that run on other nodes, so
+a key survives as long as one of those N nodes does. The owner coordinates every
+operation on its keys. It applies a write, sends it to the replicas and replies to
+the client once W - 1 of them acknowledged it. A read waits for R - 1 replicas and
+answers with the newest version among them and the owner, and replicas that sent
+an older version are sent the newest one. With R + W > N every read sees the last
+write that was acknowledged.
+
+Replicas that missed writes, e.g. because they joined or were unreachable, catch
+up through anti-entropy. The owner and each replica keep a `merkle.MerkleTree` of
+the owner's arc, updated as keys are written. Every `ANTI_ENTROPY_ROUNDS` rounds
+of stabilize, the owner sends each replica the root of its tree. The replica
+answers with the nodes whose hash differs from its own, and the owner sends the
+nodes below those, until they reach the leaves. For the leaves that differ, the
+replica sends the versions of the keys in their buckets, and the owner sends the
+keys it has newer versions of and reads the keys the replica has newer versions
+of. Replicas that agree exchange one hash, and the keys sent grow with the number
+of buckets that differ rather than with the number of keys. When a virtual node
+takes over the arc of a predecessor that failed, it promotes the copies it holds
+of that arc to keys of its own.
+
+With `Consistency.nearest_reads`, a node answers a GET from any copy of the key it
+holds, without asking the owner. This is only allowed when R is 1, since the copy
+may miss the latest writes.
+"""
+import time
+
+from store import GET
+
+# Number of virtual nodes keeping each key, counting the owner
+REPLICAS = 1
+
+# Milliseconds an owner waits for replicas before the operation fails
+QUORUM_WAIT = 1000
+
+# Rounds of stabilize between comparisons of the keys of an owner and its replicas
+ANTI_ENTROPY_ROUNDS = 5
+
+# Kinds of messages between an owner and its replicas
+WRITE = 1
+READ = 2
+TREE = 3
+
+
+class Consistency:
+    """ Number of copies of each key, and how many of them take part in reads and writes
+
+    :param replicas: N, the number of virtual nodes keeping each key, counting the owner
+    :param read_quorum: R, the number of copies a read is answered from
+    :param write_quorum: W, the number of copies that store a write before it succeeds
+    :param nearest_reads: whether nodes answer reads from copies they hold themselves
+    :raises ValueError: if a quorum is larger than N or nearest reads are used with R above 1
+    """
+
+    def __init__(self, replicas=REPLICAS, read_quorum=1, write_quorum=1, nearest_reads=False):
+        if replicas < 1:
+            raise ValueError(f'Keys need at least one replica, not {replicas}')
+        if not 1 <= read_quorum <= replicas or not 1 <= write_quorum <= replicas:
+            raise ValueError(f'Read quorum {read_quorum} and write quorum {write_quorum} must be between 1 '
+                             f'and the number of replicas {replicas}')
+        if nearest_reads and read_quorum > 1:
+            raise ValueError('Nearest reads only work with a read quorum of 1')
+
+        self.replicas = replicas
+        self.read_quorum = read_quorum
+        self.write_quorum = write_quorum
+        self.nearest_reads = nearest_reads
+
+    def needed(self, operation):
+        """ :return: number of replicas besides the owner that must answer an operation """
+        return (self.read_quorum if operation == GET else self.write_quorum) - 1
+
+    def __repr__(self):
+        return f'N={self.replicas}, R={self.read_quorum}, W={self.write_quorum}' + \
+               (', nearest reads' if self.nearest_reads else '')
+
+
+class Quorum:
+    """ Replies an owner waits for before it answers a client
+
+    :param command: StoreCommand the client sent
+    :param owner: digest of the virtual node that owns the key
+    :param needed: number of replicas that must reply
+    :param entry: the owner's copy of the key, as a tuple of key, digest, value and version
+    """
+
+    def __init__(self, command, owner, needed, entry):
+        self.command = command
+        self.owner = owner
+        self.needed = needed
+        self.newest = entry
+        self.replies = {}
+        self.deadline = time.monotonic() + QUORUM_WAIT / 1000
+
+    def add(self, replica, entry):
+        """ Counts the reply of a replica
+
+        :param replica: RoutingInfo of the replica
+        :param entry: the replica's copy of the key
+        :return: True once enough replicas replied
+        """
+        self.replies[replica.digest] = (replica, entry)
+        if entry[3] > self.newest[3]:
+            self.newest = entry
+        return len(self.replies) >= self.needed
+
+    def stale(self):
+        """ :return: RoutingInfo of the replicas that replied with an older copy than the newest """
+        return [replica for replica, entry in self.replies.values() if entry[3] < self.newest[3]]
+
+    def expired(self):
+        return time.monotonic() >= self.deadline
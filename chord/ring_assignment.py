@@ -0,0 +1,91 @@
+"""Vectorized key assignment for the load balancers
+
+The load balancers map keys to servers one key at a time and keep the result
+in a dictionary. This module does the same work on NumPy arrays of digests so
+that millions of keys can be assigned, and the movement between two server
+configurations counted, without building per-key Python objects.
+
+Assignments are arrays of owner ids, one per key. Owner ids are whatever
+integer the caller uses to identify servers; they must stay the same for a
+server across configurations so assignments can be compared.
+"""
+import numpy as np
+
+from hash import NUM_BITS, hash_values
+
+# Number of keys generated and hashed at a time by hash_keys
+CHUNK_SIZE = 100000
+
+
+def digest_array(digests, num_bits=NUM_BITS):
+    """ Converts a sequence of digests to an array
+
+    Digests that fit in 64 bits are stored as uint64. Wider identifier spaces fall
+    back to an object array of Python ints, which NumPy can still sort and search.
+
+    :param digests: sequence of integer digests
+    :param num_bits: number of bits in the identifier space
+    :return: array of digests
+    """
+    if num_bits <= 64:
+        return np.fromiter(digests, dtype=np.uint64, count=len(digests))
+    else:
+        return np.array(list(digests), dtype=object)
+
+
+def hash_keys(num_keys, key_prefix="cached_data", num_bits=NUM_BITS, hash_name=None):
+    """ Hashes the keys `util.generate_keys` would create into an array
+
+    Keys are generated and hashed in chunks so the list of key names for all
+    `num_keys` keys never exists at once.
+
+    :param num_keys: number of keys
+    :param key_prefix: prefix of key names
+    :param num_bits: number of bits in the identifier space
+    :param hash_name: name of the hash function to use
+    :return: array of key digests
+    """
+    dtype = np.uint64 if num_bits <= 64 else object
+    digests = np.empty(num_keys, dtype=dtype)
+
+    key_format = "{prefix}_{id}"
+    for start in range(0, num_keys, CHUNK_SIZE):
+        end = min(start + CHUNK_SIZE, num_keys)
+        keys = [key_format.format(prefix=key_prefix, id=str(i)) for i in range(start, end)]
+        digests[start:end] = hash_values(keys, num_bits, hash_name)
+
+    return digests
+
+
+def consistent_assign(key_digests, server_digests, owners):
+    """ Assigns each key to the first server with a digest greater than or equal to its own
+
+    :param key_digests: array of key digests
+    :param server_digests: sorted array of server digests
+    :param owners: array of owner ids, one for each server digest
+    :return: array of owner ids, one for each key
+    """
+    # Keys past the last server digest wrap around to the first server
+    indexes = np.searchsorted(server_digests, key_digests, side='left') % len(server_digests)
+    return owners[indexes]
+
+
+def modn_assign(key_digests, owners):
+    """ Assigns each key to the server at index digest mod N
+
+    :param key_digests: array of key digests
+    :param owners: array of owner ids, one for each of the N servers
+    :return: array of owner ids, one for each key
+    """
+    indexes = (key_digests % len(owners)).astype(np.intp)
+    return owners[indexes]
+
+
+def changed_keys(assignment_orig, assignment_appended):
+    """ Indexes of the keys assigned to different owners in the two assignments """
+    return np.flatnonzero(assignment_orig != assignment_appended)
+
+
+def calculate_change(assignment_orig, assignment_appended):
+    """ Number of keys assigned to different owners in the two assignments """
+    return int(np.count_nonzero(assignment_orig != assignment_appended))
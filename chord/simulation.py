@@ -0,0 +1,617 @@
+"""Discrete-event simulation of the chord maintenance protocol
+
+Runs stabilize, check_predecessor, notify and fix_fingers for `directchord` nodes on a simulated
+clock instead of in lock-step or on real networked nodes. Every remote call is
+a message delivered after a latency drawn from a configurable distribution, and
+events are processed in time order from a heap. Nodes can join, leave
+gracefully or crash while the simulation runs, with Poisson arrivals and
+departures. A crashed node sends nothing, so its neighbours only find out
+through their own maintenance rounds.
+
+Every join, leave and crash is recorded in a trace that can be written to a file
+and replayed, so the same churn can be run against different maintenance
+intervals or latencies. While churn lasts, lookups for random digests can be
+started from random live nodes to measure how many succeed and how many more
+hops they take than on the ideal ring of live nodes.
+
+The ring is checked at a fixed interval against the ideal ring of live nodes.
+Finger errors are counted as in `evaluate_logs.calculate_errors`, and the
+simulation stops once the ring has converged after the last membership change.
+
+Finger and join lookups are routed through the current state of the ring when they
+start, and their result is delivered after one latency per hop plus the reply. Like
+any other lookup they time out at a departed node, and are then skipped or retried
+rather than answered with a node that is gone. A leaving node only reaches the
+neighbours it knows about, so nodes also forget departed predecessors and replace
+departed successors with their closest live finger.
+"""
+import argparse
+import collections
+import heapq
+import itertools
+import json
+import random
+import sys
+
+from directchord import build_nodes, DirectChordNode
+from hash import hash_value, HASH_FUNCTIONS
+from util import open_closed, open_open, finger_start
+
+# Intervals between maintenance rounds of a node in seconds, as in `async_node.AsyncNode.run`
+STABILIZE_INTERVAL = 5
+FIX_FINGERS_INTERVAL = 7
+
+LATENCY_DISTRIBUTIONS = ['constant', 'uniform', 'exponential']
+
+
+class EventQueue:
+    """ Simulated clock and the events scheduled on it
+
+    Events with the same time run in the order they were scheduled.
+    """
+
+    def __init__(self):
+        self.now = 0
+        self.events = []
+        self.counter = itertools.count()
+
+    def schedule(self, delay, callback, *args):
+        heapq.heappush(self.events, (self.now + delay, next(self.counter), callback, args))
+
+    def __len__(self):
+        return len(self.events)
+
+    def run(self, until, stop=lambda: False):
+        """ Processes events in time order until `until`, or until `stop` returns True
+
+        :return: number of events processed
+        """
+        processed = 0
+        while self.events and self.events[0][0] <= until and not stop():
+            self.now, _, callback, args = heapq.heappop(self.events)
+            callback(*args)
+            processed += 1
+
+        return processed
+
+
+class SimNode(DirectChordNode):
+    """ Chord node that can leave the ring
+
+    Departed nodes are skipped when choosing a finger to route through. Fingers are
+    refreshed one at a time in order, as in `node.VirtualNode.next_finger_key`.
+    """
+
+    def __init__(self, node_name, node_id, num_bits):
+        super().__init__(node_name, node_id, num_bits)
+        self.alive = True
+        self.next_finger = 0
+
+    def closest_preceding_node(self, digest):
+        for finger in reversed(self.fingers):
+            if finger and finger.alive and open_open(self.digest_id, digest, finger.get_id()):
+                return finger
+
+        return self.successor
+
+
+def latency_sampler(distribution, mean, rng):
+    """ Function returning message latencies in seconds
+
+    :param distribution: 'constant', 'uniform' on [0, 2 * mean] or 'exponential'
+    :param mean: mean latency in seconds
+    :param rng: random.Random to draw latencies from
+    """
+    if distribution == 'constant':
+        return lambda: mean
+    elif distribution == 'uniform':
+        return lambda: rng.uniform(0, 2 * mean)
+    elif distribution == 'exponential':
+        return lambda: rng.expovariate(1 / mean) if mean else 0
+    else:
+        raise ValueError(f'Unknown latency distribution {distribution}. '
+                         f'Available distributions: {", ".join(LATENCY_DISTRIBUTIONS)}')
+
+
+def ring_errors(nodes):
+    """ Successor and finger errors of the live nodes
+
+    :param nodes: SortedDict of digest to live node
+    :return: number of nodes with the wrong successor, and a list of (digest, index, actual, expected)
+        finger errors as in `evaluate_logs.calculate_errors`
+    """
+    ring = nodes.values()
+    num_nodes = len(nodes)
+
+    successor_errors = 0
+    finger_errors = []
+    for position, node in enumerate(ring):
+        if node.successor is not ring[(position + 1) % num_nodes]:
+            successor_errors += 1
+
+        for i, finger in enumerate(node.fingers):
+            expected = ring[nodes.bisect_left(finger_start(node.digest_id, i, node.num_bits)) % num_nodes]
+            if finger is not expected:
+                finger_errors.append((node.digest_id, i, finger.get_id() if finger else None, expected.get_id()))
+
+    return successor_errors, finger_errors
+
+
+def route(node, digest):
+    """ Routes from `node` as `DirectNode.find_successor` does, but stops at departed nodes
+
+    A lookup forwarded to, or answered with, a node that has left or crashed times out.
+
+    :return: node responsible for `digest`, or None if the lookup timed out, and hops taken
+    """
+    hops = 0
+    while digest != node.digest_id:
+        if open_closed(node.digest_id, node.successor.digest_id, digest):
+            return (node.successor if node.successor.alive else None), hops + 1
+
+        node = node.find_next_node(digest)
+        hops += 1
+        if not node.alive:
+            return None, hops
+
+    return node, hops
+
+
+def ideal_hops(nodes, start, digest, num_bits):
+    """ Hops a lookup takes on the ring of live nodes when every successor and finger is correct
+
+    :param nodes: SortedDict of digest to live node
+    :param start: digest of the node the lookup starts at
+    :param digest: digest to look up
+    """
+    ring = nodes.keys()
+    num_nodes = len(nodes)
+
+    def successor(point):
+        return ring[nodes.bisect_left(point) % num_nodes]
+
+    hops = 0
+    node = start
+    while digest != node:
+        next_id = ring[nodes.bisect_right(node) % num_nodes]
+        if open_closed(node, next_id, digest):
+            return hops + 1
+
+        # Closest preceding finger, as in `DirectChordNode.closest_preceding_node`
+        for i in reversed(range(num_bits)):
+            finger = successor(finger_start(node, i, num_bits))
+            if open_open(node, digest, finger):
+                next_id = finger
+                break
+
+        node = next_id
+        hops += 1
+
+    return hops
+
+
+def write_trace(file, trace):
+    """ Writes churn events to `file`, one JSON object per line """
+    for event in trace:
+        print(json.dumps(event), file=file)
+
+
+def read_trace(file):
+    """ Churn events written by `write_trace` """
+    return [json.loads(line) for line in file if line.strip()]
+
+
+class Simulation:
+    """ Chord ring maintained by simulated stabilize and fix_fingers rounds
+
+    :param num_nodes: number of nodes in the initial ring
+    :param num_bits: number of bits in the identifier space
+    :param hash_name: hash function for node names
+    :param stabilize_interval: seconds between stabilize rounds of a node
+    :param fix_fingers_interval: seconds between fixing fingers of a node, one finger per round
+    :param latency: function returning the latency of a message in seconds
+    :param join_rate: mean joins per second while churn lasts
+    :param leave_rate: mean graceful leaves per second while churn lasts
+    :param churn_duration: seconds from the start during which nodes join and leave
+    :param check_interval: seconds between checks of the ring against the ideal ring
+    :param initial_fingers: 'correct' to start the initial ring with correct fingers, 'empty' to start without
+    :param seed: seed for the phases of maintenance rounds, churn and lookups
+    :param crash_rate: mean crashes per second while churn lasts
+    :param lookup_rate: mean lookups per second while churn lasts
+    :param trace: churn events to replay instead of drawing joins, leaves and crashes at random
+    """
+
+    def __init__(self, num_nodes, num_bits, hash_name=None, stabilize_interval=STABILIZE_INTERVAL,
+                 fix_fingers_interval=FIX_FINGERS_INTERVAL, latency=lambda: 0, join_rate=0, leave_rate=0,
+                 churn_duration=0, check_interval=STABILIZE_INTERVAL, initial_fingers='correct', seed=0,
+                 crash_rate=0, lookup_rate=0, trace=None):
+        self.num_bits = num_bits
+        self.hash_name = hash_name
+        self.stabilize_interval = stabilize_interval
+        self.fix_fingers_interval = fix_fingers_interval
+        self.latency = latency
+        self.check_interval = check_interval
+        self.rng = random.Random(seed)
+
+        self.events = EventQueue()
+        self.nodes = build_nodes(num_nodes, SimNode, num_bits=num_bits, hash_name=hash_name)
+        if initial_fingers == 'empty':
+            for node in self.nodes.values():
+                node.fingers = [None] * num_bits
+
+        self.joins = 0
+        self.leaves = 0
+        self.crashes = 0
+        self.messages = collections.Counter()
+        self.pending_joins = 0
+        self.join_ids = itertools.count()
+        self.last_change = 0
+        self.churn_duration = churn_duration
+        self.converged_at = None
+        self.samples = []
+        self.trace = []
+
+        self.lookups = 0
+        self.lookup_successes = 0
+        self.lookup_hops = 0
+        self.lookup_ideal_hops = 0
+
+        for node in self.nodes.values():
+            self.start_maintenance(node)
+
+        if trace is None:
+            self.schedule_poisson(join_rate, self.join)
+            self.schedule_poisson(leave_rate, self.leave)
+            self.schedule_poisson(crash_rate, self.crash)
+        else:
+            self.replay(trace)
+        self.schedule_poisson(lookup_rate, self.lookup)
+        self.events.schedule(0, self.check)
+
+    def start_maintenance(self, node):
+        # Start each node at a random phase so rounds are not synchronized
+        self.events.schedule(self.rng.uniform(0, self.stabilize_interval), self.stabilize, node)
+        self.events.schedule(self.rng.uniform(0, self.fix_fingers_interval), self.fix_fingers, node)
+
+    def schedule_poisson(self, rate, action):
+        # Poisson process: exponential gaps between events
+        if rate <= 0:
+            return
+
+        time = self.rng.expovariate(rate)
+        while time < self.churn_duration:
+            self.events.schedule(time, action)
+            time += self.rng.expovariate(rate)
+
+    def replay(self, trace):
+        actions = {'join': self.join, 'leave': self.leave, 'crash': self.crash}
+        for event in trace:
+            self.events.schedule(event['time'], actions[event['event']], event['node'])
+            self.churn_duration = max(self.churn_duration, event['time'])
+
+    def record(self, event, node_name):
+        self.trace.append({"time": self.events.now, "event": event, "node": node_name})
+
+    def find_node(self, node_name):
+        node = self.nodes.get(hash_value(node_name, self.num_bits, self.hash_name))
+        return node if node and node.name == node_name else None
+
+    def send(self, callback, *args, hops=1):
+        """ Delivers a message, or a chain of `hops` messages, after the sum of their latencies
+
+        Messages are counted by the name of the callback handling them.
+        """
+        self.messages[callback.__name__] += hops
+        self.events.schedule(sum(self.latency() for _ in range(hops)), callback, *args)
+
+    def timed_out(self, callback, hops):
+        """ Counts the messages forwarded by a lookup that timed out before its reply reached `callback` """
+        self.messages[callback.__name__] += hops
+
+    def stabilize(self, node):
+        if not node.alive:
+            return
+
+        self.events.schedule(self.stabilize_interval, self.stabilize, node)
+        self.check_predecessor(node)
+        if not node.successor.alive:
+            self.repair_successor(node)
+            return
+
+        self.send(self.get_predecessor, node, node.successor)
+
+    def repair_successor(self, node):
+        # A successor that left without reaching this node is replaced by the closest live
+        # finger, and stabilize walks back from there. Without live fingers the node looks
+        # up its successor again through any live node
+        self.messages['repair_successor'] += 1
+        for finger in node.fingers:
+            if finger and finger.alive and finger is not node:
+                node.successor = finger
+                return
+
+        self.find_join_successor(node, joining=False)
+
+    def check_predecessor(self, node):
+        # A predecessor that left without reaching this node would block notify from the
+        # node that replaced it, so forget predecessors that no longer respond
+        if node.predecessor:
+            self.messages['check_predecessor'] += 1
+            if not node.predecessor.alive:
+                node.predecessor = None
+
+    def get_predecessor(self, node, successor):
+        if successor.alive:
+            self.send(self.predecessor_reply, node, successor, successor.predecessor)
+
+    def predecessor_reply(self, node, successor, predecessor):
+        if not node.alive:
+            return
+
+        if node.successor is successor and predecessor and predecessor.alive \
+                and open_open(node.digest_id, successor.digest_id, predecessor.digest_id):
+            node.successor = predecessor
+
+        self.send(self.notify, node.successor, node)
+
+    def notify(self, node, other):
+        if node.alive and other.alive:
+            node.notify(other)
+
+    def fix_fingers(self, node):
+        if not node.alive:
+            return
+
+        self.events.schedule(self.fix_fingers_interval, self.fix_fingers, node)
+
+        index = node.next_finger
+        node.next_finger = (index + 1) % node.num_bits
+        finger, hops = route(node, finger_start(node.digest_id, index, node.num_bits))
+        if finger is None:
+            # The finger is refreshed again on a later round
+            self.timed_out(self.set_finger, hops)
+            return
+
+        # The lookup is forwarded once per hop, then the result is returned to the node
+        self.send(self.set_finger, node, index, finger, hops=hops + 1)
+
+    def set_finger(self, node, index, finger):
+        if node.alive:
+            node.fingers[index] = finger
+
+    def join(self, name=None):
+        if name is None:
+            name = f'node_joined_{next(self.join_ids)}'
+        self.record('join', name)
+
+        digest = hash_value(name, self.num_bits, self.hash_name)
+        if digest in self.nodes:
+            return
+
+        node = SimNode(name, digest, self.num_bits)
+        node.fingers = [None] * self.num_bits
+        self.pending_joins += 1
+        self.find_join_successor(node)
+
+    def find_join_successor(self, node, joining=True):
+        # Bootstrap from any live node. Looking up the identifier after the node's own finds
+        # its successor whether or not the node is already in the ring
+        known = self.nodes.values()[self.rng.randrange(len(self.nodes))]
+        successor, hops = route(known, finger_start(node.digest_id, 0, node.num_bits))
+        if successor is None:
+            # A joining node tries again after waiting out the lookup. A node already in
+            # the ring repairs its successor again on its next stabilize round
+            self.timed_out(self.complete_join, hops)
+            if joining:
+                self.events.schedule(self.stabilize_interval, self.find_join_successor, node)
+            return
+
+        self.send(self.complete_join, node, successor, joining, hops=hops + 1)
+
+    def complete_join(self, node, successor, joining):
+        if not joining and not node.alive:
+            return
+
+        if not successor.alive:
+            self.find_join_successor(node, joining)
+            return
+
+        node.successor = successor
+        if not joining:
+            # Repaired the successor of a node already in the ring
+            return
+
+        self.pending_joins -= 1
+        if node.digest_id in self.nodes:
+            # Another node with the same digest joined first
+            return
+
+        # The successor's fingers are a first guess at the joining node's own, so it has
+        # somewhere to route if its successor leaves before fix_fingers has run
+        node.fingers = list(successor.fingers)
+
+        self.nodes[node.digest_id] = node
+        self.joins += 1
+        self.membership_changed()
+        self.start_maintenance(node)
+
+    def leave(self, name=None):
+        node = self.remove(name, 'leave')
+        if not node:
+            return
+
+        self.leaves += 1
+
+        # A leaving node hands its neighbours to each other
+        if node.predecessor:
+            self.send(self.replace_successor, node.predecessor, node, node.successor)
+        self.send(self.replace_predecessor, node.successor, node, node.predecessor)
+
+    def crash(self, name=None):
+        # A crashed node stops without telling anyone
+        if self.remove(name, 'crash'):
+            self.crashes += 1
+
+    def remove(self, name, event):
+        """ Takes the named node, or a random node, out of the ring
+
+        :return: the removed node, or None if the node is not in the ring or too few nodes are left
+        """
+        if len(self.nodes) <= 2:
+            return None
+
+        if name is None:
+            node = self.nodes.values()[self.rng.randrange(len(self.nodes))]
+        else:
+            node = self.find_node(name)
+            if not node:
+                return None
+
+        del self.nodes[node.digest_id]
+        node.alive = False
+        self.record(event, node.name)
+        self.membership_changed()
+        return node
+
+    def replace_successor(self, node, leaving, successor):
+        if node.alive and node.successor is leaving:
+            node.successor = successor
+
+    def replace_predecessor(self, node, leaving, predecessor):
+        if node.alive and node.predecessor is leaving:
+            node.predecessor = predecessor
+
+    def lookup(self):
+        start = self.nodes.values()[self.rng.randrange(len(self.nodes))]
+        digest = self.rng.getrandbits(self.num_bits)
+
+        found, hops = route(start, digest)
+        self.messages['lookup'] += hops + 1
+        self.lookups += 1
+
+        expected = self.nodes.values()[self.nodes.bisect_left(digest) % len(self.nodes)]
+        if found is expected:
+            self.lookup_successes += 1
+            self.lookup_hops += hops
+            self.lookup_ideal_hops += ideal_hops(self.nodes, start.digest_id, digest, self.num_bits)
+
+    def membership_changed(self):
+        self.last_change = self.events.now
+        self.converged_at = None
+
+    def check(self):
+        successor_errors, finger_errors = ring_errors(self.nodes)
+        num_nodes = len(self.nodes)
+        self.samples.append({"time": self.events.now, "nodes": num_nodes,
+                             "successor_error_rate": successor_errors / num_nodes,
+                             "finger_error_rate": len(finger_errors) / (num_nodes * self.num_bits)})
+
+        churn_over = self.events.now >= self.churn_duration and not self.pending_joins
+        if churn_over and not successor_errors and not finger_errors:
+            self.converged_at = self.events.now
+        else:
+            self.events.schedule(self.check_interval, self.check)
+
+    def run(self, max_time):
+        """ Runs until the ring converges after the last membership change, or until `max_time`
+
+        :return: dictionary summarizing the run
+        """
+        processed = self.events.run(max_time, lambda: self.converged_at is not None)
+
+        converged = self.converged_at is not None
+        return {"nodes": len(self.nodes), "joins": self.joins, "leaves": self.leaves, "crashes": self.crashes,
+                "messages": sum(self.messages.values()),
+                "maintenance_messages": sum(count for kind, count in self.messages.items() if kind != 'lookup'),
+                "events": processed, "time": self.events.now,
+                "converged": converged, "last_change": self.last_change,
+                "convergence_time": self.converged_at - self.last_change if converged else None,
+                "finger_error_rate": self.samples[-1]["finger_error_rate"],
+                "lookups": self.lookups,
+                "lookup_success_rate": self.lookup_successes / self.lookups if self.lookups else None,
+                "hop_inflation": self.lookup_hops / self.lookup_ideal_hops if self.lookup_ideal_hops else None}
+
+
+def config_parser():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('num_nodes', type=int, help='number of nodes in the initial ring')
+    parser.add_argument('--num-bits', '-b', type=int, default=32,
+                        help='number of bits in the identifier space')
+    parser.add_argument('--hash', type=str, choices=HASH_FUNCTIONS.keys(), default=None,
+                        help='hash function to use. Defaults to md5, or sha1 for more than 128 bits')
+    parser.add_argument('--stabilize-interval', type=float, default=STABILIZE_INTERVAL,
+                        help='seconds between stabilize rounds of each node')
+    parser.add_argument('--fix-fingers-interval', type=float, default=FIX_FINGERS_INTERVAL,
+                        help='seconds between fixing one finger of each node')
+    parser.add_argument('--latency', type=float, default=0.01,
+                        help='mean message latency in seconds')
+    parser.add_argument('--latency-distribution', choices=LATENCY_DISTRIBUTIONS, default='exponential',
+                        help='distribution of message latencies')
+    parser.add_argument('--join-rate', type=float, default=0,
+                        help='mean number of nodes joining per second during churn')
+    parser.add_argument('--leave-rate', type=float, default=0,
+                        help='mean number of nodes leaving per second during churn')
+    parser.add_argument('--crash-rate', type=float, default=0,
+                        help='mean number of nodes crashing per second during churn')
+    parser.add_argument('--churn-duration', type=float, default=0,
+                        help='seconds from the start during which nodes join, leave and crash')
+    parser.add_argument('--lookup-rate', type=float, default=0,
+                        help='mean number of lookups started per second during churn')
+    parser.add_argument('--record-trace', type=str, default=None,
+                        help='file to write the joins, leaves and crashes of the run to')
+    parser.add_argument('--replay-trace', type=str, default=None,
+                        help='file of joins, leaves and crashes to replay instead of random churn')
+    parser.add_argument('--initial-fingers', choices=['correct', 'empty'], default='correct',
+                        help='start the initial ring with correct or empty finger tables')
+    parser.add_argument('--check-interval', type=float, default=STABILIZE_INTERVAL,
+                        help='seconds between checks of the ring against the ideal ring')
+    parser.add_argument('--max-time', type=float, default=3600,
+                        help='seconds of simulated time to stop after if the ring has not converged')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed for latencies, maintenance phases and churn')
+    parser.add_argument('--samples', action='store_true',
+                        help='print the error rates found at every check')
+
+    return parser
+
+
+def main(output, args):
+    parser = config_parser()
+    args = parser.parse_args(args)
+
+    trace = None
+    if args.replay_trace:
+        with open(args.replay_trace) as f:
+            trace = read_trace(f)
+
+    rng = random.Random(args.seed)
+    simulation = Simulation(args.num_nodes, args.num_bits, args.hash, args.stabilize_interval,
+                            args.fix_fingers_interval, latency_sampler(args.latency_distribution, args.latency, rng),
+                            args.join_rate, args.leave_rate, args.churn_duration, args.check_interval,
+                            args.initial_fingers, args.seed, args.crash_rate, args.lookup_rate, trace)
+    result = simulation.run(args.max_time)
+
+    if args.record_trace:
+        with open(args.record_trace, 'w') as f:
+            write_trace(f, simulation.trace)
+
+    crashes = f"{result['crashes']} crashes, " if result['crashes'] else ''
+    print(f"Simulated {result['time']:.1f} seconds: {result['joins']} joins, {result['leaves']} leaves, "
+          f"{crashes}{result['nodes']} nodes, {result['messages']} messages", file=output)
+    if result['converged']:
+        print(f"Converged {result['convergence_time']:.1f} seconds after the last membership change", file=output)
+    else:
+        print(f"Did not converge. Finger error rate {result['finger_error_rate']:.4f}", file=output)
+
+    if result['lookups']:
+        inflation = f"{result['hop_inflation']:.3f}" if result['hop_inflation'] else 'n/a'
+        print(f"{result['lookups']} lookups during churn: success rate {result['lookup_success_rate']:.4f}, "
+              f"hop inflation {inflation}, {result['maintenance_messages']} maintenance messages", file=output)
+
+    if args.samples:
+        print(json.dumps(simulation.samples), file=output)
+
+
+if __name__ == "__main__":
+    main(sys.stdout, sys.argv[1:])
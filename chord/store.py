@@ -0,0 +1,101 @@
+"""Keys and values stored on the chord ring
+
+Each virtual node keeps the keys it is responsible for, i.e. the keys with digests
+between its predecessor and itself, in a `Store`. Clients send `GET`, `PUT` and
+`DELETE` operations to any node, which routes them to the virtual node owning the
+key (see `node.StoreCommand`).
+
+Every key has a version, assigned by the virtual node that applies a write, so
+copies of a key on other nodes (see `replication`) can be told apart by age. A
+deleted key is kept with a value of None, so an older copy does not bring it back.
+A store can keep a `merkle.MerkleTree` of the versions of its keys up to date as
+they are written, which replicas compare to find the keys they disagree on.
+"""
+import time
+
+from merkle import MerkleTree
+
+# Operations
+GET = 1
+PUT = 2
+DELETE = 3
+
+OPERATIONS = {'get': GET, 'put': PUT, 'delete': DELETE}
+
+# Result of an operation
+OK = 0
+NOT_FOUND = 1
+UNAVAILABLE = 2
+INVALID = 3
+
+
+class Store:
+    """ Keys and values held by one virtual node, along with the digest and version of each key """
+
+    def __init__(self):
+        self.entries = {}
+        self.tree = None
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        return entry[1] if entry else None
+
+    def version(self, key):
+        """ :return: version of the key, or 0 if it was never stored """
+        entry = self.entries.get(key)
+        return entry[2] if entry else 0
+
+    def put(self, key, digest, value, version=None):
+        """ Stores a value, or the deletion of the key if `value` is None
+
+        :param version: version of a value written elsewhere. A value older than the one
+                        stored is ignored. A new version is assigned if it is None
+        :return: version stored, or None if the stored value is newer
+        """
+        current = self.version(key)
+        if version is None:
+            # Later than any version the key had, even if it came from a node whose clock is ahead
+            version = max(time.time_ns(), current + 1)
+        elif version <= current:
+            return None
+
+        self.entries[key] = (digest, value, version)
+        if self.tree:
+            self.tree.update(key, digest, current, version)
+        return version
+
+    def delete(self, key, digest=None):
+        """ Stores the deletion of a key, which replicas may still hold even if this store does not
+
+        :return: True if the key was stored
+        """
+        entry = self.entries.get(key)
+        if entry or digest is not None:
+            self.put(key, entry[0] if entry else digest, None)
+        return bool(entry) and entry[1] is not None
+
+    def remove(self, key):
+        """ Forgets a key that belongs to another virtual node now """
+        entry = self.entries.pop(key, None)
+        if entry and self.tree:
+            self.tree.update(key, entry[0], entry[2], 0)
+
+    def track(self, start, end, num_bits):
+        """ Keeps a Merkle tree of the keys with digests in `(start, end]` from now on
+
+        The tree is only built again when the arc changes.
+
+        :return: the MerkleTree
+        """
+        if not self.tree or (self.tree.start, self.tree.end, self.tree.num_bits) != (start, end, num_bits):
+            self.tree = MerkleTree(start, end, num_bits)
+            for key, (digest, _, version) in self.entries.items():
+                self.tree.update(key, digest, 0, version)
+        return self.tree
+
+    def __len__(self):
+        """ Number of keys, including deleted keys """
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
@@ -0,0 +1,192 @@
+"""Handoff of stored keys between virtual nodes
+
+A virtual node owns the keys with digests in `(predecessor, self]`. When its
+predecessor changes, e.g. because a node joined just before it, the keys outside
+its new arc belong to the new predecessor. When a node leaves the ring, its keys
+belong to its successor. `OutgoingTransfer` streams such keys to their new owner
+in chunks of at most `CHUNK_KEYS` keys or `CHUNK_BYTES` bytes, and keeps at most
+`WINDOW` chunks unacknowledged. The receiver applies chunks in order and answers
+each with the sequence number of the next chunk it expects. The sender deletes
+the keys of a chunk once it is acknowledged.
+
+A transfer that makes no progress for `TRANSFER_WAIT` milliseconds is resumed
+from the first unacknowledged chunk, since every acknowledged key has already
+been applied by the receiver and deleted by the sender. Chunks are only sent as
+acknowledgements arrive, and the keys that move are picked while chunks are built,
+at most `SCAN_KEYS` at a time. A transfer therefore never holds up the node's
+other commands for longer than it takes to build one chunk, however many keys the
+store holds.
+"""
+import collections
+import random
+import time
+
+# Most keys and bytes of keys and values in one chunk
+CHUNK_KEYS = 256
+CHUNK_BYTES = 64 * 1024
+
+# Most keys of the store looked at while building one chunk
+SCAN_KEYS = 4096
+
+# Chunks sent and not yet acknowledged
+WINDOW = 4
+
+# Milliseconds without an acknowledgement before a transfer is resumed
+TRANSFER_WAIT = 2000
+
+# Milliseconds without a chunk before a receiver gives up on a transfer
+INCOMING_WAIT = 5 * TRANSFER_WAIT
+
+
+class TransferStats:
+    """ Keys and bytes a node handed off and received, and the time spent handing them off """
+
+    def __init__(self):
+        self.keys_sent = 0
+        self.bytes_sent = 0
+        self.keys_received = 0
+        self.bytes_received = 0
+        self.chunks_resent = 0
+        self.transfers_completed = 0
+        self.seconds_sending = 0.0
+
+    def rate(self):
+        """ :return: bytes per second handed off over the transfers completed so far """
+        return self.bytes_sent / self.seconds_sending if self.seconds_sending else 0.0
+
+    def as_dict(self):
+        return dict(vars(self), bytes_per_second=self.rate())
+
+
+class OutgoingTransfer:
+    """ Keys of one virtual node being handed to a new owner
+
+    :param target: RoutingInfo of the virtual node receiving the keys
+    :param keys: keys that may be handed off, in the order they are sent
+    :param leaving: whether the sending virtual node is leaving the ring
+    :param moves: function of a key's digest telling whether the key is handed off.
+                  Every key is handed off if it is None
+    """
+
+    def __init__(self, target, keys, leaving=False, moves=None):
+        self.transfer_id = random.getrandbits(63)
+        self.target = target
+        self.leaving = leaving
+        self.moves = moves
+        self.pending = collections.deque(keys)
+        self.in_flight = collections.OrderedDict()
+        self.next_sequence = 0
+        self.sent_last = False
+        self.started = self.last_progress = time.monotonic()
+
+    def chunks(self, store):
+        """ Builds the chunks the window has room for
+
+        Keys deleted from `store` since the transfer started and keys that do not move
+        are skipped, so chunks can be empty.
+
+        :return: list of (sequence number, entries, whether it is the last chunk), where
+                 entries are tuples of key, digest, value and version
+        """
+        chunks = []
+        while not self.sent_last and len(self.in_flight) < WINDOW:
+            entries = []
+            size = scanned = 0
+            while self.pending and len(entries) < CHUNK_KEYS and size < CHUNK_BYTES and scanned < SCAN_KEYS:
+                key = self.pending.popleft()
+                entry = store.entries.get(key)
+                scanned += 1
+                if entry and (not self.moves or self.moves(entry[0])):
+                    entries.append((key, *entry))
+                    size += len(key.encode()) + len(entry[1] or b'')
+
+            sequence = self.next_sequence
+            self.next_sequence += 1
+            self.sent_last = not self.pending
+            self.in_flight[sequence] = ([entry[0] for entry in entries], size)
+            chunks.append((sequence, entries, self.sent_last))
+
+        return chunks
+
+    def acknowledge(self, expected, store):
+        """ Deletes the keys of every chunk before `expected` from `store`
+
+        :param expected: sequence number of the next chunk the receiver will apply
+        :return: number of keys and bytes of keys and values the receiver acknowledged
+        """
+        moved_keys = moved_bytes = 0
+        while self.in_flight and next(iter(self.in_flight)) < expected:
+            _, (keys, size) = self.in_flight.popitem(last=False)
+            for key in keys:
+                store.remove(key)
+            moved_keys += len(keys)
+            moved_bytes += size
+            self.last_progress = time.monotonic()
+        return moved_keys, moved_bytes
+
+    def stalled(self):
+        return time.monotonic() - self.last_progress >= TRANSFER_WAIT / 1000
+
+    def rewind(self):
+        """ Resends every unacknowledged chunk, starting with the first
+
+        :return: number of chunks that will be sent again
+        """
+        resent = len(self.in_flight)
+        if self.in_flight:
+            self.next_sequence = next(iter(self.in_flight))
+        for keys, _ in reversed(self.in_flight.values()):
+            self.pending.extendleft(reversed(keys))
+        self.in_flight.clear()
+        self.sent_last = False
+        self.last_progress = time.monotonic()
+        return resent
+
+    def done(self):
+        return self.sent_last and not self.in_flight
+
+
+class IncomingTransfer:
+    """ Progress of the keys a virtual node is receiving from one sender
+
+    Chunks arrive in the order they were sent. A receiver that sees a transfer for the
+    first time starts from the chunk that arrives first, since a resumed transfer only
+    sends chunks that were never acknowledged.
+
+    :param sender: RoutingInfo of the virtual node sending the keys
+    :param expected: sequence number of the first chunk to apply
+    :param leaving: whether the sender is leaving the ring
+    :param predecessor: RoutingInfo of the node before a sender that is leaving
+    """
+
+    def __init__(self, transfer_id, sender, expected=0, leaving=False, predecessor=None):
+        self.transfer_id = transfer_id
+        self.sender = sender
+        self.expected = expected
+        self.leaving = leaving
+        self.predecessor = predecessor
+        self.complete = False
+        self.last_seen = time.monotonic()
+
+    def apply(self, sequence, entries, last, store, skip=()):
+        """ Applies a chunk if it is the next one in order
+
+        :param skip: keys written on the receiver since the transfer started, which are
+                     newer than the values sent
+        :return: True if the chunk was applied, False for duplicates and chunks out of order
+        """
+        self.last_seen = time.monotonic()
+        if self.complete or sequence != self.expected:
+            return False
+
+        for key, digest, value, version in entries:
+            if key not in skip:
+                store.put(key, digest, value, version)
+
+        self.expected += 1
+        self.complete = last
+        return True
+
+    def expired(self):
+        """ Whether the sender stopped sending, e.g. because it failed or handed off elsewhere """
+        return not self.complete and time.monotonic() - self.last_seen >= INCOMING_WAIT / 1000
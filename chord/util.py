@@ -28,3 +28,14 @@ def open_open(start, end, test):
         return start < test < end
     else:
         return test > start or test < end
+
+
+def finger_start(digest, index, num_bits):
+    """ Start of the interval covered by finger `index` of the node with `digest`
+
+    :param digest: digest of the node owning the finger table
+    :param index: zero based index of the finger
+    :param num_bits: number of bits in the identifier space
+    :return: (digest + 2^index) mod 2^num_bits
+    """
+    return (digest + pow(2, index)) % pow(2, num_bits)
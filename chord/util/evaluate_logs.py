@@ -19,13 +19,17 @@ class NodeState:
     def get_parent(self):
         return self.node_dict['routing_info']['parent_digest']
 
+    def get_num_bits(self):
+        # The finger table has one entry per bit in the identifier space
+        return len(self.node_dict['fingers'])
+
     def get_finger_digests(self):
         return [finger['digest'] for finger in self.node_dict['fingers']]
 
     def assert_fingers(self, digests):
         errors = []
         for i, actual in enumerate(self.get_finger_digests()):
-            expected = self.get_id(i, self.get_digest(), digests)
+            expected = self.get_id(i, self.get_digest(), digests, self.get_num_bits())
             if actual != expected:
                 errors.append((self.get_digest(), i, actual, expected))
 
@@ -39,8 +43,8 @@ class NodeState:
 
 
     @staticmethod
-    def get_id(idx, node_id, ids):
-        search_id = (node_id + pow(2, idx)) % 255
+    def get_id(idx, node_id, ids, num_bits=NUM_BITS):
+        search_id = (node_id + pow(2, idx)) % pow(2, num_bits)
 
         for curr_id in ids:
             if curr_id >= search_id:
@@ -56,7 +60,7 @@ def calculate_errors(nodes_map):
     return errors
 
 
-def calculate_loads(digests):
+def calculate_loads(digests, num_bits=NUM_BITS):
     load = defaultdict(int)
     last_digest = 0
     for i, (digest, parent) in enumerate(digests):
@@ -64,7 +68,7 @@ def calculate_loads(digests):
             first_node = parent
         load[parent] += digest - last_digest
         last_digest = digest
-    load[first_node] += pow(2, NUM_BITS) - last_digest
+    load[first_node] += pow(2, num_bits) - last_digest
 
     return load
 
@@ -112,6 +116,8 @@ def config_parser():
                         help='calculate which fingers are incorrect, i.e. had not stabilized when the servers stopped')
     parser.add_argument('--verbose', '-v', action='store_true',
                         help='summarize finger errors')
+    parser.add_argument('--num-bits', '-b', type=int, default=NUM_BITS,
+                        help='number of bits in the identifier space the nodes were run with')
 
     return parser
 
@@ -124,6 +130,7 @@ def main():
     load_statistics = args.load_statistics
     finger_errors = args.finger_errors
     verbose = args.verbose
+    num_bits = args.num_bits
 
     # Parse log
     nodes_map, digests = parse_file(filename)
@@ -135,7 +142,7 @@ def main():
     if load_statistics:
         print(f'Evaluating {len(digests)} nodes')
         if digests:
-            load = calculate_loads(digests)
+            load = calculate_loads(digests, num_bits)
             print(f'Average load: {statistics.mean(load.values())}')
             print(f'Standard deviation: {statistics.stdev(load.values())}')
 
@@ -0,0 +1,282 @@
+"""Binary encoding of the commands nodes send to each other
+
+Commands used to be pickled, which is slow, produces large messages and runs
+arbitrary code when a peer sends a crafted message. Each command is now sent as
+a single frame with a fixed layout instead:
+
+    header        version, command type, flags, hops, return data, request id
+                  and search digest, packed with `HEADER`
+    routing info  repeated for each routing field of the command, followed by
+                  any lists of routing info specific to the command, e.g.
+                  successor lists. Packed with `ROUTING_INFO`, followed by the
+                  UTF-8 address
+
+Digests take `DIGEST_SIZE` bytes so every identifier space up to `hash.MAX_BITS`
+fits. Frames are decoded in place with `struct.unpack_from`. Every part of a
+command shares one frame because pyzmq spends more time on each extra frame of
+a multipart message than it takes to send these few bytes.
+
+Commands that carry data of their own, such as the keys and values of store
+operations, send it in further frames after the command, so values are neither
+copied into the command frame nor limited in size by it. The keys handed from
+one node to another when the ring changes are sent in chunks, each a single
+frame with a `TRANSFER` header followed by an `ENTRY` header, key and value for
+every key. Copies of keys sent to replicas use the same entries after a `REPLICA`
+header and the index and hash of any nodes of a Merkle tree, each packed with
+`TREE_NODE`.
+"""
+import struct
+
+from hash import MAX_BITS
+
+VERSION = 3
+
+DIGEST_SIZE = MAX_BITS // 8
+
+# version, command type, flags, hops, return data, request id, search digest
+HEADER = struct.Struct(f'!BBBxHiQ{DIGEST_SIZE}s')
+
+# flags, digest, parent digest, address length
+ROUTING_INFO = struct.Struct(f'!B{DIGEST_SIZE}s{DIGEST_SIZE}sH')
+
+# operation, status, flags, client request id
+STORE = struct.Struct('!BBBxQ')
+
+# flags, number of entries, sequence number
+TRANSFER = struct.Struct('!BxHI')
+
+# kind, flags, number of entries, number of tree nodes
+REPLICA = struct.Struct('!BBII')
+
+# index, hash
+TREE_NODE = struct.Struct('!IQ')
+
+# flags, digest, version, key length, value length
+ENTRY = struct.Struct(f'!B{DIGEST_SIZE}sQHI')
+
+# Longest key in bytes whose length fits in an ENTRY
+MAX_KEY_SIZE = 0xFFFF
+
+# Header flags
+FOUND = 1
+HAS_REQUEST_ID = 2
+HAS_RETURN_DATA = 4
+HAS_SEARCH_DIGEST = 8
+
+# Routing info flags. Routing info without PRESENT stands for None
+PRESENT = 1
+HAS_DIGEST = 2
+HAS_PARENT = 4
+
+NO_DIGEST = bytes(DIGEST_SIZE)
+
+# Store flags
+HAS_STATUS = 1
+HAS_VALUE = 2
+FORWARDED = 4
+HANDING_OFF = 8
+
+# Transfer and replica flags
+LAST = 1
+LEAVING = 2
+ACKNOWLEDGED = 4
+
+# Entry flags
+DELETED = 1
+
+
+class WireError(ValueError):
+    """ Raised for messages that cannot be decoded """
+
+
+def pack_digest(digest):
+    return digest.to_bytes(DIGEST_SIZE, 'big') if digest is not None else NO_DIGEST
+
+
+def pack_header(command_type, hops=0, found=False, request_id=None, search_digest=None, return_data=None):
+    flags = (FOUND if found else 0) | \
+            (HAS_REQUEST_ID if request_id is not None else 0) | \
+            (HAS_RETURN_DATA if return_data is not None else 0) | \
+            (HAS_SEARCH_DIGEST if search_digest is not None else 0)
+    return HEADER.pack(VERSION, command_type, flags, hops, return_data or 0, request_id or 0,
+                       pack_digest(search_digest))
+
+
+def pack_routing_info(routing_info):
+    if routing_info is None:
+        return ROUTING_INFO.pack(0, NO_DIGEST, NO_DIGEST, 0)
+
+    flags = PRESENT | \
+            (HAS_DIGEST if routing_info.digest is not None else 0) | \
+            (HAS_PARENT if routing_info.parent_digest is not None else 0)
+    address = routing_info.address.encode() if routing_info.address else b''
+    return ROUTING_INFO.pack(flags, pack_digest(routing_info.digest), pack_digest(routing_info.parent_digest),
+                             len(address)) + address
+
+
+def unpack_header(buffer):
+    """ Decodes the header at the start of a frame
+
+    :return: tuple of command type, hops, found, request id, search digest and return data
+    """
+    if len(buffer) < HEADER.size:
+        raise WireError(f'Message has {len(buffer)} bytes, the header needs {HEADER.size}')
+
+    version, command_type, flags, hops, return_data, request_id, search_digest = HEADER.unpack_from(buffer)
+    if version != VERSION:
+        raise WireError(f'Unsupported protocol version {version}')
+
+    return (command_type, hops, bool(flags & FOUND),
+            request_id if flags & HAS_REQUEST_ID else None,
+            int.from_bytes(search_digest, 'big') if flags & HAS_SEARCH_DIGEST else None,
+            return_data if flags & HAS_RETURN_DATA else None)
+
+
+def unpack_routing_infos(buffer):
+    """ Decodes the routing info that follows the header of a frame
+
+    :return: list with a tuple of digest, parent digest and address for each routing
+             info, or None where the routing info was None
+    """
+    routing_infos = []
+    offset = HEADER.size
+    while offset < len(buffer):
+        if len(buffer) - offset < ROUTING_INFO.size:
+            raise WireError(f'Routing info at byte {offset} is cut short')
+
+        flags, digest, parent_digest, address_length = ROUTING_INFO.unpack_from(buffer, offset)
+        offset += ROUTING_INFO.size
+        address = buffer[offset:offset + address_length]
+        offset += address_length
+        if len(address) != address_length:
+            raise WireError(f'Address at byte {offset - address_length} is cut short')
+
+        if not flags & PRESENT:
+            routing_infos.append(None)
+            continue
+
+        try:
+            address = str(address, 'utf-8') or None
+        except UnicodeDecodeError as e:
+            raise WireError(f'Invalid address: {e}')
+
+        routing_infos.append((int.from_bytes(digest, 'big') if flags & HAS_DIGEST else None,
+                              int.from_bytes(parent_digest, 'big') if flags & HAS_PARENT else None,
+                              address))
+
+    return routing_infos
+
+
+def pack_store(operation, status=None, client_request_id=None, has_value=False, forwarded=False,
+               handing_off=False):
+    flags = (HAS_STATUS if status is not None else 0) | (HAS_VALUE if has_value else 0) | \
+            (FORWARDED if forwarded else 0) | (HANDING_OFF if handing_off else 0)
+    return STORE.pack(operation, status or 0, flags, client_request_id or 0)
+
+
+def unpack_store(buffer):
+    """ Decodes the frame that starts the data of a store operation
+
+    :return: tuple of operation, status, client request id, whether a value follows,
+             whether the operation was forwarded and whether the virtual node that forwarded
+             it is handing off the key
+    """
+    if len(buffer) != STORE.size:
+        raise WireError(f'Store operation has {len(buffer)} bytes, expected {STORE.size}')
+
+    operation, status, flags, client_request_id = STORE.unpack_from(buffer)
+    return (operation, status if flags & HAS_STATUS else None, client_request_id, bool(flags & HAS_VALUE),
+            bool(flags & FORWARDED), bool(flags & HANDING_OFF))
+
+
+def pack_entries(entries):
+    """ :param entries: tuples of key, digest, value and version, where a value of None marks a deleted key """
+    parts = []
+    for key, digest, value, version in entries:
+        key = key.encode()
+        flags = DELETED if value is None else 0
+        value = value or b''
+        parts += [ENTRY.pack(flags, pack_digest(digest), version, len(key), len(value)), key, value]
+    return b''.join(parts)
+
+
+def unpack_entries(buffer, offset, count, name):
+    """ Decodes `count` entries that start at `offset` and take up the rest of the buffer
+
+    :param name: what the entries belong to, for errors
+    :return: list of (key, digest, value, version)
+    """
+    entries = []
+    for _ in range(count):
+        if len(buffer) - offset < ENTRY.size:
+            raise WireError(f'Entry at byte {offset} is cut short')
+
+        flags, digest, version, key_length, value_length = ENTRY.unpack_from(buffer, offset)
+        offset += ENTRY.size
+        end = offset + key_length + value_length
+        if end > len(buffer):
+            raise WireError(f'Entry at byte {offset - ENTRY.size} is cut short')
+
+        try:
+            key = str(buffer[offset:offset + key_length], 'utf-8')
+        except UnicodeDecodeError as e:
+            raise WireError(f'Invalid key: {e}')
+
+        value = None if flags & DELETED else bytes(buffer[offset + key_length:end])
+        entries.append((key, int.from_bytes(digest, 'big'), value, version))
+        offset = end
+
+    if offset != len(buffer):
+        raise WireError(f'{name} has {len(buffer) - offset} bytes after its entries')
+
+    return entries
+
+
+def pack_transfer(sequence, entries=(), last=False, leaving=False, acknowledged=False):
+    """ Encodes a chunk of a key transfer, or its acknowledgement
+
+    :param entries: tuples of key, digest, value and version
+    """
+    flags = (LAST if last else 0) | (LEAVING if leaving else 0) | (ACKNOWLEDGED if acknowledged else 0)
+    return TRANSFER.pack(flags, len(entries), sequence) + pack_entries(entries)
+
+
+def unpack_transfer(buffer):
+    """ Decodes a chunk of a key transfer
+
+    :return: tuple of sequence number, list of (key, digest, value, version), whether it is
+             the last chunk, whether the sender is leaving the ring and whether it is an
+             acknowledgement
+    """
+    if len(buffer) < TRANSFER.size:
+        raise WireError(f'Transfer has {len(buffer)} bytes, the header needs {TRANSFER.size}')
+
+    flags, count, sequence = TRANSFER.unpack_from(buffer)
+    entries = unpack_entries(buffer, TRANSFER.size, count, 'Transfer')
+    return sequence, entries, bool(flags & LAST), bool(flags & LEAVING), bool(flags & ACKNOWLEDGED)
+
+
+def pack_replica(kind, entries=(), nodes=(), acknowledged=False):
+    """ Encodes copies of keys sent to or from a replica
+
+    :param entries: tuples of key, digest, value and version
+    :param nodes: tuples of index and hash of Merkle tree nodes
+    """
+    header = REPLICA.pack(kind, ACKNOWLEDGED if acknowledged else 0, len(entries), len(nodes))
+    return b''.join([header] + [TREE_NODE.pack(index, node) for index, node in nodes]) + pack_entries(entries)
+
+
+def unpack_replica(buffer):
+    """ :return: tuple of kind, list of (key, digest, value, version), list of (index, hash)
+                    of tree nodes and whether it is a reply
+    """
+    if len(buffer) < REPLICA.size:
+        raise WireError(f'Replica message has {len(buffer)} bytes, the header needs {REPLICA.size}')
+
+    kind, flags, count, node_count = REPLICA.unpack_from(buffer)
+    offset = REPLICA.size + node_count * TREE_NODE.size
+    if offset > len(buffer):
+        raise WireError(f'Replica message has {len(buffer)} bytes, {node_count} tree nodes need {offset}')
+
+    nodes = [TREE_NODE.unpack_from(buffer, REPLICA.size + i * TREE_NODE.size) for i in range(node_count)]
+    return kind, unpack_entries(buffer, offset, count, 'Replica message'), nodes, bool(flags & ACKNOWLEDGED)
@@ -14,11 +14,11 @@ from chord.hash import NUM_BITS
 # TODO starting node should pipe output to a file
 
 name_fmt = 'node_{id}'
-cmd_fmt = 'python chord/node.py {action} {name} tcp://{ip} --internal-port 5555 ' \
+cmd_fmt = 'python chord/async_node.py {action} {name} tcp://{ip} --internal-port 5555 ' \
           '--external-port 5556 --stabilize-interval {stabilize_interval} ' \
-          '--fix-fingers-interval {fix_fingers_interval} {ext} {virtual} &'
+          '--fix-fingers-interval {fix_fingers_interval} --num-bits {num_bits} {ext} {virtual} &'
 join_fmt_ext = '--known-endpoint tcp://{ip}:5555 --known-name {name}'
-shutdown_cmd_fmt = 'python chord/node.py shutdown {name} tcp://{ip} --internal-port 5555'
+shutdown_cmd_fmt = 'python chord/async_node.py shutdown {name} tcp://{ip} --internal-port 5555'
 
 
 class SingleSwitchTopo(Topo):
@@ -32,12 +32,24 @@ class SingleSwitchTopo(Topo):
             self.addLink(host, switch)
 
 
-def generate_hash():
+def generate_hash(num_bits=NUM_BITS):
     random.seed(0)
-    max_value = pow(2, NUM_BITS)
-    valid_hashes = range(max_value)
-    for hash_val in random.sample(valid_hashes, max_value):
-        yield hash_val
+    max_value = pow(2, num_bits)
+
+    # Keep the original shuffled sequence for the default width so seeded runs
+    # are reproducible, and only sample lazily for wide address spaces
+    if num_bits <= NUM_BITS:
+        valid_hashes = range(max_value)
+        for hash_val in random.sample(valid_hashes, max_value):
+            yield hash_val
+        return
+
+    generated = set()
+    while len(generated) < max_value:
+        hash_val = random.getrandbits(num_bits)
+        if hash_val not in generated:
+            generated.add(hash_val)
+            yield hash_val
 
 
 def create_network(n_hosts):
@@ -60,6 +72,8 @@ def config_parser():
                         help='seconds between fix fingers executions')
     parser.add_argument('--wait-per-node', '-w', type=int, default=10,
                         help='amount of time (in seconds) to wait per node for the network to stabilize')
+    parser.add_argument('--num-bits', '-b', type=int, default=NUM_BITS,
+                        help='number of bits in the identifier space')
 
     # TODO - should be able to have different numbers of virtual nodes on each node
     parser.add_argument('--nodes-per-host', '-nph', type=int, default=1,
@@ -75,15 +89,16 @@ def main():
     stabilize_interval = args.stabilize_interval
     fix_fingers_interval = args.fix_fingers_interval
     wait_per_node = args.wait_per_node
+    num_bits = args.num_bits
 
     num_nodes = args.nodes
-    if not num_nodes < pow(2, NUM_BITS):
-        print(f'Cannot create {num_nodes} nodes in {NUM_BITS}-bit address space', file=sys.stderr)
+    if not num_nodes < pow(2, num_bits):
+        print(f'Cannot create {num_nodes} nodes in {num_bits}-bit address space', file=sys.stderr)
         exit(1)
 
     num_virtual = args.nodes_per_host - 1
-    if not ((num_virtual + 1) * num_nodes) < pow(2, NUM_BITS):
-        print(f'Cannot create {num_virtual} hosted nodes in {NUM_BITS}-bit address space', file=sys.stderr)
+    if not ((num_virtual + 1) * num_nodes) < pow(2, num_bits):
+        print(f'Cannot create {num_virtual} hosted nodes in {num_bits}-bit address space', file=sys.stderr)
         exit(1)
 
     # Create and start network
@@ -99,7 +114,7 @@ def main():
     # In order to guarantee that we can specify the exact number of nodes/virtual nodes
     # and avoid hash collisions, we will generate random numbers in the address space and
     # use those as if they were hashes
-    hashes = generate_hash()
+    hashes = generate_hash(num_bits)
 
     node2name = {}
     for i, node in enumerate(net.hosts):
@@ -126,7 +141,7 @@ def main():
         cmd = cmd_fmt.format(action=action, name=name, ip=node.IP(), ext=ext,
                              stabilize_interval=stabilize_interval,
                              fix_fingers_interval=fix_fingers_interval,
-                             virtual=virtual)
+                             num_bits=num_bits, virtual=virtual)
 
         print(f'Starting node {name}: {cmd}')
         node.cmd(cmd)
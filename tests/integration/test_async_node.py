@@ -0,0 +1,181 @@
+import asyncio
+
+from chord.async_node import AsyncChordNode, AsyncNode
+from chord.hash import hash_value
+from chord.node import RoutingInfo, MAX_MISSED_REPLIES
+
+
+def test_join_and_stabilize():
+    asyncio.run(join_and_stabilize())
+
+
+async def join_and_stabilize():
+    names = ['node_0', 'node_1', 'node_2']
+    nodes = [AsyncNode(name, hash_value(name), 'tcp://127.0.0.1') for name in names]
+
+    nodes[0].create()
+    runs = [asyncio.ensure_future(nodes[0].run(None, None))]
+    for node in nodes[1:]:
+        assert await node.join(nodes[0].digest_id, nodes[0].internal_endpoint) == 1
+        runs.append(asyncio.ensure_future(node.run(None, None)))
+
+    # Successor lists are one round of stabilize behind the successors
+    for _ in range(5):
+        for node in nodes:
+            await node._stabilize()
+        await asyncio.sleep(.2)
+
+    ring = sorted(nodes, key=lambda node: node.digest_id)
+    for i, node in enumerate(ring):
+        v_node = node.virtual_nodes[node.digest_id]
+        assert v_node.successor.digest == ring[(i + 1) % len(ring)].digest_id
+        assert v_node.predecessor.digest == ring[i - 1].digest_id
+        assert [entry.digest for entry in v_node.successor_list] == \
+               [ring[(i + 1) % len(ring)].digest_id, ring[(i + 2) % len(ring)].digest_id]
+
+    for node in nodes:
+        node.stop()
+    await asyncio.gather(*runs)
+    assert all(node.shutdown for node in nodes)
+
+
+def test_concurrent_lookups():
+    asyncio.run(concurrent_lookups())
+
+
+async def concurrent_lookups():
+    v_nodes = {f'v_node_{digest}': digest for digest in [20, 90, 200]}
+    node = AsyncChordNode('node_0', 160, 'tcp://127.0.0.1', virtual=v_nodes)
+    node.create()
+    run = asyncio.ensure_future(node.run(None, None))
+
+    for _ in range(4):
+        await node._stabilize()
+        await asyncio.sleep(.1)
+    await node._fix_fingers()
+
+    # Lookups are in flight at the same time and each gets its own result
+    digests = list(range(0, 256, 7))
+    found = await asyncio.gather(*(node.lookup(digest) for digest in digests))
+
+    ring = [20, 90, 160, 200]
+    for digest, successor in zip(digests, found):
+        assert successor.digest == next((point for point in ring if point >= digest), ring[0])
+
+    node.stop()
+    await run
+
+
+def test_successor_fails():
+    asyncio.run(successor_fails())
+
+
+async def successor_fails():
+    names = ['node_0', 'node_1', 'node_2']
+    nodes = [AsyncNode(name, hash_value(name), 'tcp://127.0.0.1') for name in names]
+
+    nodes[0].create()
+    runs = {nodes[0]: asyncio.ensure_future(nodes[0].run(None, None))}
+    for node in nodes[1:]:
+        await node.join(nodes[0].digest_id, nodes[0].internal_endpoint)
+        runs[node] = asyncio.ensure_future(node.run(None, None))
+
+    for _ in range(5):
+        for node in nodes:
+            await node._stabilize()
+        await asyncio.sleep(.2)
+
+    ring = sorted(nodes, key=lambda node: node.digest_id)
+    first, failed, last = ring
+    failed.stop()
+    await runs.pop(failed)
+
+    # The first node fails over to the next node in its successor list once the
+    # failed node misses enough stabilize requests
+    for _ in range(MAX_MISSED_REPLIES):
+        await first._stabilize()
+    v_node = first.virtual_nodes[first.digest_id]
+    assert v_node.successor == RoutingInfo(last.digest_id, last.digest_id, last.internal_endpoint)
+
+    for node in [first, last]:
+        node.stop()
+    await asyncio.gather(*runs.values())
+
+
+def test_late_lookup_result():
+    asyncio.run(late_lookup_result())
+
+
+async def late_lookup_result():
+    node = AsyncChordNode('node_0', 160, 'tcp://127.0.0.1')
+    node.create()
+    run = asyncio.ensure_future(node.run(None, None))
+    v_node = node.virtual_nodes[node.digest_id]
+    fingers = list(v_node.fingers)
+
+    # The result comes back after the lookup gave up on it
+    assert await node.lookup(100, timeout=0) is None
+    await asyncio.sleep(.2)
+    assert not node.lookup_ids
+    assert v_node.fingers == fingers
+
+    # The node keeps handling commands
+    assert (await node.lookup(100)).digest == 160
+
+    node.stop()
+    await run
+
+
+def test_lookup_fails_over():
+    asyncio.run(lookup_fails_over())
+
+
+async def lookup_fails_over():
+    names = ['node_0', 'node_1', 'node_2']
+    nodes = [AsyncChordNode(name, hash_value(name), 'tcp://127.0.0.1') for name in names]
+
+    nodes[0].create()
+    runs = {nodes[0]: asyncio.ensure_future(nodes[0].run(None, None))}
+    for node in nodes[1:]:
+        await node.join(nodes[0].digest_id, nodes[0].internal_endpoint)
+        runs[node] = asyncio.ensure_future(node.run(None, None))
+
+    for _ in range(5):
+        for node in nodes:
+            await node._stabilize()
+        await asyncio.sleep(.2)
+
+    ring = sorted(nodes, key=lambda node: node.digest_id)
+    first, failed, last = ring
+    failed.stop()
+    await runs.pop(failed)
+    await asyncio.sleep(.2)
+
+    # The lookup is forwarded to the failed node, and continues through the
+    # successor list once the failed node cannot be reached
+    found = await first.lookup(last.digest_id)
+    assert found.digest == last.digest_id
+    assert first.virtual_nodes[first.digest_id].successor.digest == last.digest_id
+
+    for node in [first, last]:
+        node.stop()
+    await asyncio.gather(*runs.values())
+
+
+def test_fix_finger_times_out():
+    asyncio.run(fix_finger_times_out())
+
+
+async def fix_finger_times_out():
+    node = AsyncChordNode('node_0', 160, 'tcp://127.0.0.1')
+    run = asyncio.ensure_future(node.run(None, None))
+
+    # The lookup for the last finger is forwarded to a successor that never answers,
+    # so the finger is left as it was
+    v_node = node.virtual_nodes[node.digest_id]
+    v_node.successor = RoutingInfo(30, 30, 'tcp://127.0.0.1:1')
+    await node.fix_finger(v_node, v_node.num_bits - 1)
+    assert v_node.fingers == [None] * v_node.num_bits
+
+    node.stop()
+    await run
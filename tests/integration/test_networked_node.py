@@ -1,26 +1,40 @@
+import asyncio
 import logging
-import threading
-import time
-
-import zmq
 
+from chord.async_node import AsyncNode
 from chord.hash import hash_value, NUM_BITS
-from chord.node import Node, RoutingInfo
+from chord.node import RoutingInfo
+
+
+async def stabilize_in_order(node):
+    # _stabilize runs every virtual node at once. Running them one after another
+    # makes the order in which the links change predictable
+    for v_node in node.virtual_nodes.values():
+        await node.stabilize_vnode(v_node)
+
+
+async def fix_every_finger(node):
+    for v_node in node.virtual_nodes.values():
+        for index in range(v_node.num_bits):
+            await node.fix_finger(v_node, index)
 
 
 def test_join():
+    asyncio.run(join())
+
+
+async def join():
     name1 = 'node_0'
     digest1 = hash_value(name1)
-    node1 = Node(name1, digest1, 'tcp://127.0.0.1', '5500', '5501')
+    node1 = AsyncNode(name1, digest1, 'tcp://127.0.0.1', '5500', '5501')
 
     name2 = 'node_1'
     digest2 = hash_value(name2)
-    node2 = Node(name2, digest2, 'tcp://127.0.0.1', '5502', '5503')
+    node2 = AsyncNode(name2, digest2, 'tcp://127.0.0.1', '5502', '5503')
 
-    node1_t = threading.Thread(target=node1.run, args=[None, None], daemon=True)
-    node1_t.start()
+    node1_run = asyncio.ensure_future(node1.run(None, None))
 
-    joined = node2.join(node1.digest_id, node1.internal_endpoint)
+    joined = await node2.join(node1.digest_id, node1.internal_endpoint)
     assert joined == 1
 
     v_node1 = node1.virtual_nodes[digest1]
@@ -35,17 +49,14 @@ def test_join():
     assert v_node2.successor == RoutingInfo(160, 160, 'tcp://127.0.0.1:5501')
     assert v_node2.predecessor == RoutingInfo(163, 163, 'tcp://127.0.0.1:5503')
 
-    node2_t = threading.Thread(target=node2.run, args=[None, None], daemon=True)
-    node2_t.start()
+    node2_run = asyncio.ensure_future(node2.run(None, None))
 
     logging.info('Running stabilize for node 2')
-    stabilize_pair2 = node2.context.socket(zmq.PAIR)
-    stabilize_pair2.connect(node2.stabilize_address)
-    node2._stabilize(stabilize_pair2)
+    await node2._stabilize()
 
     # The last step of stabilize finishes asynchronously,
     # so wait until it is likely complete
-    time.sleep(.5)
+    await asyncio.sleep(.5)
 
     logging.info('Test stabilize node 2')
     assert v_node1.successor == RoutingInfo(160, 160, 'tcp://127.0.0.1:5501')
@@ -54,13 +65,11 @@ def test_join():
     assert v_node2.successor == RoutingInfo(160, 160, 'tcp://127.0.0.1:5501')
     assert v_node2.predecessor == RoutingInfo(163, 163, 'tcp://127.0.0.1:5503')
 
-    stabilize_pair1 = node1.context.socket(zmq.PAIR)
-    stabilize_pair1.connect(node1.stabilize_address)
-    node1._stabilize(stabilize_pair1)
+    await node1._stabilize()
 
     # The last step of stabilize finishes asynchronously,
     # so wait until it is likely complete
-    time.sleep(.5)
+    await asyncio.sleep(.5)
 
     logging.info('Test stabilize node 1')
     assert v_node1.successor == RoutingInfo(163, 163, 'tcp://127.0.0.1:5503')
@@ -69,13 +78,8 @@ def test_join():
     assert v_node2.successor == RoutingInfo(160, 160, 'tcp://127.0.0.1:5501')
     assert v_node2.predecessor == RoutingInfo(160, 160, 'tcp://127.0.0.1:5501')
 
-    fix_pair1 = node1.context.socket(zmq.PAIR)
-    fix_pair1.connect(node1.fix_fingers_address)
-    node1._fix_fingers(fix_pair1)
-
-    fix_pair2 = node2.context.socket(zmq.PAIR)
-    fix_pair2.connect(node2.fix_fingers_address)
-    node2._fix_fingers(fix_pair2)
+    await fix_every_finger(node1)
+    await fix_every_finger(node2)
 
     logging.info('Test final state')
     assert v_node1.fingers == [RoutingInfo(163, 163, 'tcp://127.0.0.1:5503'),
@@ -98,9 +102,9 @@ def test_join():
 
     name3 = 'node_2'
     digest3 = hash_value(name3)
-    node3 = Node(name3, digest3, 'tcp://127.0.0.1', '5504', '5505')
+    node3 = AsyncNode(name3, digest3, 'tcp://127.0.0.1', '5504', '5505')
 
-    joined = node3.join(node1.digest_id, node1.internal_endpoint)
+    joined = await node3.join(node1.digest_id, node1.internal_endpoint)
     assert joined == 1
 
     v_node3 = node3.virtual_nodes[digest3]
@@ -108,17 +112,14 @@ def test_join():
     assert v_node3.successor == RoutingInfo(160, 160, 'tcp://127.0.0.1:5501')
     assert v_node3.predecessor == RoutingInfo(32, 32, 'tcp://127.0.0.1:5505')
 
-    node3_t = threading.Thread(target=node3.run, args=[None, None], daemon=True)
-    node3_t.start()
+    node3_run = asyncio.ensure_future(node3.run(None, None))
 
     logging.info('Running stabilize for node 3')
-    stabilize_pair3 = node3.context.socket(zmq.PAIR)
-    stabilize_pair3.connect(node3.stabilize_address)
-    node3._stabilize(stabilize_pair3)
+    await node3._stabilize()
 
     # The last step of stabilize finishes asynchronously,
     # so wait until it is likely complete
-    time.sleep(.5)
+    await asyncio.sleep(.5)
 
     assert v_node1.successor == RoutingInfo(163, 163, 'tcp://127.0.0.1:5503')
     assert v_node1.predecessor == RoutingInfo(32, 32, 'tcp://127.0.0.1:5505')
@@ -128,11 +129,11 @@ def test_join():
     assert v_node3.predecessor == RoutingInfo(32, 32, 'tcp://127.0.0.1:5505')
 
     logging.info('Calling stabilize')
-    node2._stabilize(stabilize_pair2)
+    await node2._stabilize()
 
     # The last step of stabilize finishes asynchronously,
     # so wait until it is likely complete
-    time.sleep(.5)
+    await asyncio.sleep(.5)
 
     assert v_node1.successor == RoutingInfo(163, 163, 'tcp://127.0.0.1:5503')
     assert v_node1.predecessor == RoutingInfo(32, 32, 'tcp://127.0.0.1:5505')
@@ -141,8 +142,16 @@ def test_join():
     assert v_node3.successor == RoutingInfo(160, 160, 'tcp://127.0.0.1:5501')
     assert v_node3.predecessor == RoutingInfo(163, 163, 'tcp://127.0.0.1:5503')
 
+    for node in [node1, node2, node3]:
+        node.stop()
+    await asyncio.gather(node1_run, node2_run, node3_run)
+
 
 def test_stabilize():
+    asyncio.run(stabilize())
+
+
+async def stabilize():
     # TODO - verify this runs the same in other environments
     # Unclear if the dependencies between the dict and the order in which the stabilization
     # happens will be the same in another environemnt
@@ -150,16 +159,13 @@ def test_stabilize():
     v_nodes = {'v_node_53': 53,
                'v_node_234': 234,
                'v_node_172': 172}
-    node = Node('node_0', 160, 'tcp://127.0.0.1', '5556', '5555', v_nodes)
+    node = AsyncNode('node_0', 160, 'tcp://127.0.0.1', '5556', '5555', v_nodes)
     node.create()
 
-    node1_t = threading.Thread(target=node.run, args=[None, None], daemon=True)
-    node1_t.start()
+    run = asyncio.ensure_future(node.run(None, None))
 
-    stabilize_pair = node.context.socket(zmq.PAIR)
-    stabilize_pair.connect(node.stabilize_address)
-    node._stabilize(stabilize_pair)
-    time.sleep(.5)
+    await stabilize_in_order(node)
+    await asyncio.sleep(.5)
 
     v_node = node.virtual_nodes[160]
     assert v_node.successor.digest == 172
@@ -177,8 +183,8 @@ def test_stabilize():
     assert v_node.successor.digest == 234
     assert v_node.predecessor.digest == 234
 
-    node._stabilize(stabilize_pair)
-    time.sleep(.5)
+    await stabilize_in_order(node)
+    await asyncio.sleep(.5)
 
     v_node = node.virtual_nodes[160]
     assert v_node.successor.digest == 172
@@ -196,8 +202,8 @@ def test_stabilize():
     assert v_node.successor.digest == 172       # changed
     assert v_node.predecessor.digest == 234
 
-    node._stabilize(stabilize_pair)
-    time.sleep(.5)
+    await stabilize_in_order(node)
+    await asyncio.sleep(.5)
 
     v_node = node.virtual_nodes[160]
     assert v_node.successor.digest == 172
@@ -216,8 +222,8 @@ def test_stabilize():
     assert v_node.predecessor.digest == 234
 
     # Ensure nothing changes
-    node._stabilize(stabilize_pair)
-    time.sleep(.5)
+    await stabilize_in_order(node)
+    await asyncio.sleep(.5)
 
     v_node = node.virtual_nodes[160]
     assert v_node.successor.digest == 172
@@ -234,3 +240,6 @@ def test_stabilize():
     v_node = node.virtual_nodes[53]
     assert v_node.successor.digest == 160
     assert v_node.predecessor.digest == 234
+
+    node.stop()
+    await run
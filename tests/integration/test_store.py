@@ -0,0 +1,173 @@
+import asyncio
+
+from chord.async_node import AsyncChordNode
+from chord.client import Client
+from chord.hash import hash_value
+from chord.replication import Consistency, ANTI_ENTROPY_ROUNDS
+
+
+def owners(nodes, keys):
+    """ :return: dictionary of each key to the virtual node that owns its digest """
+    v_nodes = sorted((v_node for node in nodes for v_node in node.virtual_nodes.values()),
+                     key=lambda v_node: v_node.get_digest())
+    return {key: next((v_node for v_node in v_nodes if v_node.get_digest() >= hash_value(key)), v_nodes[0])
+            for key in keys}
+
+
+def test_get_put_delete():
+    asyncio.run(get_put_delete())
+
+
+async def get_put_delete():
+    names = ['node_0', 'node_1', 'node_2']
+    nodes = [AsyncChordNode(name, hash_value(name), 'tcp://127.0.0.1', virtual={f'{name}_v': hash_value(f'{name}_v')})
+             for name in names]
+
+    nodes[0].create()
+    runs = [asyncio.ensure_future(nodes[0].run(None, None))]
+    for node in nodes[1:]:
+        await node.join(nodes[0].digest_id, nodes[0].internal_endpoint)
+        runs.append(asyncio.ensure_future(node.run(None, None)))
+
+    for _ in range(5):
+        for node in nodes:
+            await node._stabilize()
+        await asyncio.sleep(.2)
+
+    # The client blocks, so it runs outside the event loop
+    loop = asyncio.get_running_loop()
+    client = Client(nodes[0].external_endpoint)
+    keys = [f'key_{i}' for i in range(20)]
+    for key in keys:
+        await loop.run_in_executor(None, client.put, key, f'value of {key}')
+
+    # Each key is stored once, on the virtual node that owns its digest
+    v_nodes = [v_node for node in nodes for v_node in node.virtual_nodes.values()]
+    for key, owner in owners(nodes, keys).items():
+        assert [v_node for v_node in v_nodes if key in v_node.store] == [owner]
+
+    # Any node answers for every key
+    other = Client(nodes[2].external_endpoint)
+    for key in keys:
+        assert await loop.run_in_executor(None, other.get, key) == f'value of {key}'.encode()
+
+    assert await loop.run_in_executor(None, client.delete, 'key_0')
+    assert not await loop.run_in_executor(None, client.delete, 'key_0')
+    assert await loop.run_in_executor(None, other.get, 'key_0') is None
+
+    client.close()
+    other.close()
+    for node in nodes:
+        node.stop()
+    await asyncio.gather(*runs)
+
+
+def test_join_and_leave():
+    asyncio.run(join_and_leave())
+
+
+async def join_and_leave():
+    first = AsyncChordNode('node_0', hash_value('node_0'), 'tcp://127.0.0.1', virtual={'node_0_v': hash_value('node_0_v')})
+    first.create()
+    runs = [asyncio.ensure_future(first.run(None, None))]
+
+    loop = asyncio.get_running_loop()
+    client = Client(first.external_endpoint)
+    keys = [f'key_{i}' for i in range(200)]
+    for key in keys:
+        await loop.run_in_executor(None, client.put, key, f'value of {key}')
+
+    second = AsyncChordNode('node_1', hash_value('node_1'), 'tcp://127.0.0.1',
+                            virtual={'node_1_v': hash_value('node_1_v')})
+    await second.join(first.digest_id, first.internal_endpoint)
+    runs.append(asyncio.ensure_future(second.run(None, None)))
+    nodes = [first, second]
+
+    # Stabilize notifies the owners of the new predecessors, which hand their keys over
+    key_owners = owners(nodes, keys)
+    for _ in range(20):
+        for node in nodes:
+            await node._stabilize()
+        await asyncio.sleep(.1)
+        if all(key in owner.store for key, owner in key_owners.items()):
+            break
+
+    v_nodes = [v_node for node in nodes for v_node in node.virtual_nodes.values()]
+    for key, owner in key_owners.items():
+        assert [v_node for v_node in v_nodes if key in v_node.store] == [owner]
+    assert second.transfer_stats.keys_received == sum(1 for owner in key_owners.values()
+                                                      if owner.get_parent() == second.digest_id)
+
+    other = Client(second.external_endpoint)
+    for key in keys[:20]:
+        assert await loop.run_in_executor(None, other.get, key) == f'value of {key}'.encode()
+    other.close()
+
+    # A node that leaves hands its keys to the nodes that remain
+    second.stop()
+    await runs.pop()
+    assert sum(len(v_node.store) for v_node in first.virtual_nodes.values()) == len(keys)
+    for key in keys:
+        assert await loop.run_in_executor(None, client.get, key) == f'value of {key}'.encode()
+
+    client.close()
+    first.stop()
+    await asyncio.gather(*runs)
+
+
+def test_replication():
+    asyncio.run(replication())
+
+
+async def replication():
+    names = ['node_0', 'node_1', 'node_2']
+    nodes = [AsyncChordNode(name, hash_value(name), 'tcp://127.0.0.1', consistency=Consistency(3, 2, 2))
+             for name in names]
+
+    nodes[0].create()
+    runs = [asyncio.ensure_future(nodes[0].run(None, None))]
+    for node in nodes[1:]:
+        await node.join(nodes[0].digest_id, nodes[0].internal_endpoint)
+        runs.append(asyncio.ensure_future(node.run(None, None)))
+
+    for _ in range(ANTI_ENTROPY_ROUNDS - 1):
+        for node in nodes:
+            await node._stabilize()
+        await asyncio.sleep(.2)
+
+    loop = asyncio.get_running_loop()
+    client = Client(nodes[0].external_endpoint)
+    keys = [f'key_{i}' for i in range(20)]
+    for key in keys:
+        await loop.run_in_executor(None, client.put, key, f'value of {key}')
+    await asyncio.sleep(.2)
+
+    def copies(key, owner):
+        return [node for node in nodes if owner.get_digest() in node.virtual_nodes or
+                key in node.virtual_nodes[node.digest_id].replicas.get(owner.get_digest(), ())]
+
+    # Every node keeps a copy of every key
+    key_owners = owners(nodes, keys)
+    for key, owner in key_owners.items():
+        assert key in owner.store
+        assert copies(key, owner) == nodes
+
+    # A node that lost its copies gets them back from the owners through anti-entropy
+    nodes[2].virtual_nodes[nodes[2].digest_id].replicas.clear()
+    for node in nodes:
+        await node._stabilize()
+    await asyncio.sleep(.2)
+    for key, owner in key_owners.items():
+        assert copies(key, owner) == nodes
+
+    other = Client(nodes[2].external_endpoint)
+    for key in keys:
+        assert await loop.run_in_executor(None, other.get, key) == f'value of {key}'.encode()
+    assert await loop.run_in_executor(None, other.delete, keys[0])
+    assert await loop.run_in_executor(None, client.get, keys[0]) is None
+
+    client.close()
+    other.close()
+    for node in nodes:
+        node.stop()
+    await asyncio.gather(*runs)
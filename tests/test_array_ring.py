@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from chord import array_ring, directchord
+from chord.directchord import DirectNode, DirectChordNode
+from chord.hash import hash_values
+from chord.util import generate_keys
+
+
+def test_node_digests():
+    for num_nodes, num_bits in [(10, 8), (200, 8), (1000, 32)]:
+        nodes = directchord.build_nodes(num_nodes, DirectChordNode, num_bits=num_bits)
+        ring = array_ring.build_ring(num_nodes, num_bits=num_bits)
+
+        assert ring.digests.tolist() == list(nodes.keys())
+        assert [ring.get_name(slot) for slot in range(len(ring))] == [node.get_name() for node in nodes.values()]
+
+
+def test_fingers():
+    nodes = directchord.build_nodes(500, DirectChordNode, num_bits=32)
+    ring = array_ring.ArrayRing.from_nodes(nodes, 32)
+
+    for slot, node in enumerate(nodes.values()):
+        assert [ring.get_id(finger) for finger in ring.fingers[slot]] == [finger.get_id() for finger in node.fingers]
+        assert ring.get_id(ring.successor[slot]) == node.successor.get_id()
+        assert ring.get_id(ring.predecessor[slot]) == node.predecessor.get_id()
+
+
+def test_find_successor():
+    for node_type, num_nodes, num_bits in [(DirectNode, 50, 8), (DirectChordNode, 20, 8), (DirectChordNode, 300, 32)]:
+        nodes = directchord.build_nodes(num_nodes, node_type, num_bits=num_bits)
+        ring = array_ring.ArrayRing.from_nodes(nodes, num_bits, naive=node_type == DirectNode)
+
+        for start in [0, num_nodes // 2]:
+            for digest in hash_values(generate_keys(200), num_bits) + list(nodes.keys())[:5]:
+                node, hops = nodes.values()[start].find_successor(digest, 0)
+                slot, array_hops = ring.find_successor(start, digest, 0)
+                assert (ring.get_id(slot), array_hops) == (node.get_id(), hops)
+
+
+def test_hop_histogram():
+    nodes = directchord.build_nodes(100, DirectChordNode, num_bits=32)
+    ring = array_ring.build_ring(100, num_bits=32)
+    digests = array_ring.ring_assignment.hash_keys(500, 'data', 32)
+
+    assert array_ring.hop_histogram(ring, digests) == directchord.hop_histogram(nodes.values(), digests.tolist())
+
+
+def test_wide_rings():
+    with pytest.raises(ValueError):
+        array_ring.build_ring(10, num_bits=128)
+
+    ring = array_ring.build_ring(1000, num_bits=64)
+    digests = hash_values(generate_keys(100), 64)
+    nodes = directchord.build_nodes(1000, DirectChordNode, num_bits=64)
+    for digest in digests:
+        assert ring.get_id(ring.find_successor(0, digest, 0)[0]) == nodes.values()[0].find_successor(digest, 0)[0].get_id()
+
+
+def test_batch_find_successor(monkeypatch):
+    # Route in several chunks
+    monkeypatch.setattr(array_ring.ring_assignment, 'CHUNK_SIZE', 64)
+
+    for naive, num_nodes, num_bits in [(True, 50, 8), (False, 20, 8), (False, 300, 32), (False, 1000, 64)]:
+        ring = array_ring.build_ring(num_nodes, num_bits=num_bits, naive=naive)
+        digests = np.concatenate([array_ring.ring_assignment.hash_keys(300, 'data', num_bits), ring.digests[:5]])
+        starts = np.random.default_rng(1).integers(len(ring), size=len(digests))
+        original_starts = starts.copy()
+
+        owners, hops = array_ring.batch_find_successor(ring, digests, starts)
+        expected = [ring.find_successor(start, digest, 0) for start, digest in zip(starts.tolist(), digests.tolist())]
+
+        assert list(zip(owners.tolist(), hops.tolist())) == expected
+        assert (starts == original_starts).all()
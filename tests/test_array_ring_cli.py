@@ -0,0 +1,26 @@
+import io
+
+from chord import array_ring
+
+
+def test_100_naive_hops():
+    cmd = ["100", "100", '--naive']
+
+    expected = "Average hops with 100 nodes is 47.43\n" \
+               "Ring arrays use 0.0 MiB"
+    actual = io.StringIO()
+
+    array_ring.main(actual, cmd)
+    assert actual.getvalue().strip() == expected
+
+
+def test_100_chord_hop_statistics():
+    cmd = ["100", "100", '--hop-statistics']
+
+    expected = "Average hops with 100 nodes is 4.12\n" \
+               "Hops with 100 nodes: mean 4.12, p50 4, p95 6, p99 6, max 7\n" \
+               "Ring arrays use 0.0 MiB"
+    actual = io.StringIO()
+
+    array_ring.main(actual, cmd)
+    assert actual.getvalue().strip() == expected
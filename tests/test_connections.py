@@ -0,0 +1,82 @@
+import socket
+import time
+
+import zmq
+
+from chord.connections import ConnectionManager
+
+
+def test_queue_until_connected():
+    context = zmq.Context()
+    router = context.socket(zmq.ROUTER)
+    router.setsockopt(zmq.LINGER, 0)
+    connections = ConnectionManager(router)
+
+    # Nothing is listening yet, so messages are queued in order
+    address = f'tcp://127.0.0.1:{free_port()}'
+    assert not connections.send(address, [b'163', b'first'])
+    assert not connections.send(address, [b'163', b'second'])
+    assert len(connections.queued[address]) == 2
+
+    dealer = context.socket(zmq.DEALER)
+    dealer.setsockopt(zmq.LINGER, 0)
+    dealer.setsockopt(zmq.IDENTITY, b'163')
+    dealer.setsockopt(zmq.RCVTIMEO, 5000)
+    dealer.bind(address)
+    assert connections.wait(5000)
+    assert not connections.queued
+
+    assert dealer.recv_multipart() == [b'first']
+    assert dealer.recv_multipart() == [b'second']
+
+    # Once connected, messages are sent right away
+    assert connections.send(address, [b'163', b'third'])
+    assert dealer.recv_multipart() == [b'third']
+
+    connections.close()
+    router.close()
+    dealer.close()
+    context.term()
+
+
+def test_queue_limit():
+    context = zmq.Context()
+    router = context.socket(zmq.ROUTER)
+    router.setsockopt(zmq.LINGER, 0)
+    connections = ConnectionManager(router, queue_limit=2)
+
+    address = 'tcp://127.0.0.1:1'
+    for i in range(3):
+        connections.send(address, [b'163', b'%d' % i])
+
+    assert list(connections.queued[address]) == [[b'163', b'1'], [b'163', b'2']]
+    assert not connections.wait(100)
+
+    connections.close()
+    router.close()
+    context.term()
+
+
+def test_expire():
+    context = zmq.Context()
+    router = context.socket(zmq.ROUTER)
+    router.setsockopt(zmq.LINGER, 0)
+    connections = ConnectionManager(router)
+
+    address = f'tcp://127.0.0.1:{free_port()}'
+    connections.send(address, [b'163', b'first'])
+    assert connections.expire(1000) == []
+
+    time.sleep(.1)
+    assert connections.expire(50) == [(address, [[b'163', b'first']])]
+    assert not connections.queued
+
+    connections.close()
+    router.close()
+    context.term()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
@@ -1,22 +1,21 @@
-import pytest
-import sortedcontainers
-from sortedcontainers import SortedDict
+import math
 
-from chord import consistent_load_balancer
+from chord import consistent_load_balancer, util
 
 
-@pytest.fixture(autouse=True)
-def clear_server_list():
-    consistent_load_balancer.servers = SortedDict()
+def moved_keys(ranges, key_digests):
+    return {digest for digest in key_digests
+            if any(start == end or util.open_closed(start, end, digest) for start, end, _, _ in ranges)}
 
 
 def test_adding_server():
     keys = consistent_load_balancer.generate_keys(10)
+    balancer = consistent_load_balancer.ConsistentBalancer()
 
-    consistent_load_balancer.build_server_list(50)
-    assert len(consistent_load_balancer.servers) == 50
+    balancer.build_server_list(50)
+    assert len(balancer.servers) == 50
 
-    keys_to_servers1 = consistent_load_balancer.get_servers(keys)
+    keys_to_servers1 = balancer.get_servers(keys)
     assert len(keys_to_servers1) == 10
 
     assert keys_to_servers1['cached_data_0'].name == 'server_51'
@@ -30,10 +29,10 @@ def test_adding_server():
     assert keys_to_servers1['cached_data_8'].name == 'server_24'
     assert keys_to_servers1['cached_data_9'].name == 'server_45'
 
-    consistent_load_balancer.build_server_list(1)
-    assert len(consistent_load_balancer.servers) == 51
+    balancer.build_server_list(1)
+    assert len(balancer.servers) == 51
 
-    keys_to_servers2 = consistent_load_balancer.get_servers(keys)
+    keys_to_servers2 = balancer.get_servers(keys)
     assert len(keys_to_servers2) == 10
 
     assert keys_to_servers2['cached_data_0'].name == 'server_51'
@@ -50,3 +49,144 @@ def test_adding_server():
     changes = consistent_load_balancer.calculate_change(keys_to_servers1, keys_to_servers2)
     assert len(changes) == 1
     assert changes[0] == 'cached_data_3'
+
+
+def test_find_server():
+    balancer = consistent_load_balancer.ConsistentBalancer()
+    balancer.servers[10] = 'server_a'
+    balancer.servers[20] = 'server_b'
+    balancer.servers[30] = 'server_c'
+
+    assert balancer.find_server(5) == 'server_a'
+    assert balancer.find_server(10) == 'server_b'
+    assert balancer.find_server(25) == 'server_c'
+    assert balancer.find_server(30) == 'server_a'
+    assert balancer.find_server(255) == 'server_a'
+
+    assert balancer.digest_responsible_server(10) == 'server_a'
+    assert balancer.digest_responsible_server(30) == 'server_c'
+
+
+def test_sweep_servers():
+    balancer = consistent_load_balancer.ConsistentBalancer(num_bits=32)
+    balancer.build_server_list(100)
+    key_digests = consistent_load_balancer.hash_values(consistent_load_balancer.generate_keys(1000), 32)
+
+    expected = [balancer.digest_responsible_server(digest) for digest in key_digests]
+    assert balancer.sweep_servers(key_digests) == expected
+
+
+def test_virtual_nodes():
+    balancer = consistent_load_balancer.ConsistentBalancer(num_bits=32, vnodes_per_server=20)
+    balancer.build_server_list(10)
+    assert balancer.count_servers() == 10
+    assert len(balancer.servers) == 200
+
+    keys = consistent_load_balancer.generate_keys(1000)
+    keys_to_servers = balancer.get_servers(keys)
+    assert set(keys_to_servers.values()) <= set(balancer.servers.values())
+
+    counts = balancer.key_counts(keys_to_servers.values())
+    assert len(counts) == 10
+    assert sum(counts.values()) == 1000
+
+    balancer.build_server_list(1)
+    assert balancer.count_servers() == 11
+    assert len(balancer.servers) == 220
+
+
+def test_load_statistics():
+    mean, stddev, max_over_mean = consistent_load_balancer.load_statistics([2, 4, 6, 8])
+    assert mean == 5
+    assert math.isclose(stddev, math.sqrt(5))
+    assert max_over_mean == 1.6
+
+
+def test_removing_server():
+    balancer = consistent_load_balancer.ConsistentBalancer(num_bits=32, vnodes_per_server=5)
+    balancer.build_server_list(10)
+    balancer.remove_server_list(2)
+
+    names = {server.name for server in balancer.servers.values()}
+    assert balancer.count_servers() == 8
+    assert 'server_8' not in names and 'server_9' not in names
+
+
+def test_independent_rings():
+    balancer1 = consistent_load_balancer.ConsistentBalancer()
+    balancer2 = consistent_load_balancer.ConsistentBalancer(num_bits=32, vnodes_per_server=3)
+
+    balancer1.build_server_list(50)
+    balancer2.build_server_list(10)
+
+    assert balancer1.count_servers() == 50
+    assert balancer2.count_servers() == 10
+    assert len(balancer2.servers) == 30
+    assert balancer1.responsible_server('cached_data_0').name == 'server_51'
+
+
+def test_adding_server_ranges():
+    balancer = consistent_load_balancer.ConsistentBalancer(num_bits=32, vnodes_per_server=5)
+    balancer.build_server_list(20)
+
+    key_digests = consistent_load_balancer.hash_values(consistent_load_balancer.generate_keys(2000), 32)
+    hosts1 = balancer.sweep_servers(key_digests)
+
+    ranges = balancer.build_server_list(1)
+    hosts2 = balancer.sweep_servers(key_digests)
+
+    assert len(ranges) == 5
+    for start, end, old_owner, new_owner in ranges:
+        assert new_owner.name == 'server_20'
+        assert old_owner.name != 'server_20'
+        assert balancer.servers[end] == new_owner
+
+    changed = {digest for digest, host1, host2 in zip(key_digests, hosts1, hosts2) if host1 != host2}
+    assert changed == moved_keys(ranges, key_digests)
+
+
+def test_adding_several_servers_ranges():
+    balancer = consistent_load_balancer.ConsistentBalancer()
+    balancer.build_server_list(3)
+
+    digests = list(range(pow(2, 8)))
+    hosts1 = [balancer.digest_responsible_server(digest) for digest in digests]
+
+    ranges = balancer.build_server_list(3)
+    hosts2 = [balancer.digest_responsible_server(digest) for digest in digests]
+
+    # Every digest that moved is in exactly one range, with the owners before and after all additions
+    for digest, host1, host2 in zip(digests, hosts1, hosts2):
+        containing = [(old_owner, new_owner) for start, end, old_owner, new_owner in ranges
+                      if start == end or util.open_closed(start, end, digest)]
+        if host1 == host2:
+            assert containing == []
+        else:
+            assert containing == [(host1, host2)]
+
+
+def test_removing_server_ranges():
+    balancer = consistent_load_balancer.ConsistentBalancer(num_bits=32, vnodes_per_server=5)
+    balancer.build_server_list(20)
+
+    key_digests = consistent_load_balancer.hash_values(consistent_load_balancer.generate_keys(2000), 32)
+    hosts1 = balancer.sweep_servers(key_digests)
+
+    ranges = balancer.remove_server('server_3')
+    hosts2 = balancer.sweep_servers(key_digests)
+
+    assert len(ranges) == 5
+    assert all(old_owner.name == 'server_3' for _, _, old_owner, _ in ranges)
+    assert balancer.count_servers() == 19
+
+    changed = {digest for digest, host1, host2 in zip(key_digests, hosts1, hosts2) if host1 != host2}
+    assert changed == moved_keys(ranges, key_digests)
+
+
+def test_first_server_range():
+    balancer = consistent_load_balancer.ConsistentBalancer()
+
+    (start, end, old_owner, new_owner), = balancer.build_server_list(1)
+    assert start == end
+    assert old_owner is None
+    assert new_owner.name == 'server_0'
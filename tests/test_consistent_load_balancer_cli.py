@@ -1,16 +1,8 @@
 import io
-import pytest
 
-from sortedcontainers import SortedDict
 from chord import consistent_load_balancer
 
 
-@pytest.fixture(autouse=True)
-def clear_server_list():
-    consistent_load_balancer.servers = SortedDict()
-    consistent_load_balancer.max_server_id = 0
-
-
 def test_50_orig_1_addtl():
     cmd = ['50', '10', '--additional', '1', '--no-formatting']
     expected = 'Mapping of keys to server hosting key with 50 servers:\n{"cached_data_0": {"name": "server_51"}, ' \
@@ -28,3 +20,56 @@ def test_50_orig_1_addtl():
 
     consistent_load_balancer.main(actual, cmd)
     assert actual.getvalue().strip() == expected
+
+
+def test_50_orig_1_addtl_summary():
+    cmd = ['50', '10', '--additional', '1', '--summary']
+    expected = 'A total of 1 out of 10 keys have changed hosts going from 50 to 51 servers'
+    actual = io.StringIO()
+
+    consistent_load_balancer.main(actual, cmd)
+    assert actual.getvalue().strip() == expected
+
+
+def test_vnodes_load_statistics():
+    cmd = ['50', '10000', '--num-bits', '32', '--vnodes-per-server', '10', '--load-statistics', '--summary']
+    expected = 'A total of 201 out of 10000 keys have changed hosts going from 50 to 51 servers\n' \
+               'Load with 50 servers: mean 200.00 keys, stddev 65.50, max/mean 2.05\n' \
+               'Load with 51 servers: mean 196.08 keys, stddev 64.98, max/mean 2.09'
+    actual = io.StringIO()
+
+    consistent_load_balancer.main(actual, cmd)
+    assert actual.getvalue().strip() == expected
+
+
+def test_changed_ranges():
+    cmd = ['50', '10', '--additional', '1', '--no-formatting', '--ranges']
+    expected = 'Ranges of digests that changed hosts:\n' \
+               '[{"start": 140, "end": 149, "from": {"name": "server_19"}, "to": {"name": "server_58"}}]'
+    actual = io.StringIO()
+
+    consistent_load_balancer.main(actual, cmd)
+    assert actual.getvalue().strip().endswith(expected)
+
+
+def test_added_server_takes_point():
+    # server_96 is added at the point of a server on the first ring
+    cmd = ['100', '1000', '--additional', '50', '--summary', '--load-statistics']
+    expected = 'A total of 631 out of 1000 keys have changed hosts going from 100 to 150 servers\n' \
+               'Load with 100 servers: mean 10.00 keys, stddev 9.61, max/mean 4.60\n' \
+               'Load with 150 servers: mean 6.67 keys, stddev 5.39, max/mean 4.95'
+    actual = io.StringIO()
+
+    consistent_load_balancer.main(actual, cmd)
+    assert actual.getvalue().strip() == expected
+
+
+def test_load_statistics_without_keys():
+    cmd = ['5', '0', '--load-statistics', '--summary']
+    expected = 'A total of 0 out of 0 keys have changed hosts going from 5 to 6 servers\n' \
+               'Load with 5 servers: mean 0.00 keys, stddev 0.00, max/mean 0.00\n' \
+               'Load with 6 servers: mean 0.00 keys, stddev 0.00, max/mean 0.00'
+    actual = io.StringIO()
+
+    consistent_load_balancer.main(actual, cmd)
+    assert actual.getvalue().strip() == expected
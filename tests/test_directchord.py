@@ -2,7 +2,7 @@ import math
 
 from chord import directchord
 from chord.directchord import run_experiment, DirectNode, DirectChordNode
-from chord.hash import hash_value
+from chord.hash import hash_value, ring_size
 from chord.util import generate_keys
 
 
@@ -160,6 +160,120 @@ def test_add_node():
     verify_fingers(nodes.values())
 
 
+def test_add_several_nodes():
+    nodes = directchord.build_nodes(100, DirectChordNode, num_bits=32)
+
+    new_nodes, _ = directchord.add_nodes(nodes, 10, DirectChordNode, num_bits=32)
+    assert len({node.get_name() for node in new_nodes}) == 10
+    assert len(nodes) == 110
+
+    ring = nodes.values()
+    for node, successor in zip(ring, ring[1:] + ring[:1]):
+        assert node.successor == successor
+
+    fixed = [list(node.fingers) for node in ring]
+    directchord.bulk_init_fingers(nodes)
+    assert [node.fingers for node in ring] == fixed
+
+
+def test_add_node_sorting_first():
+    nodes = directchord.build_nodes(2, DirectChordNode, num_bits=8)
+
+    # node_added_1 hashes below every node of the ring
+    new_nodes, _ = directchord.add_nodes(nodes, 2, DirectChordNode, num_bits=8)
+    assert nodes.keys()[0] == new_nodes[1].get_id()
+
+    ring = nodes.values()
+    for node, successor in zip(ring, ring[1:] + ring[:1]):
+        assert node.successor == successor
+        assert node.successor != node
+
+    node_ids = list(nodes.keys())
+    for node in ring:
+        for digest in range(2 ** 8):
+            owner = next((node_id for node_id in node_ids if node_id >= digest), node_ids[0])
+            assert node.find_successor(digest, 0)[0].get_id() == owner
+
+
+def test_add_node_with_taken_digest():
+    nodes = directchord.build_nodes(5, DirectChordNode, num_bits=8)
+    first, _ = directchord.add_nodes(nodes, 1, DirectChordNode, num_bits=8)
+
+    # The name added first hashes to the node it added before, so the next name is used
+    new_nodes, _ = directchord.add_nodes(nodes, 1, DirectChordNode, num_bits=8)
+    assert new_nodes[0].get_name() == 'node_added_1'
+    assert nodes[first[0].get_id()] is first[0]
+    assert len(nodes) == 7
+
+
+def test_wide_identifier_space():
+    nodes = directchord.build_nodes(300, DirectChordNode, num_bits=32).values()
+    node_ids = [node.get_id() for node in nodes]
+
+    assert len(nodes) == 300
+    for node in nodes:
+        assert len(node.fingers) == 32
+        for i, finger in enumerate(node.fingers):
+            assert finger.get_id() == get_id(i, node.get_id(), node_ids, 32)
+
+
+def test_bulk_fingers_match_routed():
+    for num_nodes, node_type, num_bits in [(20, DirectChordNode, 8), (100, DirectNode, 8),
+                                           (500, DirectChordNode, 32), (1, DirectChordNode, 32)]:
+        nodes = directchord.build_nodes(num_nodes, node_type, num_bits=num_bits).values()
+        bulk = [list(node.fingers) for node in nodes]
+
+        for node in nodes:
+            node.init_fingers()
+        assert [node.fingers for node in nodes] == bulk
+
+
+def test_hop_histogram():
+    nodes = directchord.build_nodes(100, DirectChordNode, num_bits=32).values()
+    keys = generate_keys(500)
+    digests = directchord.hash_values(keys, 32)
+
+    histogram = directchord.hop_histogram(nodes, digests)
+    assert sum(histogram.values()) == 500
+    assert directchord.hop_statistics(histogram)['mean'] == run_experiment(nodes, keys, 32)
+
+    assert directchord.run_parallel_experiment(100, keys, DirectChordNode, 2, num_bits=32) == histogram
+
+    random_starts = directchord.hop_histogram(nodes, digests, 'random', seed=1)
+    assert random_starts == directchord.hop_histogram(nodes, digests, 'random', seed=1)
+    assert random_starts != histogram
+
+
+def test_hop_statistics():
+    stats = directchord.hop_statistics(directchord.Counter({1: 50, 2: 45, 3: 4, 7: 1}))
+    assert math.isclose(stats['mean'], 1.59)
+    assert stats['p50'] == 1
+    assert stats['p95'] == 2
+    assert stats['p99'] == 3
+    assert stats['max'] == 7
+
+
+def test_no_lookups():
+    assert directchord.run_parallel_experiment(10, [], DirectChordNode, 2, num_bits=32) == directchord.Counter()
+
+    stats = directchord.hop_statistics(directchord.Counter())
+    assert stats == {'mean': None, 'p50': None, 'p95': None, 'p99': None, 'max': None}
+    assert directchord.format_hop_statistics(10, stats) == 'Hops with 10 nodes: no lookups'
+
+
+def test_long_route():
+    # A naive ring routes through every node, far past the recursion limit
+    nodes = [DirectNode(f'node_{i}', i, 32) for i in range(5000)]
+    for node, successor in zip(nodes, nodes[1:] + nodes[:1]):
+        node.set_successor(successor)
+
+    node, hops = nodes[0].find_successor(4999, 0)
+    assert node == nodes[4999]
+    assert hops == 4999
+
+    assert nodes[0].find_successor(0, 3) == (nodes[0], 3)
+
+
 def verify_successors(nodes):
     assert nodes[0].successor == nodes[1]
     assert nodes[1].successor == nodes[2]
@@ -192,8 +306,8 @@ def verify_fingers(nodes):
         assert fingers[7].get_id() == get_id(7, node.get_id(), node_ids)
 
 
-def get_id(idx, node_id, ids):
-    search_id = (node_id + pow(2, idx)) % 255
+def get_id(idx, node_id, ids, num_bits=8):
+    search_id = (node_id + pow(2, idx)) % ring_size(num_bits)
 
     for curr_id in ids:
         if curr_id >= search_id:
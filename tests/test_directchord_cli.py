@@ -119,3 +119,14 @@ def test_node_joining():
 
     directchord.main(actual, cmd)
     assert actual.getvalue().strip() == expected
+
+
+def test_100_chord_hop_statistics():
+    cmd = ["100", "100", '--chord', '--action', 'hops', '--hop-statistics', '--workers', '2']
+
+    expected = "Average hops with 100 nodes is 4.12\n" \
+               "Hops with 100 nodes: mean 4.12, p50 4, p95 6, p99 6, max 7"
+    actual = io.StringIO()
+
+    directchord.main(actual, cmd)
+    assert actual.getvalue().strip() == expected
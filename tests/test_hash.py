@@ -1,6 +1,8 @@
 import io
 
-from chord.hash import hash_value, main
+import pytest
+
+from chord.hash import hash_value, hash_values, main, fnv1a, siphash, xxhash, HASH_FUNCTIONS
 
 
 def test_hash():
@@ -17,3 +19,53 @@ def test_hash_cli():
 
     main(actual, cmd)
     assert actual.getvalue().strip() == expected
+
+
+def test_hash_wide():
+    assert hash_value("Hello, world!", 32) == 1834341228
+    assert hash_value("Hello, world!", 32) % 256 == hash_value("Hello, world!")
+    assert hash_value("Hello, world!", 160) < pow(2, 160)
+
+    with pytest.raises(ValueError):
+        hash_value("Hello, world!", 161)
+
+
+def test_hash_wide_cli():
+    cmd = ["Hello, world!", "--num-bits", "32"]
+    expected = "Value \"Hello, world!\" has digest \"1834341228\""
+    actual = io.StringIO()
+
+    main(actual, cmd)
+    assert actual.getvalue().strip() == expected
+
+
+def test_hash_functions():
+    # Published test vectors
+    assert fnv1a(b"a") == 0xaf63dc4c8601ec8c
+    assert siphash(b"") == 0x726fdb47dd0e0e31
+    assert siphash(bytes(range(15))) == 0xa129ca6149be45e5
+    assert xxhash(b"") == 0xef46db3751d8e999
+    assert xxhash(b"a") == 0xd24ec4f1a98c6e5b
+
+
+def test_hash_values():
+    values = ["Hello, world!", "FOO BAR 1234566789", "Portland, OR", "555-123-4567"]
+    assert hash_values(values) == [108, 129, 175, 202]
+
+    for hash_name in HASH_FUNCTIONS:
+        assert hash_values(values, 32, hash_name) == [hash_value(value, 32, hash_name) for value in values]
+
+    with pytest.raises(ValueError):
+        hash_values(values, 128, "xxhash")
+
+    with pytest.raises(ValueError):
+        hash_values(values, 32, "crc32")
+
+
+def test_hash_name_cli():
+    cmd = ["Hello, world!", "--hash", "xxhash"]
+    expected = f"Value \"Hello, world!\" has digest \"{xxhash(b'Hello, world!') % 256}\""
+    actual = io.StringIO()
+
+    main(actual, cmd)
+    assert actual.getvalue().strip() == expected
@@ -0,0 +1,49 @@
+from chord import jump_load_balancer
+
+
+def test_jump_hash():
+    # Reference values from the implementation in the paper
+    assert jump_load_balancer.jump_hash(1, 1) == 0
+    assert jump_load_balancer.jump_hash(42, 57) == 43
+    assert jump_load_balancer.jump_hash(0xDEAD10CC, 1) == 0
+    assert jump_load_balancer.jump_hash(0xDEAD10CC, 666) == 361
+    assert jump_load_balancer.jump_hash(256, 1024) == 520
+
+
+def test_adding_server():
+    keys = jump_load_balancer.generate_keys(10)
+    balancer = jump_load_balancer.JumpBalancer()
+
+    balancer.build_server_list(10)
+    assert len(balancer.server_list) == 10
+
+    keys_to_servers1 = balancer.get_servers(keys)
+    assert keys_to_servers1['cached_data_2'].name == 'server_7'
+
+    balancer.build_server_list(2)
+    assert len(balancer.server_list) == 12
+
+    keys_to_servers2 = balancer.get_servers(keys)
+    assert keys_to_servers2['cached_data_2'].name == 'server_11'
+
+    changes = jump_load_balancer.calculate_change(keys_to_servers1, keys_to_servers2)
+    assert changes == ['cached_data_2']
+
+    # Keys only ever move to the new servers
+    for key in changes:
+        assert keys_to_servers2[key] in balancer.server_list[10:]
+
+
+def test_removing_server():
+    keys = jump_load_balancer.generate_keys(100)
+    balancer = jump_load_balancer.JumpBalancer()
+
+    balancer.build_server_list(12)
+    keys_to_servers1 = balancer.get_servers(keys)
+
+    balancer.remove_server_list(2)
+    assert len(balancer.server_list) == 10
+
+    keys_to_servers2 = balancer.get_servers(keys)
+    for key in jump_load_balancer.calculate_change(keys_to_servers1, keys_to_servers2):
+        assert keys_to_servers1[key].name in ('server_10', 'server_11')
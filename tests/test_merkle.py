@@ -0,0 +1,83 @@
+from unittest import mock
+
+from chord import merkle
+from chord.merkle import MerkleTree
+from chord.store import Store
+
+
+@mock.patch.object(merkle, 'TREE_DEPTH', 4)
+def test_arc():
+    tree = MerkleTree(200, 40, 8)
+    assert tree.length == 96
+    assert tree.covers(201) and tree.covers(0) and tree.covers(40)
+    assert not tree.covers(200) and not tree.covers(41)
+
+    # Buckets split the arc evenly, starting after its start
+    assert tree.leaf(201) == tree.leaves
+    assert tree.leaf(40) == 2 * tree.leaves - 1
+
+    # An arc that starts where it ends is the whole ring
+    whole = MerkleTree(100, 100, 8)
+    assert whole.length == 256
+    assert all(whole.covers(digest) for digest in range(256))
+
+
+def test_incremental():
+    store = Store()
+    tree = store.track(0, 0, 8)
+    for i in range(50):
+        store.put(f'key_{i}', i * 5, b'value', 1)
+    store.put('key_3', 15, b'newer', 2)
+    store.delete('key_4')
+    store.remove('key_5')
+
+    # Writes keep the tree the same as one built from the keys
+    rebuilt = Store()
+    rebuilt.entries = dict(store.entries)
+    assert rebuilt.track(0, 0, 8).hash(1) == tree.hash(1) != 0
+    assert rebuilt.tree.hashes == tree.hashes
+    assert sorted(tree.keys(tree.buckets)) == sorted(store.entries)
+
+    # Removing every key empties the tree
+    for key in list(store.entries):
+        store.remove(key)
+    assert tree.hash(1) == 0 and not tree.buckets
+
+
+def test_track():
+    store = Store()
+    store.put('key_1', 10, b'value', 1)
+    store.put('key_2', 100, b'value', 1)
+    tree = store.track(50, 150, 8)
+    assert store.track(50, 150, 8) is tree
+    assert tree.keys(range(tree.leaves, 2 * tree.leaves)) == ['key_2']
+
+    # The tree is built again for another arc
+    assert sorted(store.track(0, 150, 8).keys(range(tree.leaves, 2 * tree.leaves))) == ['key_1', 'key_2']
+
+
+@mock.patch.object(merkle, 'TREE_DEPTH', 4)
+@mock.patch.object(merkle, 'TREE_STEP', 2)
+def test_compare():
+    ours, theirs = MerkleTree(0, 0, 8), MerkleTree(0, 0, 8)
+    for tree in ours, theirs:
+        for i in range(100):
+            tree.update(f'key_{i}', i * 2, 0, 1)
+    assert not ours.differing(theirs.root())
+    theirs.update('key_70', 140, 1, 2)
+
+    # Indices outside the tree are skipped, and each step goes TREE_STEP levels further down
+    assert ours.differing([(1, 0), (99, 0)]) == [1]
+    assert theirs.differing(ours.root()) == [1]
+    nodes = ours.expand([1])
+    assert [index for index, _ in nodes] == [4, 5, 6, 7]
+
+    differing = theirs.differing(nodes)
+    assert differing == [6]
+    nodes = ours.expand(differing)
+    assert [index for index, _ in nodes] == [24, 25, 26, 27]
+
+    # Leaves are not expanded further, and their keys are compared instead
+    [leaf] = theirs.differing(nodes)
+    assert ours.is_leaf(leaf) and not ours.expand([leaf])
+    assert 'key_70' in theirs.keys([leaf])
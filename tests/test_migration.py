@@ -0,0 +1,83 @@
+from sortedcontainers import SortedDict
+
+from chord import migration
+from chord.consistent_load_balancer import ConsistentBalancer
+from chord.hash import hash_values
+
+
+def brute_force_moves(before, after, num_bits):
+    return {digest: (migration.owner(before, digest), migration.owner(after, digest))
+            for digest in range(pow(2, num_bits))
+            if migration.owner(before, digest) != migration.owner(after, digest)}
+
+
+def planned_moves(arcs, num_bits):
+    moves = {}
+    for digest in range(pow(2, num_bits)):
+        arc = migration.find_arc(arcs, [end for _, end, _, _ in arcs], digest)
+        if arc is not None:
+            moves[digest] = (arc[2], arc[3])
+    return moves
+
+
+def test_adding_and_removing_servers():
+    balancer = ConsistentBalancer(num_bits=10, vnodes_per_server=4)
+    balancer.build_server_list(20)
+    before = balancer.servers.copy()
+    before_points = {name: list(points) for name, points in balancer.points.items()}
+
+    balancer.remove_server_list(3)
+    balancer.build_server_list(5)
+    arcs = migration.plan_migration(before, balancer.servers, migration.server_points(before_points, balancer.points))
+
+    assert arcs == migration.plan_migration(before, balancer.servers)
+    assert planned_moves(arcs, 10) == brute_force_moves(before, balancer.servers, 10)
+
+    ends = [end for _, end, _, _ in arcs]
+    assert ends == sorted(ends)
+
+
+def test_wrapping_arc():
+    before = SortedDict({10: 'a', 100: 'b', 200: 'c'})
+    after = SortedDict({10: 'a', 100: 'b', 200: 'c', 5: 'd', 250: 'd'})
+
+    arcs = migration.plan_migration(before, after)
+    assert arcs == [(200, 5, 'a', 'd')]
+    assert migration.ring_fraction(arcs) == 61 / 256
+    assert planned_moves(arcs, 8) == brute_force_moves(before, after, 8)
+
+
+def test_empty_rings():
+    after = SortedDict({10: 'a', 100: 'b'})
+
+    arcs = migration.plan_migration(SortedDict(), after)
+    assert arcs == [(100, 10, None, 'a'), (10, 100, None, 'b')]
+    assert migration.ring_fraction(arcs) == 1
+
+    assert migration.plan_migration(after, SortedDict()) == [(100, 10, 'a', None), (10, 100, 'b', None)]
+    assert migration.plan_migration(SortedDict({10: 'a'}), SortedDict({10: 'b'})) == [(10, 10, 'a', 'b')]
+
+
+def test_no_change():
+    balancer = ConsistentBalancer(num_bits=32)
+    balancer.build_server_list(10)
+    before = balancer.servers.copy()
+
+    balancer.build_server_list(1)
+    balancer.remove_server_list(1)
+
+    assert migration.plan_migration(before, balancer.servers) == []
+
+
+def test_affected_keys():
+    balancer = ConsistentBalancer(num_bits=32, vnodes_per_server=5)
+    balancer.build_server_list(30)
+    keys = migration.generate_keys(2000)
+    hosts1 = balancer.sweep_servers(hash_values(keys, 32))
+    before = balancer.servers.copy()
+
+    arcs = balancer.build_server_list(2)
+    hosts2 = balancer.sweep_servers(hash_values(keys, 32))
+
+    expected = [(key, host1, host2) for key, host1, host2 in zip(keys, hosts1, hosts2) if host1 != host2]
+    assert list(migration.affected_keys(arcs, iter(keys), 32)) == expected
@@ -0,0 +1,14 @@
+import io
+
+from chord import migration
+
+
+def test_50_orig_1_addtl():
+    cmd = ['50', '10', '--additional', '1', '--no-formatting']
+    expected = 'Arcs that change hosts going from 50 to 51 servers:\n' \
+               '[{"start": 140, "end": 149, "from": {"name": "server_19"}, "to": {"name": "server_58"}}]\n\n' \
+               '1 arcs cover 0.0352 of the ring. 1 out of 10 keys have to move'
+    actual = io.StringIO()
+
+    migration.main(actual, cmd)
+    assert actual.getvalue().strip() == expected
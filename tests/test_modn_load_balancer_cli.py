@@ -1,15 +1,8 @@
 import io
 
-import pytest
-
 from chord import modn_load_balancer
 
 
-@pytest.fixture(autouse=True)
-def clear_server_list():
-    modn_load_balancer.server_list = []
-
-
 def test_50_orig_1_addtl():
     cmd = ['50', '10', '--additional', '1', '--no-formatting']
     expected = 'Mapping of keys to server hosting key with 50 servers:\n{"cached_data_0": {"name": "server_36"}, ' \
@@ -28,3 +21,12 @@ def test_50_orig_1_addtl():
 
     modn_load_balancer.main(actual, cmd)
     assert actual.getvalue().strip() == expected
+
+
+def test_50_orig_1_addtl_summary():
+    cmd = ['50', '10', '--additional', '1', '--summary']
+    expected = 'A total of 9 out of 10 keys have changed hosts going from 50 to 51 servers'
+    actual = io.StringIO()
+
+    modn_load_balancer.main(actual, cmd)
+    assert actual.getvalue().strip() == expected
@@ -1,10 +1,12 @@
 import pytest
 
 from unittest import mock
-from unittest.mock import Mock, patch
 
-from chord.hash import NUM_BITS
-from chord.node import Node, ChordNode, RoutingInfo, VirtualNode
+from chord.node import Node, ChordNode, RoutingInfo, VirtualNode, ChordVirtualNode, PredecessorCommand, \
+    FindSuccessorCommand, StoreCommand, NotifyCommand, MAX_MISSED_REPLIES, decode_command
+from chord import wire
+from chord.replication import Consistency, WRITE, TREE
+from chord.store import GET, PUT, DELETE, OK, NOT_FOUND, UNAVAILABLE, INVALID
 
 
 @mock.patch('chord.node.zmq')
@@ -18,18 +20,6 @@ def test_init(mock_zmq):
     node.receiver.bind_to_random_port.assert_called_with('tcp://127.0.0.1')
 
 
-@mock.patch('chord.node.zmq')
-def test_init_fingers(mock_zmq):
-    node = Node('node_0', 160, 'tcp://127.0.0.1')
-
-    pair = Mock()
-    pair.send_pyobj.return_value = None
-    pair.recv_pyobj.return_value = {'successor': 163, 'address': 'tcp://127.0.0.1:5555'}
-
-    node._fix_fingers(pair)
-    assert node.virtual_nodes[160].fingers == [None] * NUM_BITS
-
-
 @mock.patch('chord.node.zmq')
 def test_find_successor_node(mock_zmq):
     node = Node('node_0', 160, 'tcp://127.0.0.1', None, '5555')
@@ -295,3 +285,533 @@ def test_next_finger_key():
         next(next_key)
 
 
+
+
+def test_next_finger_key_wide():
+    v_node = VirtualNode('vnode_1', pow(2, 32) - 1, 235, 'tcp://127.0.0.1:5555', num_bits=32)
+
+    next_key = list(v_node.next_finger_key())
+    assert len(next_key) == 32
+    assert len(v_node.fingers) == 32
+    assert next_key[0] == 0
+    assert next_key[1] == 1
+    assert next_key[31] == pow(2, 31) - 1
+
+
+def test_successor_list():
+    v_node = VirtualNode('vnode_1', 10, 10, 'tcp://127.0.0.1:5555', num_successors=3)
+    assert v_node.successor_list == [v_node.routing_info]
+
+    successor = RoutingInfo(30, 30, 'tcp://127.0.0.1:5556')
+    v_node.successor = successor
+    assert v_node.successor_list == [successor]
+
+    # The list is the successor followed by the start of the successor's own list
+    v_node.update_successor_list(successor, [RoutingInfo(50, 50, 'tcp://127.0.0.1:5557'),
+                                             RoutingInfo(70, 70, 'tcp://127.0.0.1:5558'),
+                                             RoutingInfo(90, 90, 'tcp://127.0.0.1:5559')])
+    assert [entry.digest for entry in v_node.successor_list] == [30, 50, 70]
+
+    # A node joining between this node and its successor is put in front
+    v_node.update_successor(RoutingInfo(20, 20, 'tcp://127.0.0.1:5560'))
+    assert [entry.digest for entry in v_node.successor_list] == [20, 30, 50]
+
+    # The list stops where it wraps around to this node
+    v_node.update_successor_list(v_node.successor, [RoutingInfo(30, 30, 'tcp://127.0.0.1:5556'),
+                                                    v_node.routing_info])
+    assert [entry.digest for entry in v_node.successor_list] == [20, 30]
+
+    # Lists from an old successor are ignored
+    v_node.update_successor_list(successor, [RoutingInfo(50, 50, 'tcp://127.0.0.1:5557')])
+    assert [entry.digest for entry in v_node.successor_list] == [20, 30]
+
+
+def test_remove_failed():
+    v_node = ChordVirtualNode('vnode_1', 10, 10, 'tcp://127.0.0.1:5555', num_bits=8)
+    v_node.successor_list = [RoutingInfo(30, 30, 'tcp://127.0.0.1:5556'),
+                             RoutingInfo(50, 50, 'tcp://127.0.0.1:5557')]
+    v_node.fingers[0] = RoutingInfo(30, 30, 'tcp://127.0.0.1:5556')
+    v_node.fingers[6] = RoutingInfo(80, 80, 'tcp://127.0.0.1:5558')
+    v_node.predecessor = RoutingInfo(200, 200, 'tcp://127.0.0.1:5559')
+
+    v_node.remove_failed(RoutingInfo(30, 30, 'tcp://127.0.0.1:5556'))
+    assert v_node.successor == RoutingInfo(50, 50, 'tcp://127.0.0.1:5557')
+    assert v_node.fingers[0] is None
+    assert v_node.predecessor.digest == 200
+
+    # Lookups route around the failed node
+    found, successor, hops = v_node.find_successor(40, 0)
+    assert found
+    assert successor.digest == 50
+
+    # With no other entry in the list, the closest finger takes over
+    v_node.remove_failed(RoutingInfo(50, 50, 'tcp://127.0.0.1:5557'))
+    assert v_node.successor.digest == 80
+
+    v_node.remove_failed(RoutingInfo(200, 200, 'tcp://127.0.0.1:5559'))
+    assert v_node.predecessor is None
+
+    # The last known successor is kept rather than leaving the ring
+    v_node.remove_failed(RoutingInfo(80, 80, 'tcp://127.0.0.1:5558'))
+    assert v_node.successor.digest == 80
+
+
+def test_closest_preceding_successor_list():
+    v_node = ChordVirtualNode('vnode_1', 10, 10, 'tcp://127.0.0.1:5555', num_bits=8)
+    v_node.successor_list = [RoutingInfo(30, 30, 'tcp://127.0.0.1:5556'),
+                             RoutingInfo(50, 50, 'tcp://127.0.0.1:5557'),
+                             RoutingInfo(70, 70, 'tcp://127.0.0.1:5558')]
+
+    assert v_node.closest_preceding_node(60).digest == 50
+    assert v_node.closest_preceding_node(200).digest == 70
+    assert v_node.closest_preceding_node(20).digest == 30
+
+
+def test_stabilize_fails_over():
+    v_node = VirtualNode('node_0', 160, 160, 'tcp://127.0.0.1:5555')
+    failed = RoutingInfo(30, 30, 'tcp://127.0.0.1:5556')
+    v_node.successor_list = [failed, RoutingInfo(50, 50, 'tcp://127.0.0.1:5557')]
+
+    # A successor is only removed after several missed replies in a row
+    for _ in range(MAX_MISSED_REPLIES - 1):
+        v_node.successor_missed(failed)
+        assert v_node.successor.digest == 30
+
+    v_node.successor_missed(failed)
+    assert v_node.successor.digest == 50
+
+
+def test_reply_resets_missed():
+    v_node = VirtualNode('vnode_1', 10, 10, 'tcp://127.0.0.1:5555')
+    successor = RoutingInfo(30, 30, 'tcp://127.0.0.1:5556')
+    v_node.successor_list = [successor, RoutingInfo(50, 50, 'tcp://127.0.0.1:5557')]
+
+    for _ in range(MAX_MISSED_REPLIES - 1):
+        v_node.successor_missed(successor)
+    v_node.update_successor_list(successor, [RoutingInfo(50, 50, 'tcp://127.0.0.1:5557')])
+    v_node.successor_missed(successor)
+    assert v_node.successor.digest == 30
+
+
+@mock.patch('chord.node.zmq')
+def test_predecessor_command_successor_list(mock_zmq):
+    node = Node('node_0', 160, 'tcp://127.0.0.1', None, '5555', {'v_node_30': 30})
+    initiator = node.virtual_nodes[160]
+    successor = node.virtual_nodes[30]
+    initiator.successor = successor.routing_info
+    successor.successor_list = [RoutingInfo(50, 50, 'tcp://127.0.0.1:5557'),
+                                RoutingInfo(70, 70, 'tcp://127.0.0.1:5558')]
+
+    cmd = PredecessorCommand(initiator=initiator.routing_info)
+    assert cmd.execute(node) == successor.routing_info
+    assert cmd.execute(node) == initiator.routing_info
+    assert cmd.successor_list == successor.successor_list
+
+    cmd.execute(node)
+    assert [entry.digest for entry in initiator.successor_list] == [30, 50, 70]
+
+
+@mock.patch('chord.node.zmq')
+def test_local_hops(mock_zmq):
+    node = Node('node_0', 160, 'tcp://127.0.0.1', None, '5555', {'v_node_20': 20, 'v_node_90': 90})
+    remote = RoutingInfo(200, 200, 'tcp://127.0.0.1:5556')
+    node.virtual_nodes[20].successor = node.virtual_nodes[90].routing_info
+    node.virtual_nodes[90].successor = node.virtual_nodes[160].routing_info
+    node.virtual_nodes[160].successor = remote
+
+    # Every hop is taken on this node, and only the result is sent to the initiator
+    initiator = RoutingInfo(5, 5, 'tcp://127.0.0.1:5557')
+    cmd = FindSuccessorCommand(initiator=initiator, recipient=node.virtual_nodes[20].routing_info,
+                               search_digest=180)
+    assert cmd.execute(node) == initiator
+    assert cmd.found
+    assert cmd.recipient == remote
+    assert cmd.hops == 3
+
+    # The lookup leaves the node at the first hop to another node
+    cmd = FindSuccessorCommand(initiator=initiator, recipient=node.virtual_nodes[20].routing_info,
+                               search_digest=250)
+    assert cmd.execute(node) == remote
+    assert not cmd.found
+    assert cmd.hops == 3
+
+
+@mock.patch('chord.node.zmq')
+def test_store_command(mock_zmq):
+    node = Node('node_0', 160, 'tcp://127.0.0.1', None, '5555', {'v_node_90': 90})
+    remote = RoutingInfo(200, 200, 'tcp://127.0.0.1:5556')
+    node.virtual_nodes[160].successor = node.virtual_nodes[90].routing_info
+    node.virtual_nodes[90].successor = remote
+
+    # A PUT for a key owned on this node is applied and answered right away
+    cmd = node.client_command([b'client', *request(PUT, 'key_1', b'value')])
+    cmd.search_digest = 50
+    assert cmd.execute(node) is None
+    assert node.virtual_nodes[90].store.get('key_1') == b'value'
+    assert cmd.status == OK
+
+    frames = node.router.send_multipart.call_args[0][0]
+    assert frames[0] == b'client'
+
+    # A key owned by another node is sent to its owner, which applies it and sends it back
+    cmd = node.client_command([b'client', *request(GET, 'key_2')])
+    cmd.search_digest = 150
+    assert cmd.execute(node) == remote
+    assert cmd.found
+
+    owner = Node('node_1', 200, 'tcp://127.0.0.1', None, '5556')
+    owner.virtual_nodes[200].store.put('key_2', 150, b'other')
+    assert cmd.execute(owner) == RoutingInfo(None, 160, 'tcp://127.0.0.1:5555')
+    assert cmd.value == b'other'
+
+    assert cmd.execute(node) is None
+    reply = node.router.send_multipart.call_args[0][0]
+    assert reply[-1] == b'other'
+
+    # DELETE of a missing key
+    cmd = node.client_command([b'client', *request(DELETE, 'key_3')])
+    cmd.search_digest = 50
+    cmd.execute(node)
+    assert cmd.status == NOT_FOUND
+
+    # A key too long to hand to other nodes is rejected before it is stored
+    key = 'k' * (wire.MAX_KEY_SIZE + 1)
+    assert node.client_command([b'client', *request(PUT, key, b'value')]) is None
+    reply = node.router.send_multipart.call_args[0][0]
+    assert reply[0] == b'client'
+    assert decode_command(reply[1], reply[2:]).status == INVALID
+    assert all(key not in v_node.store.entries for v_node in node.virtual_nodes.values())
+
+    # The longest key that fits is accepted and can be handed off
+    key = 'k' * wire.MAX_KEY_SIZE
+    cmd = node.client_command([b'client', *request(PUT, key, b'value')])
+    cmd.search_digest = 50
+    cmd.execute(node)
+    assert cmd.status == OK
+    entries = [(key, 50, b'value', 1)]
+    assert wire.unpack_entries(wire.pack_entries(entries), 0, 1, 'test') == entries
+
+
+def request(operation, key, value=None):
+    command = StoreCommand(operation, key, value, 1)
+    return [command.encode()] + command.data_frames()
+
+
+class Network:
+    """ Delivers the commands nodes send to each other in order, through the wire format """
+
+    def __init__(self, *nodes):
+        self.nodes = {node.digest_id: node for node in nodes}
+        self.messages = []
+        self.replies = []
+        for node in nodes:
+            node.route_result = self.send
+            node.reply_client = self.replies.append
+
+    def send(self, address, identity, command):
+        self.messages.append((identity, decode_command(command.encode(), command.data_frames())))
+
+    def deliver(self, count=None):
+        """ Delivers `count` messages, or every message until there are none left """
+        while self.messages and count != 0:
+            count = count - 1 if count else None
+            identity, command = self.messages.pop(0)
+            result = command.execute(self.nodes[identity])
+            if result:
+                self.send(result.address, result.parent_digest, command)
+
+
+def stored(v_node):
+    return {key: value for key, (_, value, _) in v_node.store.entries.items()}
+
+
+def store_request(node, operation, digest, value=None):
+    # A request that reached the owner, sent by a client of `node`
+    host = node.virtual_nodes[node.digest_id]
+    command = StoreCommand(operation, f'key_{digest}', value, 1, initiator=RoutingInfo(None, node.digest_id, 'client'),
+                           recipient=host.routing_info, found=True, search_digest=digest)
+    command.client = b'client'
+    return command
+
+
+@mock.patch('chord.node.zmq')
+def test_handoff(mock_zmq):
+    old_owner = Node('node_0', 100, 'tcp://127.0.0.1', None, '5555')
+    new_owner = Node('node_1', 50, 'tcp://127.0.0.1', None, '5556')
+    network = Network(old_owner, new_owner)
+    v_node = old_owner.virtual_nodes[100]
+    for digest in [10, 40, 60, 90]:
+        v_node.store.put(f'key_{digest}', digest, b'old')
+
+    # The new predecessor takes the keys up to its digest
+    network.send(None, 100, NotifyCommand(new_owner.virtual_nodes[50].routing_info, v_node.routing_info))
+    network.deliver(1)
+    assert v_node.outgoing is not None
+    chunk = network.messages.pop()
+
+    # Writes reach the new owner while the keys are on the way, and are not overwritten by them
+    network.send(None, 100, store_request(old_owner, PUT, 40, b'new'))
+    network.deliver()
+    assert network.replies.pop().status == OK
+
+    network.messages.append(chunk)
+    network.deliver()
+    assert stored(new_owner.virtual_nodes[50]) == {'key_10': b'old', 'key_40': b'new'}
+    assert stored(v_node) == {'key_60': b'old', 'key_90': b'old'}
+    assert v_node.outgoing is None
+    assert not new_owner.virtual_nodes[50].written
+
+    assert old_owner.transfer_stats.keys_sent == 2
+    assert old_owner.transfer_stats.transfers_completed == 1
+    assert new_owner.transfer_stats.bytes_received == 2 * len('key_10old')
+
+    # Requests that reach the old owner are forwarded
+    network.send(None, 100, store_request(old_owner, GET, 10))
+    network.deliver()
+    assert network.replies.pop().value == b'old'
+
+
+@mock.patch('chord.node.zmq')
+def test_handoff_resumes(mock_zmq):
+    old_owner = Node('node_0', 100, 'tcp://127.0.0.1', None, '5555')
+    new_owner = Node('node_1', 50, 'tcp://127.0.0.1', None, '5556')
+    network = Network(old_owner, new_owner)
+    v_node = old_owner.virtual_nodes[100]
+    v_node.store.put('key_10', 10, b'value')
+
+    notify = NotifyCommand(new_owner.virtual_nodes[50].routing_info, v_node.routing_info)
+    network.send(None, 100, notify)
+    network.deliver(1)
+    assert v_node.outgoing is not None
+
+    # The chunk was lost. It is sent again on the next notify once the transfer stalls
+    network.messages.clear()
+    with mock.patch.object(type(v_node.outgoing), 'stalled', return_value=True):
+        network.send(None, 100, notify)
+        network.deliver()
+
+    assert stored(new_owner.virtual_nodes[50]) == {'key_10': b'value'}
+    assert v_node.outgoing is None
+    assert old_owner.transfer_stats.chunks_resent == 1
+
+
+@mock.patch('chord.node.zmq')
+def test_leave(mock_zmq):
+    leaving = Node('node_0', 100, 'tcp://127.0.0.1', None, '5555', {'v_node_70': 70})
+    successor = Node('node_1', 50, 'tcp://127.0.0.1', None, '5556')
+    network = Network(leaving, successor)
+
+    # Ring of 50, 70 and 100
+    successor.virtual_nodes[50].successor = leaving.virtual_nodes[70].routing_info
+    successor.virtual_nodes[50].predecessor = leaving.virtual_nodes[100].routing_info
+    leaving.virtual_nodes[70].successor = leaving.virtual_nodes[100].routing_info
+    leaving.virtual_nodes[70].predecessor = successor.virtual_nodes[50].routing_info
+    leaving.virtual_nodes[100].successor_list = [successor.virtual_nodes[50].routing_info]
+    leaving.virtual_nodes[100].predecessor = leaving.virtual_nodes[70].routing_info
+    leaving.virtual_nodes[100].store.put('key_80', 80, b'value')
+    leaving.virtual_nodes[70].store.put('key_60', 60, b'value')
+
+    assert leaving.start_leave()
+    network.deliver()
+
+    # The successor is its own predecessor once both virtual nodes before it have left
+    assert leaving.handoffs_done()
+    assert stored(successor.virtual_nodes[50]) == {'key_60': b'value', 'key_80': b'value'}
+    assert successor.virtual_nodes[50].predecessor == successor.virtual_nodes[50].routing_info
+
+
+def ring_of_three(consistency):
+    """ :return: nodes 100, 150 and 200, linked into a ring """
+    nodes = [Node(f'node_{i}', digest, 'tcp://127.0.0.1', None, str(5555 + i), consistency=consistency)
+             for i, digest in enumerate([100, 150, 200])]
+    v_nodes = [node.virtual_nodes[node.digest_id] for node in nodes]
+    for i, v_node in enumerate(v_nodes):
+        v_node.successor_list = [v_nodes[(i + 1) % 3].routing_info, v_nodes[(i + 2) % 3].routing_info]
+        v_node.predecessor = v_nodes[i - 1].routing_info
+    return nodes, v_nodes
+
+
+def replica(v_node, owner, key):
+    store = v_node.replicas.get(owner.get_digest())
+    return store.entries.get(key) if store else None
+
+
+@mock.patch('chord.node.zmq')
+def test_replicated_write(mock_zmq):
+    nodes, v_nodes = ring_of_three(Consistency(3, 2, 2))
+    network = Network(*nodes)
+    owner = v_nodes[1]
+    assert nodes[1].replica_targets(owner) == [v_nodes[2].routing_info, v_nodes[0].routing_info]
+
+    # The owner answers once one of the two replicas stored the write
+    command = store_request(nodes[1], PUT, 120, b'value')
+    assert command.execute(nodes[1]) is None
+    network.deliver(2)
+    assert not network.replies
+
+    network.deliver(1)
+    assert network.replies.pop().status == OK
+    network.deliver()
+    assert not nodes[1].quorums
+
+    version = owner.store.version('key_120')
+    for v_node in [v_nodes[0], v_nodes[2]]:
+        assert replica(v_node, owner, 'key_120') == (120, b'value', version)
+
+
+@mock.patch('chord.node.zmq')
+def test_quorum_read(mock_zmq):
+    nodes, v_nodes = ring_of_three(Consistency(3, 3, 1))
+    network = Network(*nodes)
+    owner = v_nodes[1]
+    owner.store.put('key_120', 120, b'old', 1)
+    v_nodes[2].replicas[150] = type(owner.store)()
+    v_nodes[2].replicas[150].put('key_120', 120, b'new', 2)
+
+    # The newest copy wins, and the copies that were older are brought up to date
+    assert store_request(nodes[1], GET, 120).execute(nodes[1]) is None
+    network.deliver()
+    assert network.replies.pop().value == b'new'
+    assert owner.store.entries['key_120'] == (120, b'new', 2)
+    assert replica(v_nodes[0], owner, 'key_120') == (120, b'new', 2)
+
+
+@mock.patch('chord.node.zmq')
+def test_quorum_unavailable(mock_zmq):
+    # A single node has no replicas to send a write to
+    node = Node('node_0', 100, 'tcp://127.0.0.1', None, '5555', consistency=Consistency(3, 1, 2))
+    network = Network(node)
+    assert store_request(node, PUT, 50, b'value').execute(node) is None
+    assert network.replies.pop().status == UNAVAILABLE
+    assert not node.virtual_nodes[100].store
+
+    # Replicas that do not answer in time fail the operation
+    nodes, v_nodes = ring_of_three(Consistency(3, 1, 2))
+    network = Network(*nodes)
+    store_request(nodes[1], PUT, 120, b'value').execute(nodes[1])
+    network.messages.clear()
+    with mock.patch('chord.replication.time.monotonic', return_value=float('inf')):
+        nodes[1].expire_quorums()
+    assert network.replies.pop().status == UNAVAILABLE
+    assert not nodes[1].quorums
+
+
+@mock.patch('chord.node.zmq')
+def test_anti_entropy(mock_zmq):
+    nodes, v_nodes = ring_of_three(Consistency(3, 1, 1))
+    network = Network(*nodes)
+    owner = v_nodes[1]
+    owner.store.put('key_120', 120, b'value', 1)
+    owner.store.put('key_110', 110, b'old', 1)
+    copies = v_nodes[2].replicas[150] = type(owner.store)()
+    copies.put('key_110', 110, b'new', 2)
+    copies.put('key_130', 130, b'missed', 1)
+    copies.put('key_180', 180, b'moved', 1)
+
+    nodes[1].start_sync(owner)
+    network.deliver()
+
+    # Each side gets the newer copies of the other, and copies of keys the owner no longer owns are dropped
+    assert stored(owner) == {'key_120': b'value', 'key_110': b'new', 'key_130': b'missed'}
+    assert {key: value for key, (_, value, _) in copies.entries.items()} == \
+           {'key_120': b'value', 'key_110': b'new', 'key_130': b'missed'}
+    assert replica(v_nodes[0], owner, 'key_120') == (120, b'value', 1)
+
+
+@mock.patch('chord.node.zmq')
+def test_anti_entropy_differences(mock_zmq):
+    nodes, v_nodes = ring_of_three(Consistency(2, 1, 1))
+    network = Network(*nodes)
+    owner = v_nodes[1]
+    for digest in range(101, 151):
+        store_request(nodes[1], PUT, digest, b'value').execute(nodes[1])
+    network.deliver()
+    copies = v_nodes[2].replicas[150]
+
+    def sync():
+        # Kind, number of keys and number of tree nodes of every message
+        messages = []
+        nodes[1].start_sync(owner)
+        while network.messages:
+            command = network.messages[0][1]
+            messages.append((command.kind, len(command.entries), len(command.nodes)))
+            network.deliver(1)
+        return messages
+
+    # Replicas that agree only compare the root
+    assert sync() == [(TREE, 0, 1), (TREE, 0, 0)]
+
+    # Only the buckets that differ are compared key by key, so one key is sent to repair one missed write
+    copies.remove('key_120')
+    messages = sync()
+    assert sum(count for kind, count, _ in messages if kind == TREE) == 0
+    assert (WRITE, 1, 0) in messages
+    assert replica(v_nodes[2], owner, 'key_120') == owner.store.entries['key_120']
+
+    store_request(nodes[1], DELETE, 130).execute(nodes[1])
+    network.messages.clear()
+    messages = sync()
+    assert sum(count for kind, count, _ in messages if kind == TREE) == 1
+    assert replica(v_nodes[2], owner, 'key_130')[1] is None
+    assert sync() == [(TREE, 0, 1), (TREE, 0, 0)]
+
+
+@mock.patch('chord.node.zmq')
+def test_replicas_promoted(mock_zmq):
+    nodes, v_nodes = ring_of_three(Consistency(3, 1, 1))
+    network = Network(*nodes)
+    v_nodes[2].replicas[150] = type(v_nodes[2].store)()
+    v_nodes[2].replicas[150].put('key_120', 120, b'value', 1)
+
+    # Reads find the copies while the predecessor is gone
+    v_nodes[2].remove_failed(v_nodes[1].routing_info)
+    assert v_nodes[2].predecessor is None
+    command = store_request(nodes[2], GET, 120)
+    command.execute(nodes[2])
+    assert network.replies.pop().value == b'value'
+
+    # The node before the one that failed becomes the predecessor, and the copies are promoted
+    network.send(None, 200, NotifyCommand(v_nodes[0].routing_info, v_nodes[2].routing_info))
+    network.deliver()
+    assert stored(v_nodes[2]) == {'key_120': b'value'}
+    assert not v_nodes[2].replicas
+
+
+@mock.patch('chord.node.zmq')
+def test_nearest_reads(mock_zmq):
+    nodes, v_nodes = ring_of_three(Consistency(3, 1, 1, nearest_reads=True))
+    network = Network(*nodes)
+    v_nodes[0].replicas[150] = type(v_nodes[0].store)()
+    v_nodes[0].replicas[150].put('key_1', 120, b'value', 1)
+
+    # A node holding a copy answers without going to the owner
+    assert nodes[0].client_command([b'client', *request(GET, 'key_1')]) is None
+    assert network.replies.pop().value == b'value'
+    assert not network.messages
+
+    assert nodes[0].client_command([b'client', *request(GET, 'key_2')]) is not None
+
+
+@mock.patch('chord.node.zmq')
+def test_leave_fails_over(mock_zmq):
+    leaving = Node('node_0', 100, 'tcp://127.0.0.1', None, '5555')
+    gone = RoutingInfo(50, 50, 'tcp://127.0.0.1:5556')
+    successor = Node('node_2', 70, 'tcp://127.0.0.1', None, '5557')
+    network = Network(leaving, successor)
+    v_node = leaving.virtual_nodes[100]
+    v_node.successor_list = [gone, successor.virtual_nodes[70].routing_info]
+    v_node.store.put('key_80', 80, b'value')
+
+    assert leaving.start_leave()
+    identity, chunk = network.messages.pop()
+    assert identity == 50
+
+    # The chunk could not be sent, so the keys go to the next successor
+    frames = [b'50', chunk.encode()] + chunk.data_frames()
+    with mock.patch.object(leaving.connections, 'expire', return_value=[(gone.address, [frames])]):
+        leaving.reroute_expired()
+    assert v_node.successor_list == [successor.virtual_nodes[70].routing_info]
+
+    network.deliver()
+    assert leaving.handoffs_done()
+    assert stored(successor.virtual_nodes[70]) == {'key_80': b'value'}
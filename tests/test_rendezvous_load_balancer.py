@@ -0,0 +1,42 @@
+from chord import rendezvous_load_balancer
+
+
+def test_adding_server():
+    keys = rendezvous_load_balancer.generate_keys(10)
+    balancer = rendezvous_load_balancer.RendezvousBalancer()
+
+    balancer.build_server_list(10)
+    assert len(balancer.servers) == 10
+
+    keys_to_servers1 = balancer.get_servers(keys)
+    assert keys_to_servers1['cached_data_1'].name == 'server_8'
+    assert keys_to_servers1['cached_data_7'].name == 'server_7'
+
+    balancer.build_server_list(2)
+    assert len(balancer.servers) == 12
+
+    keys_to_servers2 = balancer.get_servers(keys)
+    assert keys_to_servers2['cached_data_1'].name == 'server_11'
+    assert keys_to_servers2['cached_data_7'].name == 'server_10'
+
+    changes = rendezvous_load_balancer.calculate_change(keys_to_servers1, keys_to_servers2)
+    assert changes == ['cached_data_1', 'cached_data_7']
+
+
+def test_responsible_servers():
+    balancer = rendezvous_load_balancer.RendezvousBalancer()
+    balancer.build_server_list(10)
+
+    for key in rendezvous_load_balancer.generate_keys(20):
+        replicas = balancer.responsible_servers(key, 3)
+        assert len(set(replicas)) == 3
+        assert replicas[0] == balancer.responsible_server(key)
+
+    # Removing the top server promotes the remaining replicas
+    key = 'cached_data_0'
+    replicas = balancer.responsible_servers(key, 3)
+    for digest, server in list(balancer.servers.items()):
+        if server == replicas[0]:
+            del balancer.servers[digest]
+
+    assert balancer.responsible_servers(key, 2) == replicas[1:]
@@ -0,0 +1,22 @@
+import io
+
+from chord import rendezvous_load_balancer
+
+
+def test_10_orig_2_addtl():
+    cmd = ['10', '10', '--additional', '2', '--no-formatting']
+    expected = 'Mapping of keys to server hosting key with 10 servers:\n{"cached_data_0": {"name": "server_3"}, ' \
+               '"cached_data_1": {"name": "server_8"}, "cached_data_2": {"name": "server_7"}, "cached_data_3": {' \
+               '"name": "server_1"}, "cached_data_4": {"name": "server_7"}, "cached_data_5": {"name": "server_2"}, ' \
+               '"cached_data_6": {"name": "server_4"}, "cached_data_7": {"name": "server_7"}, "cached_data_8": {' \
+               '"name": "server_8"}, "cached_data_9": {"name": "server_9"}}\n\nMapping of keys to server hosting ' \
+               'key with 12 servers:\n{"cached_data_0": {"name": "server_3"}, "cached_data_1": {"name": ' \
+               '"server_11"}, "cached_data_2": {"name": "server_7"}, "cached_data_3": {"name": "server_1"}, ' \
+               '"cached_data_4": {"name": "server_7"}, "cached_data_5": {"name": "server_2"}, "cached_data_6": {' \
+               '"name": "server_4"}, "cached_data_7": {"name": "server_10"}, "cached_data_8": {"name": "server_8"}, ' \
+               '"cached_data_9": {"name": "server_9"}}\n\n A total of 2 out of 10 keys have changed hosts:\n[' \
+               '"cached_data_1", "cached_data_7"]'
+    actual = io.StringIO()
+
+    rendezvous_load_balancer.main(actual, cmd)
+    assert actual.getvalue().strip() == expected
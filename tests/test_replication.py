@@ -0,0 +1,59 @@
+import pytest
+
+from unittest import mock
+
+from chord.node import RoutingInfo
+from chord.replication import Consistency, Quorum
+from chord.store import Store, GET, PUT
+
+
+def test_consistency():
+    consistency = Consistency(3, 2, 2)
+    assert consistency.needed(GET) == 1
+    assert consistency.needed(PUT) == 1
+    assert Consistency().needed(PUT) == 0
+
+    with pytest.raises(ValueError):
+        Consistency(0)
+    with pytest.raises(ValueError):
+        Consistency(3, 4, 1)
+    with pytest.raises(ValueError):
+        Consistency(3, 1, 0)
+    with pytest.raises(ValueError, match='Nearest reads'):
+        Consistency(3, 2, 2, nearest_reads=True)
+
+
+def test_quorum():
+    quorum = Quorum(None, 150, 2, ('key_1', 120, b'owner', 5))
+    assert not quorum.add(RoutingInfo(200, 200, 'tcp://127.0.0.1:5556'), ('key_1', 120, b'newer', 7))
+    assert quorum.add(RoutingInfo(100, 100, 'tcp://127.0.0.1:5557'), ('key_1', 120, None, 0))
+
+    assert quorum.newest == ('key_1', 120, b'newer', 7)
+    assert [replica.digest for replica in quorum.stale()] == [100]
+
+    assert not quorum.expired()
+    with mock.patch('chord.replication.time.monotonic', return_value=quorum.deadline):
+        assert quorum.expired()
+
+
+def test_store_versions():
+    store = Store()
+    version = store.put('key_1', 120, b'value')
+    assert store.version('key_1') == version
+
+    # Older copies do not replace newer ones, and new writes always get a later version
+    assert store.put('key_1', 120, b'older', version - 1) is None
+    assert store.put('key_1', 120, b'newer', version + 10) == version + 10
+    assert store.put('key_1', 120, b'latest') > version + 10
+
+    # Deleted keys are kept so older copies do not bring them back
+    assert store.delete('key_1')
+    assert store.get('key_1') is None
+    assert 'key_1' in store
+    assert not store.delete('key_1')
+    assert store.put('key_1', 120, b'value', version) is None
+
+    assert not store.delete('key_2', 130)
+    assert store.entries['key_2'][:2] == (130, None)
+    store.remove('key_2')
+    assert 'key_2' not in store
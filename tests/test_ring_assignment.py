@@ -0,0 +1,50 @@
+import numpy as np
+
+from chord import ring_assignment
+from chord.hash import hash_values
+from chord.util import generate_keys
+
+
+def test_hash_keys():
+    keys = generate_keys(250)
+
+    digests = ring_assignment.hash_keys(250, num_bits=32)
+    assert digests.dtype == np.uint64
+    assert list(digests) == hash_values(keys, 32)
+
+    digests = ring_assignment.hash_keys(250, num_bits=160)
+    assert digests.dtype == object
+    assert list(digests) == hash_values(keys, 160)
+
+
+def test_consistent_assign():
+    server_digests = ring_assignment.digest_array([10, 20, 30])
+    owners = np.array([7, 8, 9])
+    key_digests = ring_assignment.digest_array([5, 10, 11, 25, 30, 31, 255])
+
+    assignment = ring_assignment.consistent_assign(key_digests, server_digests, owners)
+    assert list(assignment) == [7, 7, 8, 9, 9, 7, 7]
+
+
+def test_consistent_assign_wide():
+    server_digests = ring_assignment.digest_array([pow(2, 100), pow(2, 150)], 160)
+    owners = np.array([0, 1])
+    key_digests = ring_assignment.digest_array([1, pow(2, 100) + 1, pow(2, 159)], 160)
+
+    assignment = ring_assignment.consistent_assign(key_digests, server_digests, owners)
+    assert list(assignment) == [0, 1, 0]
+
+
+def test_modn_assign():
+    key_digests = ring_assignment.digest_array([0, 1, 2, 3, 4, 5])
+
+    assignment = ring_assignment.modn_assign(key_digests, np.array([4, 5, 6]))
+    assert list(assignment) == [4, 5, 6, 4, 5, 6]
+
+
+def test_calculate_change():
+    assignment1 = np.array([0, 1, 2, 0, 1])
+    assignment2 = np.array([0, 1, 3, 3, 1])
+
+    assert ring_assignment.calculate_change(assignment1, assignment2) == 2
+    assert list(ring_assignment.changed_keys(assignment1, assignment2)) == [2, 3]
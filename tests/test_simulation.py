@@ -0,0 +1,152 @@
+import io
+import random
+
+import pytest
+
+from chord import simulation
+from chord.directchord import build_nodes
+
+
+def test_event_queue():
+    events = simulation.EventQueue()
+    order = []
+
+    events.schedule(2, order.append, 'c')
+    events.schedule(1, order.append, 'a')
+    events.schedule(1, order.append, 'b')
+    events.schedule(5, order.append, 'd')
+
+    assert events.run(3) == 3
+    assert order == ['a', 'b', 'c']
+    assert events.now == 2
+    assert len(events) == 1
+
+
+def test_latency_sampler():
+    rng = random.Random(0)
+
+    assert simulation.latency_sampler('constant', 0.5, rng)() == 0.5
+    assert 0 <= simulation.latency_sampler('uniform', 0.5, rng)() <= 1
+    assert simulation.latency_sampler('exponential', 0.5, rng)() >= 0
+
+    with pytest.raises(ValueError):
+        simulation.latency_sampler('normal', 0.5, rng)
+
+
+def test_ring_errors():
+    nodes = build_nodes(50, simulation.SimNode, num_bits=16)
+    assert simulation.ring_errors(nodes) == (0, [])
+
+    ring = nodes.values()
+    ring[3].successor = ring[5]
+    ring[7].fingers[10] = ring[0]
+
+    successor_errors, finger_errors = simulation.ring_errors(nodes)
+    assert successor_errors == 1
+
+    assert len(finger_errors) >= 1
+    for digest, index, actual, expected in finger_errors:
+        assert expected == get_id(index, digest, list(nodes.keys()), 16)
+
+
+def test_converge_from_empty_fingers():
+    sim = simulation.Simulation(100, 32, initial_fingers='empty', latency=lambda: 0.01)
+    result = sim.run(1000)
+
+    assert result['converged']
+    assert result['finger_error_rate'] == 0
+    assert sim.samples[0]['finger_error_rate'] > 0
+
+    # Every finger is refreshed once per num_bits rounds of fix_fingers
+    assert result['convergence_time'] <= (32 + 1) * simulation.FIX_FINGERS_INTERVAL + simulation.STABILIZE_INTERVAL
+
+
+def test_churn():
+    rng = random.Random(1)
+    sim = simulation.Simulation(200, 32, latency=simulation.latency_sampler('exponential', 0.05, rng),
+                                join_rate=0.5, leave_rate=0.5, churn_duration=60, seed=1)
+    result = sim.run(2000)
+
+    assert result['joins'] > 0 and result['leaves'] > 0
+    assert result['nodes'] == 200 + result['joins'] - result['leaves']
+    assert result['converged']
+    assert simulation.ring_errors(sim.nodes) == (0, [])
+    assert all(node.alive for node in sim.nodes.values())
+
+
+def test_crashes():
+    rng = random.Random(2)
+    sim = simulation.Simulation(200, 32, latency=simulation.latency_sampler('exponential', 0.05, rng),
+                                crash_rate=0.5, lookup_rate=5, churn_duration=60, seed=2)
+    result = sim.run(2000)
+
+    assert result['crashes'] > 0 and result['leaves'] == 0
+    assert result['nodes'] == 200 - result['crashes']
+    assert result['converged']
+    assert simulation.ring_errors(sim.nodes) == (0, [])
+
+    assert result['lookups'] > 0
+    assert 0 < result['lookup_success_rate'] <= 1
+    assert result['hop_inflation'] >= 1
+    assert result['maintenance_messages'] < result['messages']
+
+
+def test_crashed_nodes_are_not_installed_as_fingers():
+    installed = []
+
+    class RecordingSimulation(simulation.Simulation):
+        def set_finger(self, node, index, finger):
+            installed.append(finger.alive)
+            super().set_finger(node, index, finger)
+
+    # Without latency a finger is installed as soon as its lookup returns, so any crashed
+    # finger was returned by a lookup that routed through or to a crashed node
+    sim = RecordingSimulation(100, 16, crash_rate=0.5, join_rate=0.2, churn_duration=60, seed=5)
+    result = sim.run(2000)
+
+    assert result['crashes'] > 0
+    assert result['converged']
+    assert installed and all(installed)
+    assert sim.messages['set_finger'] > len(installed)
+
+
+def test_route():
+    nodes = build_nodes(50, simulation.SimNode, num_bits=16)
+    ring = nodes.values()
+
+    for digest in random.Random(0).sample(range(pow(2, 16)), 200):
+        start = ring[digest % len(ring)]
+        assert simulation.route(start, digest) == start.find_successor(digest, 0)
+        assert simulation.ideal_hops(nodes, start.get_id(), digest, 16) == start.find_successor(digest, 0)[1]
+
+    # A lookup answered with a crashed successor times out
+    ring[1].alive = False
+    assert simulation.route(ring[0], ring[1].get_id()) == (None, 1)
+
+
+def test_replay_trace():
+    sim = simulation.Simulation(100, 32, latency=lambda: 0.01, join_rate=0.5, leave_rate=0.3, crash_rate=0.3,
+                                churn_duration=40, seed=3)
+    result = sim.run(2000)
+
+    trace = io.StringIO()
+    simulation.write_trace(trace, sim.trace)
+    trace.seek(0)
+    events = simulation.read_trace(trace)
+    assert events == sim.trace
+    assert [event['event'] for event in events].count('crash') == result['crashes']
+
+    # Replaying the trace with different maintenance intervals makes the same membership changes
+    replayed = simulation.Simulation(100, 32, stabilize_interval=1, fix_fingers_interval=1, latency=lambda: 0.01,
+                                     seed=4, trace=events)
+    replayed_result = replayed.run(2000)
+
+    assert [(event['event'], event['node']) for event in replayed.trace] == \
+           [(event['event'], event['node']) for event in events]
+    assert list(replayed.nodes.keys()) == list(sim.nodes.keys())
+    assert replayed_result['converged']
+
+
+def get_id(idx, node_id, ids, num_bits):
+    search_id = (node_id + pow(2, idx)) % pow(2, num_bits)
+    return next((curr_id for curr_id in ids if curr_id >= search_id), ids[0])
@@ -0,0 +1,45 @@
+import io
+
+from chord import simulation
+
+
+def test_100_empty_fingers():
+    cmd = ['100', '--initial-fingers', 'empty', '--latency-distribution', 'constant']
+
+    expected = 'Simulated 225.0 seconds: 0 joins, 0 leaves, 100 nodes, 26071 messages\n' \
+               'Converged 225.0 seconds after the last membership change'
+    actual = io.StringIO()
+
+    simulation.main(actual, cmd)
+    assert actual.getvalue().strip() == expected
+
+
+def test_churn_does_not_converge():
+    cmd = ['50', '--join-rate', '0.5', '--leave-rate', '0.5', '--churn-duration', '20', '--max-time', '100']
+
+    actual = io.StringIO()
+
+    simulation.main(actual, cmd)
+    assert actual.getvalue().strip().startswith('Simulated 100.0 seconds: 12 joins, 10 leaves, 52 nodes')
+    assert 'Did not converge. Finger error rate' in actual.getvalue()
+
+
+def test_crashes_and_lookups(tmp_path):
+    trace = str(tmp_path / 'trace.jsonl')
+    cmd = ['50', '--crash-rate', '0.2', '--lookup-rate', '2', '--churn-duration', '20', '--record-trace', trace]
+
+    expected = 'Simulated 250.0 seconds: 0 joins, 0 leaves, 3 crashes, 47 nodes, 13539 messages\n' \
+               'Converged 234.3 seconds after the last membership change\n' \
+               '44 lookups during churn: success rate 0.9318, hop inflation 1.029, 13344 maintenance messages'
+    actual = io.StringIO()
+
+    simulation.main(actual, cmd)
+    assert actual.getvalue().strip() == expected
+
+    # Replaying the same crashes without lookups sends only the maintenance messages
+    expected = 'Simulated 250.0 seconds: 0 joins, 0 leaves, 3 crashes, 47 nodes, 13344 messages\n' \
+               'Converged 234.3 seconds after the last membership change'
+    actual = io.StringIO()
+
+    simulation.main(actual, ['50', '--replay-trace', trace])
+    assert actual.getvalue().strip() == expected
@@ -0,0 +1,110 @@
+from unittest import mock
+
+from chord import transfer
+from chord.node import RoutingInfo
+from chord.store import Store
+from chord.transfer import OutgoingTransfer, IncomingTransfer, TransferStats
+
+
+def filled_store(num_keys):
+    store = Store()
+    for i in range(num_keys):
+        store.put(f'key_{i}', i, b'value')
+    return store
+
+
+@mock.patch.object(transfer, 'CHUNK_KEYS', 10)
+@mock.patch.object(transfer, 'WINDOW', 2)
+def test_window():
+    store = filled_store(45)
+    outgoing = OutgoingTransfer(RoutingInfo(30, 30, 'tcp://127.0.0.1:5555'), list(store.entries))
+
+    chunks = outgoing.chunks(store)
+    assert [(sequence, len(entries), last) for sequence, entries, last in chunks] == [(0, 10, False), (1, 10, False)]
+    assert outgoing.chunks(store) == []
+
+    # Keys are deleted as their chunks are acknowledged, which opens the window again
+    assert outgoing.acknowledge(1, store) == (10, 10 * len('key_0value'))
+    assert len(store) == 35
+    assert [sequence for sequence, _, _ in outgoing.chunks(store)] == [2]
+
+    assert outgoing.acknowledge(3, store)[0] == 20
+    chunks = outgoing.chunks(store)
+    assert [(sequence, len(entries), last) for sequence, entries, last in chunks] == [(3, 10, False), (4, 5, True)]
+    assert not outgoing.done()
+
+    outgoing.acknowledge(5, store)
+    assert outgoing.done()
+    assert len(store) == 0
+
+
+@mock.patch.object(transfer, 'CHUNK_KEYS', 10)
+def test_rewind():
+    store = filled_store(25)
+    outgoing = OutgoingTransfer(RoutingInfo(30, 30, 'tcp://127.0.0.1:5555'), list(store.entries))
+
+    first = outgoing.chunks(store)
+    outgoing.acknowledge(1, store)
+    assert not outgoing.stalled()
+
+    # Every unacknowledged chunk is sent again with the same keys and sequence numbers
+    assert outgoing.rewind() == 2
+    assert outgoing.chunks(store) == first[1:]
+
+
+def test_stalled():
+    outgoing = OutgoingTransfer(RoutingInfo(30, 30, 'tcp://127.0.0.1:5555'), [])
+    with mock.patch('chord.transfer.time.monotonic', return_value=outgoing.last_progress + transfer.TRANSFER_WAIT):
+        assert outgoing.stalled()
+
+
+def test_deleted_keys():
+    store = filled_store(3)
+    outgoing = OutgoingTransfer(RoutingInfo(30, 30, 'tcp://127.0.0.1:5555'), list(store.entries))
+    store.remove('key_1')
+    store.delete('key_2')
+
+    # Keys that are gone are skipped, while deletions move like any other key
+    [(sequence, entries, last)] = outgoing.chunks(store)
+    assert [(key, value) for key, _, value, _ in entries] == [('key_0', b'value'), ('key_2', None)]
+    assert last
+
+
+@mock.patch.object(transfer, 'SCAN_KEYS', 4)
+def test_moves():
+    store = filled_store(10)
+    outgoing = OutgoingTransfer(RoutingInfo(30, 30, 'tcp://127.0.0.1:5555'), list(store.entries),
+                                moves=lambda digest: digest % 3 == 0)
+
+    # Each chunk looks at no more than SCAN_KEYS keys, even if few of them move
+    chunks = outgoing.chunks(store)
+    assert [[digest for _, digest, _, _ in entries] for _, entries, _ in chunks] == [[0, 3], [6], [9]]
+    assert [last for _, _, last in chunks] == [False, False, True]
+
+    outgoing.acknowledge(3, store)
+    assert sorted(digest for digest, _, _ in store.entries.values()) == [1, 2, 4, 5, 7, 8]
+
+
+def test_incoming():
+    store = Store()
+    incoming = IncomingTransfer(7, RoutingInfo(30, 30, 'tcp://127.0.0.1:5555'))
+
+    # Chunks out of order and duplicates are not applied
+    assert not incoming.apply(1, [('key_1', 1, b'one', 5)], False, store)
+    assert incoming.apply(0, [('key_0', 0, b'zero', 5), ('key_2', 2, b'two', 5)], False, store, skip={'key_2'})
+    assert not incoming.apply(0, [('key_0', 0, b'zero', 5)], False, store)
+    assert incoming.apply(1, [('key_1', 1, b'one', 5)], True, store)
+
+    # Keys written on the receiver are newer than the ones sent
+    assert store.entries == {'key_0': (0, b'zero', 5), 'key_1': (1, b'one', 5)}
+    assert incoming.complete
+    assert not incoming.expired()
+
+
+def test_stats():
+    stats = TransferStats()
+    assert stats.rate() == 0
+
+    stats.bytes_sent = 1000
+    stats.seconds_sending = 0.5
+    assert stats.as_dict()['bytes_per_second'] == 2000
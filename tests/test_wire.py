@@ -0,0 +1,153 @@
+import pytest
+
+from chord import wire
+from chord.node import RoutingInfo, FindSuccessorCommand, PredecessorCommand, NotifyCommand, \
+    StoreCommand, TransferCommand, ReplicaCommand, EXIT_COMMAND, decode_command
+from chord.replication import READ, TREE
+from chord.store import PUT, GET, NOT_FOUND
+
+
+def test_find_successor():
+    command = FindSuccessorCommand(initiator=RoutingInfo(160, 160, 'tcp://127.0.0.1:5555'),
+                                   recipient=RoutingInfo(30, 45, 'tcp://127.0.0.1:5556'),
+                                   hops=3, found=True, search_digest=20, return_data=4)
+    command.request_id = 12
+
+    decoded = decode_command(command.encode())
+    assert type(decoded) == FindSuccessorCommand
+    assert vars(decoded) == vars(command)
+
+
+def test_missing_fields():
+    # Clients have no digest, and lookups return no data
+    command = FindSuccessorCommand(initiator=RoutingInfo(address='tcp://127.0.0.1:5555'),
+                                   recipient=RoutingInfo(30, 45, 'tcp://127.0.0.1:5556'),
+                                   search_digest=0)
+
+    decoded = decode_command(command.encode())
+    assert decoded.initiator == RoutingInfo(address='tcp://127.0.0.1:5555')
+    assert decoded.search_digest == 0
+    assert decoded.return_data is None
+    assert decoded.request_id is None
+
+
+def test_predecessor():
+    successor_list = [RoutingInfo(50, 50, 'tcp://127.0.0.1:5557'), RoutingInfo(70, 70, 'tcp://127.0.0.1:5558')]
+    command = PredecessorCommand(initiator=RoutingInfo(10, 10, 'tcp://127.0.0.1:5555'),
+                                 recipient=RoutingInfo(30, 30, 'tcp://127.0.0.1:5556'),
+                                 successors_predecessor=None, successor_list=successor_list)
+
+    assert vars(decode_command(command.encode())) == vars(command)
+
+    command.successor_list = None
+    assert decode_command(command.encode()).successor_list is None
+
+
+def test_other_commands():
+    notify = NotifyCommand(initiator=RoutingInfo(10, 10, 'tcp://127.0.0.1:5555'))
+    assert vars(decode_command(notify.encode())) == vars(notify)
+
+    assert decode_command(EXIT_COMMAND.encode()) == EXIT_COMMAND
+
+
+def test_store():
+    command = StoreCommand(PUT, 'key_1', b'\x00value', 7, initiator=RoutingInfo(None, 160, 'tcp://127.0.0.1:5555'),
+                           recipient=RoutingInfo(30, 45, 'tcp://127.0.0.1:5556'), search_digest=30)
+    command.client = b'\x00client'
+
+    decoded = decode_command(command.encode(), command.data_frames())
+    assert type(decoded) == StoreCommand
+    assert vars(decoded) == vars(command)
+
+    # An empty value is still a value
+    command.value = b''
+    assert decode_command(command.encode(), command.data_frames()).value == b''
+
+    reply = StoreCommand(GET, 'key_1', None, 8)
+    reply.status = NOT_FOUND
+    assert vars(decode_command(reply.encode(), reply.data_frames())) == vars(reply)
+
+    with pytest.raises(ValueError, match='data frames'):
+        decode_command(command.encode(), command.data_frames()[:3])
+
+    with pytest.raises(ValueError, match='data frames'):
+        decode_command(NotifyCommand().encode(), [b''])
+
+
+def test_transfer():
+    entries = [('key_1', 2 ** 159, b'\x00value', 2 ** 63), ('k\u00e9y_2', 7, b'', 1), ('key_3', 8, None, 2)]
+    command = TransferCommand(RoutingInfo(160, 160, 'tcp://127.0.0.1:5555'), RoutingInfo(30, 45, 'tcp://127.0.0.1:5556'),
+                              3, entries, last=True, leaving=True, predecessor=RoutingInfo(20, 20, 'tcp://127.0.0.1:5557'))
+    command.request_id = 2 ** 62
+
+    decoded = decode_command(command.encode(), command.data_frames())
+    assert type(decoded) == TransferCommand
+    assert vars(decoded) == vars(command)
+
+    # Acknowledgements carry neither keys nor the predecessor
+    command.acknowledged = True
+    command.entries = []
+    command.predecessor = None
+    assert vars(decode_command(command.encode(), command.data_frames())) == vars(command)
+
+    frame = TransferCommand(sequence=0, entries=entries).data_frames()[0]
+    with pytest.raises(ValueError, match='cut short'):
+        wire.unpack_transfer(frame[:-5])
+
+    with pytest.raises(ValueError, match='after its entries'):
+        wire.unpack_transfer(frame + b'\x00')
+
+
+def test_replica():
+    command = ReplicaCommand(TREE, RoutingInfo(160, 160, 'tcp://127.0.0.1:5555'),
+                             RoutingInfo(30, 45, 'tcp://127.0.0.1:5556'), predecessor=RoutingInfo(20, 20, 'tcp://x'),
+                             nodes=[(1, 2 ** 64 - 1), (1024, 0)])
+    command.request_id = 3
+
+    decoded = decode_command(command.encode(), command.data_frames())
+    assert type(decoded) == ReplicaCommand
+    assert vars(decoded) == vars(command)
+
+    command = ReplicaCommand(READ, command.initiator, command.recipient, [('key_1', 7, b'value', 9), ('key_2', 8, None, 10)])
+    command.acknowledged = True
+    assert vars(decode_command(command.encode(), command.data_frames())) == vars(command)
+
+    with pytest.raises(ValueError, match='kind'):
+        decode_command(command.encode(), [wire.pack_replica(9)])
+
+    with pytest.raises(ValueError, match='cut short'):
+        wire.unpack_replica(command.data_frames()[0][:-1])
+
+    with pytest.raises(ValueError, match='tree nodes'):
+        wire.unpack_replica(wire.pack_replica(TREE, nodes=[(1, 5)])[:-1])
+
+
+def test_wide_digests():
+    digest = 2 ** 160 - 1
+    command = FindSuccessorCommand(initiator=RoutingInfo(digest, digest, 'tcp://127.0.0.1:5555'),
+                                   recipient=RoutingInfo(digest, digest, 'tcp://127.0.0.1:5555'),
+                                   search_digest=digest)
+    assert decode_command(command.encode()).search_digest == digest
+
+
+def test_invalid_messages():
+    # node.py raises the WireError of its own copy of the wire module, so match the base class
+    message = NotifyCommand(initiator=RoutingInfo(10, 10, 'tcp://127.0.0.1:5555')).encode()
+
+    with pytest.raises(ValueError, match='header'):
+        decode_command(message[:wire.HEADER.size - 1])
+
+    with pytest.raises(ValueError, match='version'):
+        decode_command(bytes([wire.VERSION + 1]) + message[1:])
+
+    with pytest.raises(ValueError, match='Unknown command type'):
+        decode_command(wire.pack_header(99))
+
+    with pytest.raises(ValueError, match='routing infos'):
+        decode_command(wire.pack_header(NotifyCommand.WIRE_TYPE) + wire.pack_routing_info(None))
+
+    with pytest.raises(ValueError, match='cut short'):
+        decode_command(message[:-1])
+
+    with pytest.raises(ValueError, match='cut short'):
+        decode_command(message + b'\x01')